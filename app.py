@@ -1,7 +1,28 @@
+import time
+SCRIPT_STARTED_AT = time.perf_counter()  # начало запуска скрипта; в первом запуске процесса сюда входит импорт модулей
 import streamlit as st
 import pandas as pd
 import numpy as np
-import io # Для работы с байтовыми потоками Excel
+import os
+import collections.abc
+import typing
+from nwc_backtest import backtest_pairs, run_backtest
+from nwc_demo import get_demo_data, template_excel_bytes
+from nwc_cache import dataframe_content_hash, get_default_cache, make_key
+from nwc_analysis import (calculate_allowed_article_error_range, calculate_forecast_deviations, calculate_materiality,
+                          build_period_index, calculate_period_totals, classify_period_columns, load_articles_cached,
+                          period_totals_frame)
+from nwc_export import EXPORT_FORMATS, export_to_tempfile, read_export_file, remove_export_file
+from nwc_display import show_table
+from nwc_dtypes import VALUE_PRECISIONS, compact_articles, total_error_bound
+from nwc_hierarchy import RollupTree, hierarchy_levels, node_label
+from nwc_io import SUPPORTED_EXTENSIONS
+from nwc_modulator import ERROR_COLUMN, ErrorModulator
+from nwc_montecarlo import DISTRIBUTION_LABELS, DISTRIBUTIONS, MC_MAX_WORKERS, estimate_error_sigmas, simulate_chok_deviation
+from nwc_profiling import configure_perf_log, new_session_id, profiled_entry, profiled_run, script_run_name, stage
+from nwc_sensitivity import ALLOCATION_METHODS, build_sensitivity_surface, materiality_weights, tornado_chart_spec, tornado_frame
+from nwc_store import get_dataset_store
+from nwc_tasks import TASK_STATUS_LABELS, get_task_manager
 
 # --- Информация о шаблоне Excel ---
 EXCEL_TEMPLATE_INFO_UPDATED = """
@@ -19,7 +40,7 @@ EXCEL_TEMPLATE_INFO_UPDATED = """
             * **`КО`** (для Краткосрочных Обязательств)
 
 2.  **Столбцы с данными по периодам (начиная со столбца C):**
-    * **Названия столбцов:** Вы можете называть их так, как вам удобно для обозначения периода (например, "Янв 2024", "Месяц 1", "Квартал 1 2023"). Приложение не анализирует саму дату из названия, а ориентируется на ключевые слова.
+    * **Названия столбцов:** Вы можете называть их так, как вам удобно для обозначения периода (например, "Янв 2024", "Месяц 1", "Квартал 1 2023"). Тип данных определяется по ключевым словам, а период (месяц вида «Янв 2024» или «2024-01», квартал «Q1 2024» или «1 кв. 2024», год «2024») распознается из названия для упорядочивания по времени; нераспознанные названия идут после распознанных в исходном порядке.
     * **Ключевые слова для автоматического определения типа данных (важно!):**
         * Чтобы столбец был распознан как **фактические данные**, его название должно содержать слово **`Факт`** (без учета регистра, например, "Янв 2024 Факт", "факт за январь", "Q1 Факт").
         * Чтобы столбец был распознан как **прогнозные данные**, его название должно содержать слово **`Прогноз`** (без учета регистра, например, "Янв 2025 Прогноз", "прогноз на январь", "Q1 Прогноз").
@@ -30,7 +51,13 @@ EXCEL_TEMPLATE_INFO_UPDATED = """
     * **Минимум:** Для полноценной работы всех функций анализа рекомендуется иметь хотя бы **один столбец с фактическими данными** и **один столбец с прогнозными данными**.
     * **Максимум:** Приложение теоретически не накладывает жестких ограничений. Однако, очень большое количество столбцов может замедлить обработку.
 
-4.  **Прочее:**
+4.  **Группа компаний (необязательно):**
+    * Столбцы **`Сегмент`** и/или **`Юрлицо`** задают иерархию: итоги ОА, КО и ЧОК считаются для каждого юрлица, сегмента и группы в целом, а уровень анализа выбирается в боковой панели.
+    * Вместо столбца `Юрлицо` можно разместить данные каждого юрлица на отдельном листе одинаковой структуры и включить опцию «Каждый лист Excel — отдельное юрлицо».
+
+5.  **Длинный формат (CSV/Parquet):** вместо столбцов по периодам можно загрузить выгрузку со столбцами `Статья`, `Тип`, `Период`, `Сценарий` (`Факт`/`Прогноз`), `Значение` (и необязательно `Сегмент`, `Юрлицо`) — она будет развернута автоматически.
+
+6.  **Прочее:**
     * Убедитесь, что на листе нет объединенных ячеек в области данных.
     * Данные должны начинаться с первой строки (строка 1 для заголовков, строка 2 для первой статьи ЧОК).
 
@@ -38,222 +65,284 @@ EXCEL_TEMPLATE_INFO_UPDATED = """
 """
 
 # --- 1. ЗАГРУЗКА И ПОДГОТОВКА ДАННЫХ ---
-# ... (все функции get_demo_data, generate_template_excel_bytes, load_external_data, calculate_period_totals без изменений из предыдущей версии)
-def get_demo_data():
-    data = {
-        'Статья': [
-            'Денежные средства (ДС)', 'Дебиторская задолженность (ДЗ)',
-            'Сырье и материалы (СиМ)', 'Незавершенное производство (НЗП)', 'Готовая продукция (ГП)',
-            'Прочие оборотные активы',
-            'Кредиторская задолженность (КЗ)', 'Краткосрочные кредиты и займы',
-            'Налоги (к уплате)', 'Прочие краткосрочные обязательства'
-        ],
-        'Тип': ['ОА', 'ОА', 'ОА', 'ОА', 'ОА', 'ОА', 'КО', 'КО', 'КО', 'КО'],
-        'Q1 2024 Факт': [500, 1200, 300, 200, 400, 50,  700, 400, 50, 150],
-        'Q2 2024 Факт': [550, 1300, 320, 210, 420, 55,  750, 420, 60, 160],
-        'Q3 2024 Факт': [520, 1250, 310, 205, 405, 52,  720, 410, 55, 155],
-        'Q4 2024 Факт': [600, 1400, 350, 230, 450, 60,  800, 450, 70, 170],
-        'Q1 2025 Прогноз': [620, 1450, 360, 240, 460, 65, 820, 460, 75, 175]
-    }
-    return pd.DataFrame(data)
-
-def generate_template_excel_bytes():
-    df_template = get_demo_data()
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df_template.to_excel(writer, sheet_name="Шаблон_ЧОК_Данные", index=False)
-    return output.getvalue()
-
-def load_external_data(uploaded_file):
-    if uploaded_file:
-        try:
-            df = pd.read_excel(uploaded_file, sheet_name=0)
-            if 'Статья' not in df.columns or 'Тип' not in df.columns:
-                st.error("Ошибка: В файле отсутствуют столбцы 'Статья' и/или 'Тип'.")
-                return None
-            if not df['Тип'].isin(['ОА', 'КО']).all():
-                st.error("Ошибка: Столбец 'Тип' может содержать только 'ОА' или 'КО'.")
-                return None
-            data_cols = df.columns.drop(['Статья', 'Тип'])
-            if not data_cols.tolist():
-                 st.error("Ошибка: В файле отсутствуют столбцы с данными по периодам.")
-                 return None
-            for col in data_cols:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-            st.success("Файл успешно загружен!")
-            return df
-        except Exception as e:
-            st.error(f"Ошибка при чтении файла: {e}")
-            return None
-    return None
-
-def calculate_period_totals(df_articles, columns_to_calculate):
-    period_totals_data = {}
-    for col_name in columns_to_calculate:
-        if col_name not in df_articles.columns: continue
-        oa_total = df_articles.loc[df_articles['Тип'] == 'ОА', col_name].sum()
-        co_total = df_articles.loc[df_articles['Тип'] == 'КО', col_name].sum()
-        working_capital = oa_total - co_total
-        period_totals_data[col_name] = {
-            'Итого ОА': oa_total, 'Итого КО': co_total, 'ЧОК': working_capital
-        }
-    return period_totals_data
-
-# --- 2. РАСЧЕТ СУЩЕСТВЕННОСТИ (НЕСКОЛЬКО МЕТОДОВ) ---
-def calculate_materiality(df_articles, period_totals_data, data_columns_list, method="vs_CHOK"):
-    materiality_data = {'Статья': df_articles['Статья'].tolist()}
-    if method == "within_OA_CO":
-        materiality_data['Тип'] = df_articles['Тип'].tolist()
-    for col_name in data_columns_list:
-        if col_name not in df_articles.columns: continue
-        col_materiality = []
-        base_chok = period_totals_data.get(col_name, {}).get('ЧОК', 0)
-        base_total_components = df_articles[col_name].abs().sum() if method == "vs_TotalComponents" else 0
-        base_total_oa = period_totals_data.get(col_name, {}).get('Итого ОА', 0) if method == "within_OA_CO" else 0
-        base_total_co = period_totals_data.get(col_name, {}).get('Итого КО', 0) if method == "within_OA_CO" else 0
-        for _, row in df_articles.iterrows():
-            article_value = row[col_name]
-            base_value_for_calc = 0
-            if method == "vs_CHOK": base_value_for_calc = base_chok
-            elif method == "vs_TotalComponents": base_value_for_calc = base_total_components
-            elif method == "within_OA_CO":
-                if row['Тип'] == 'ОА': base_value_for_calc = base_total_oa
-                elif row['Тип'] == 'КО': base_value_for_calc = base_total_co
-            if pd.isna(article_value) or base_value_for_calc == 0:
-                col_materiality.append(np.nan)
-            else:
-                col_materiality.append((np.abs(article_value) / np.abs(base_value_for_calc)) * 100)
-        materiality_data[f'Сущ-ть ({col_name.split(" ")[0]}) (%)'] = col_materiality
-
-    #  ИЗМЕНЕНО: Формирование названия столбца с годом
-    materiality_data_with_year = {'Статья': df_articles['Статья'].tolist()}
-    for col_name in data_columns_list:
-        materiality_data_with_year[f"Сущ-ть ({col_name.replace(' Факт', '').replace(' Прогноз', '')}) (%)"] = materiality_data.get(f'Сущ-ть ({col_name.split(" ")[0]}) (%)', [])
-    df_result = pd.DataFrame(materiality_data_with_year)
-    if method == "within_OA_CO" and 'Тип' in df_result.columns:
-        df_result = df_result.drop(columns=['Тип'])
-    return df_result
-
-# --- 3. ОТКЛОНЕНИЯ ПРОГНОЗА ---
-def calculate_forecast_deviations(df_articles, period_totals_data, forecast_col_name, base_col_name):
-    # ... (код из предыдущего ответа, он корректен)
-    deviations_data = {'Статья': df_articles['Статья'].tolist()}
-    abs_deviations_list, rel_deviations_list = [], []
-    if base_col_name not in df_articles.columns or forecast_col_name not in df_articles.columns:
-        st.warning(f"Колонки для отклонений ('{base_col_name}'/'{forecast_col_name}') не найдены.")
-        empty_df_articles = pd.DataFrame(deviations_data) 
-        empty_df_summary = pd.DataFrame(columns=['Показатель', 'Прогноз', f'Факт ({base_col_name.split(" ")[0]})', 'Абс. откл.', 'Отн. откл. (%)'])
-        return empty_df_articles, empty_df_summary
-    for _, row in df_articles.iterrows():
-        forecast_value, base_value = row[forecast_col_name], row[base_col_name]
-        if pd.isna(forecast_value) or pd.isna(base_value):
-            abs_dev, rel_dev = np.nan, np.nan
-        else:
-            abs_dev = forecast_value - base_value
-            rel_dev = (abs_dev / base_value) * 100 if base_value != 0 else (np.nan if forecast_value != 0 else 0)
-        abs_deviations_list.append(abs_dev)
-        rel_deviations_list.append(rel_dev)
-    deviations_data[f'Абс. откл. (Прогноз - {base_col_name.split(" ")[0]})'] = abs_deviations_list
-    deviations_data[f'Отн. откл. (Прогноз - {base_col_name.split(" ")[0]}) (%)'] = rel_deviations_list
-    df_deviations_result = pd.DataFrame(deviations_data)  # Corrected: Removed extra space
-    summary_dev_rows = []
-    for indicator in ['Итого ОА', 'Итого КО', 'ЧОК']:
-        prog_data = period_totals_data.get(forecast_col_name, {})
-        base_data = period_totals_data.get(base_col_name, {})
-        prog_val, base_val = prog_data.get(indicator, np.nan), base_data.get(indicator, np.nan)
-        if pd.isna(prog_val) or pd.isna(base_val):
-            abs_d, rel_d = np.nan, np.nan
-        else:
-            abs_d = prog_val - base_val  # Corrected: forecast - fact
-            rel_d = (abs_d / base_val) * 100 if base_val != 0 else (np.nan if prog_val !=0 else 0)
-        summary_dev_rows.append({
-            'Показатель': indicator, 'Прогноз': prog_val, f'Факт ({base_col_name.split(" ")[0]})': base_val,
-            'Абс. откл.': abs_d, 'Отн. откл. (%)': rel_d
-        })  # Corrected: Removed extra space
-    return df_deviations_result, pd.DataFrame(summary_dev_rows)
-
-# --- 4. ДОПУСТИМЫЙ ДИАПАЗОН ОШИБКИ ПРОГНОЗА СТАТЬИ ---
-def calculate_allowed_article_error_range(df_articles, forecast_col_name, forecast_chok_value, wc_deviation_perc_limit=5):
-    # ... (код из предыдущего ответа, он корректен)
-    if forecast_col_name not in df_articles.columns:
-        st.warning(f"Прогнозная колонка '{forecast_col_name}' отсутствует.")
-        return pd.DataFrame({'Статья': df_articles['Статья'].tolist()}), np.nan
-    if pd.isna(forecast_chok_value):
-        st.warning("Прогнозный ЧОК не определен, анализ чувствительности невозможен.")
-        return pd.DataFrame({'Статья': df_articles['Статья'].tolist()}), np.nan
-    max_abs_wc_deviation_allowed = np.abs(forecast_chok_value * (wc_deviation_perc_limit / 100.0))
-    allowed_error_ranges_data = {'Статья': df_articles['Статья'].tolist()}
-    error_range_percentages = []
-    for _, row in df_articles.iterrows():
-        forecast_article_value = row[forecast_col_name]
-        if pd.isna(forecast_article_value) or forecast_article_value == 0:
-            err_range_perc = np.inf
-        else:
-            err_range_perc = (max_abs_wc_deviation_allowed / np.abs(forecast_article_value)) * 100
-        error_range_percentages.append(err_range_perc)
-    allowed_error_ranges_data[f'Макс. ошибка статьи (+/- %) для откл. ЧОК до {wc_deviation_perc_limit}%'] = error_range_percentages
-    return pd.DataFrame(allowed_error_ranges_data), max_abs_wc_deviation_allowed
-
-# --- 5. ФУНКЦИЯ ВЫГРУЗКИ В EXCEL ---
-def dfs_to_excel_bytes(dfs_dict):
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        for sheet_name, df_data in dfs_dict.items():
-            if df_data is not None and isinstance(df_data, pd.DataFrame) and not df_data.empty:
-                # Сокращаем имя листа, если оно слишком длинное
-                safe_sheet_name = sheet_name[:31]
-                index_val = True 
-                if safe_sheet_name.startswith("Данные_статьи") or \
-                   safe_sheet_name.startswith("Сущ_") or \
-                   safe_sheet_name.startswith("Отклонения_статьи") or \
-                   safe_sheet_name.startswith("Допустимые_ошибки"):
-                    index_val = False
-                df_data.to_excel(writer, sheet_name=safe_sheet_name, index=index_val)
-    return output.getvalue()  # Corrected: Removed extra space
+# Демо-таблица и шаблон Excel строятся один раз на процесс (nwc_demo)
+def load_external_data(task, data, file_name, sheets_as_entities=False):
+    # Фоновая задача (без вызовов st.*): возвращает (таблица или None, хэш содержимого файла, сообщения).
+    # Файлы, уже загруженные другой сессией или разобранные ранее, берутся из общего хранилища или Parquet-кэша
+    task.report(0.1, "разбор файла")
+    diagnostics = []
+    df, file_hash = load_articles_cached(data, diagnostics, file_name, parsed_cache=get_dataset_store(),
+                                         sheets_as_entities=sheets_as_entities)
+    return df, file_hash, diagnostics
+
+# Отложенная выдача: данные кнопки скачивания - функция, вызываемая по нажатию (новые версии Streamlit);
+# содержимое раскрывающегося блока отправляется в браузер, только когда блок открыт
+def accepts_callable_data():
+    # Поддержка определяется по аннотации параметра data (Callable среди допустимых типов), а не по тексту справки
+    try:
+        data_type = typing.get_type_hints(st.download_button).get('data')
+    except Exception:
+        return False
+    return any(typing.get_origin(arg) is collections.abc.Callable for arg in typing.get_args(data_type))
+
+LAZY_DOWNLOADS = accepts_callable_data()
+
+def lazy_expander(container, label, key, render):
+    try:
+        expander = container.expander(label, expanded=False, key=key, on_change="rerun")
+    except TypeError:  # expander без отслеживания состояния: содержимое выводится всегда
+        expander = container.expander(label, expanded=False)
+    with expander:
+        if getattr(expander, "open", None) is not False:
+            render()
+
+def show_diagnostics(diagnostics):
+    # Сообщения расчетного модуля nwc_analysis выводятся в интерфейс здесь
+    for diagnostic in diagnostics:
+        {"error": st.error, "warning": st.warning, "info": st.info}[diagnostic.level](diagnostic.message)
+
+# --- КЭШ ВЫЧИСЛЕНИЙ ---
+# Таблицы статей лежат в общем хранилище процесса (nwc_store), сессия держит только ссылку на набор
+DEMO_DATASET_KEY = "demo"
+
+def set_main_articles(df, data_source, content_hash=None):
+    set_main_dataset(content_hash or dataframe_content_hash(df), data_source, lambda: df)
+
+def set_main_dataset(key, data_source, build=None):
+    previous_handle = st.session_state.get('dataset_handle')
+    st.session_state.dataset_handle = get_dataset_store().open(key, build)
+    if previous_handle is not None:
+        previous_handle.release()
+    st.session_state.df_main_hash = key
+    st.session_state.pop('mc_result', None)  # результат Монте-Карло относится к прежнему набору данных
+    st.session_state.data_source = data_source
+
+def use_demo_data():
+    # Демо-таблица строится один раз на процесс, а не в каждой сессии
+    set_main_dataset(DEMO_DATASET_KEY, "демо", lambda: compact_articles(get_demo_data()))
+
+def current_data_key():
+    # Данные, по которым идут расчеты: загруженная таблица + выбранный узел иерархии (для группы компаний)
+    return make_key(st.session_state.get('df_main_hash'), st.session_state.get('hierarchy_node_selected', ()))
+
+def cached(func_name, params, compute):
+    # Ключ: хэш текущих данных (с узлом иерархии) + настройки, от которых зависит результат функции.
+    # compute(diagnostics) - сообщения кэшируются вместе с результатом и выводятся при каждом запуске.
+    key = make_key(current_data_key(), params)
+    def compute_with_diagnostics():
+        diagnostics = []
+        return compute(diagnostics), diagnostics
+    value, diagnostics = get_default_cache().get_or_compute(func_name, key, compute_with_diagnostics)
+    show_diagnostics(diagnostics)
+    return value
+
+# --- ФОНОВЫЕ ЗАДАЧИ ---
+# Задача сессии хранится в st.session_state["task_<slot>"]; новая задача в том же слоте отменяет прежнюю.
+# Пока задача выполняется, фрагмент render_task_progress раз в TASK_POLL_SECONDS обновляет прогресс,
+# а по завершении перезапускает страницу, и поток скрипта забирает результат (finished_task).
+TASK_POLL_SECONDS = 0.5
+
+def start_task(slot, name, func, *args):
+    previous_task = st.session_state.get(f"task_{slot}")
+    if previous_task is not None and not previous_task.done:
+        previous_task.cancel()
+    st.session_state[f"task_{slot}"] = get_task_manager().submit(name, func, args, session_id=st.session_state.get('perf_session_id'))
+
+def finished_task(slot):
+    # Завершенная задача слота (один раз, с любым статусом: done / error / cancelled) или None;
+    # ошибки и отмена выводятся здесь, результат есть только у задачи со статусом done
+    task = st.session_state.get(f"task_{slot}")
+    if task is None or not task.done:
+        return None
+    del st.session_state[f"task_{slot}"]
+    if task.status == "error":
+        st.error(f"{task.name}: {task.error}")
+    elif task.status == "cancelled":
+        st.info(f"{task.name}: отменено.")
+    return task
+
+# В кэше и в сессии хранится только сводка (квантили, гистограмма, вклады статей), а не массивы сценариев
+def run_monte_carlo(task, cache_key, mc_params, df_articles, forecast_chok_value, sigmas, n_workers):
+    forecast_col_name, limit_percentage, n_scenarios, distribution, _, _, seed = mc_params
+    progress_message = f"{n_scenarios:,} сценариев".replace(",", " ")
+    mc_result = get_default_cache().get_or_compute('simulate_chok_deviation', cache_key, lambda: simulate_chok_deviation(
+        df_articles, forecast_col_name, forecast_chok_value, sigmas, limit_percentage, n_scenarios, distribution, seed=seed,
+        n_workers=n_workers, progress=lambda fraction: task.report(fraction, progress_message)).summary())
+    return cache_key, mc_result
+
+def run_export(task, dfs_for_export, export_format, export_settings):
+    return export_to_tempfile(dfs_for_export, export_format, progress=task.report), export_settings, export_format
+
+polling_fragment = st.fragment(run_every=TASK_POLL_SECONDS) if hasattr(st, "fragment") else (lambda func: func)
+
+def render_task_progress(slot):
+    # Фрагмент выводится (и опрашивает задачу) только пока в слоте есть задача
+    if st.session_state.get(f"task_{slot}") is not None:
+        task_progress_fragment(slot)
+
+@polling_fragment
+def task_progress_fragment(slot):
+    task = st.session_state.get(f"task_{slot}")
+    if task is None or task.done:
+        st.rerun()
+    progress_col, cancel_col = st.columns([4, 1])
+    status = TASK_STATUS_LABELS[task.status] if task.status != "running" else f"{task.progress * 100:.0f}%"
+    progress_col.progress(task.progress, text=f"{task.name}: {status}{f' — {task.message}' if task.message else ''} ({task.elapsed():.0f} с)")
+    if cancel_col.button("Отменить", key=f"task_cancel_{slot}", disabled=task.cancel_requested):
+        task.cancel()
+
+# --- 4.1. МОДУЛЯТОР ОШИБОК ---
+# Фрагмент перезапускается отдельно от страницы: правка ячейки в редакторе не пересчитывает разделы 1-4.
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
+@fragment
+@profiled_entry("fragment:4.1")
+def render_error_modulator(df_main_articles, forecast_col_name, forecasted_chok_value, chok_deviation_limit_percentage):
+    st.markdown(f"Базовый прогнозный ЧОК: **{forecasted_chok_value:.0f} тыс. руб.** (для периода {forecast_col_name})")
+    modulator_key = (current_data_key(), forecast_col_name)
+    modulator = st.session_state.get('error_modulator')
+    if modulator is None or modulator.key != modulator_key:
+        modulator = ErrorModulator(df_main_articles['Статья'], df_main_articles['Тип'], df_main_articles[forecast_col_name], key=modulator_key)
+        st.session_state.error_modulator = modulator
+        st.session_state.error_modulator_version = st.session_state.get('error_modulator_version', 0) + 1
+    editor_key = f"error_modulator_editor_{st.session_state.error_modulator_version}"
+
+    with st.expander("Массовое изменение ошибки по фильтру", expanded=False):
+        bulk_col1, bulk_col2, bulk_col3 = st.columns(3)
+        bulk_type = bulk_col1.selectbox("Тип статей:", options=["", "ОА", "КО"], format_func=lambda x: x or "Все", key="modulator_bulk_type")
+        bulk_name = bulk_col2.text_input("Название содержит:", key="modulator_bulk_name")
+        bulk_error = bulk_col3.number_input("Ошибка (%):", min_value=-100.0, max_value=100.0, value=0.0, step=0.1, key="modulator_bulk_error")
+        if st.button("Применить к отобранным статьям", key="modulator_bulk_apply"):
+            # Текущие правки редактора сохраняются, затем таблица редактора строится заново с новыми ошибками
+            modulator.apply_editor_edits(st.session_state.get(editor_key, {}).get("edited_rows", {}))
+            changed = modulator.bulk_set(bulk_error, modulator.article_mask(bulk_type or None, bulk_name or None))
+            modulator.commit_baseline()
+            st.session_state.error_modulator_version += 1
+            editor_key = f"error_modulator_editor_{st.session_state.error_modulator_version}"
+            st.caption(f"Изменено статей: {changed}")
+
+    st.data_editor(modulator.editor_frame(), column_config={ERROR_COLUMN: st.column_config.NumberColumn(min_value=-100.0, max_value=100.0, step=0.1, format="%.1f")},
+                   disabled=['Статья', 'Тип', 'Прогноз'], hide_index=True, use_container_width=True, key=editor_key)
+    # Применяются только изменившиеся строки; отклонение ЧОК обновляется на их разницу
+    modulator.apply_editor_edits(st.session_state.get(editor_key, {}).get("edited_rows", {}))
+    chok_deviation = modulator.chok_deviation
+    modified_chok = forecasted_chok_value + chok_deviation
+    chok_deviation_percentage = modulator.deviation_percentage(forecasted_chok_value)
+
+    st.subheader("Результат моделирования:")
+    show_table(modulator.result_frame(), {'Прогноз': "{:.0f}", 'С учетом ошибки': "{:.0f}", ERROR_COLUMN: "{:.1f}%"}, key="table_modulator_result",
+               top_n_column=ERROR_COLUMN)
+    st.metric(label="Изменение ЧОК", value=f"{modified_chok:.0f} тыс. руб.", delta=f"{chok_deviation:.0f} тыс. руб. ({chok_deviation_percentage:.2f}%)")
+
+    if abs(chok_deviation_percentage) > chok_deviation_limit_percentage:
+        st.warning(f"Превышение допустимого отклонения ЧОК ({chok_deviation_limit_percentage}%).")
+    else:
+        st.success("Отклонение ЧОК в пределах допустимого.")
+
+# --- ДИАГНОСТИКА ПРОИЗВОДИТЕЛЬНОСТИ ---
+# Скрытая панель: открывается по адресу с параметром ?diagnostics=1 или при NWC_DIAGNOSTICS=1
+def diagnostics_enabled():
+    return st.query_params.get("diagnostics") == "1" or os.environ.get("NWC_DIAGNOSTICS") == "1"
+
+def render_diagnostics_panel(profiler):
+    with st.sidebar.expander("Диагностика производительности", expanded=True):
+        st.checkbox("Замерять пик памяти (tracemalloc, со следующего запуска)", key="perf_trace_memory")
+        budget = f" (бюджет {profiler.budget_ms:.0f} мс)" if profiler.budget_ms is not None else ""
+        st.caption(f"Сессия {profiler.session_id}, {'холодный старт' if profiler.run_name == 'startup' else 'запуск'}: {profiler.total_ms:.0f} мс{budget}")
+        if profiler.over_budget:
+            st.warning("Время запуска превышает бюджет (NWC_STARTUP_BUDGET_MS / NWC_RERUN_BUDGET_MS).")
+        df_spans = pd.DataFrame([{'Этап': "\u00a0\u00a0" * span['depth'] + span['name'], 'мс': span['ms'], 'Пик памяти (МБ)': span['peak_mb']}
+                                 for span in profiler.spans])
+        if not df_spans.empty:
+            st.dataframe(df_spans.style.format({'мс': "{:.1f}", 'Пик памяти (МБ)': "{:.2f}"}, na_rep="—"), hide_index=True, use_container_width=True)
+        cache_stats = get_default_cache().stats()
+        st.caption(f"Кэш вычислений: попаданий {cache_stats['hits']}, промахов {cache_stats['misses']}, записей {sum(cache_stats['entries'].values())}")
+        store_stats = get_dataset_store().stats()
+        st.caption(f"Хранилище данных: наборов {store_stats['datasets']} (в памяти {store_stats['in_memory']}, ссылок {store_stats['references']}), "
+                   f"{store_stats['memory_mb']:.1f} из {store_stats['budget_mb']:.0f} МБ, вытеснений {store_stats['evictions']}")
+        task_stats = get_task_manager().stats()
+        st.caption(f"Фоновые задачи: выполняется {task_stats['running']} из {task_stats['workers']}, в очереди {task_stats['queued']}")
 
 # --- STREAMLIT APP ---
 def main():
     st.set_page_config(layout="wide", page_title="Расширенный Анализ ЧОК")
+    configure_perf_log()
+    if 'perf_session_id' not in st.session_state:
+        st.session_state.perf_session_id = new_session_id()
+    # Каждый запуск скрипта - один профиль: этапы страницы и вызовы расчетных функций, JSON-строка в журнал NWC_PERF_LOG
+    # Отсчет - с начала выполнения скрипта: в первом запуске процесса (startup) сюда входит импорт модулей
+    with profiled_run(script_run_name(), st.session_state.perf_session_id, st.session_state.get('perf_trace_memory', False),
+                      started_at=SCRIPT_STARTED_AT) as profiler:
+        render_page()
+    if diagnostics_enabled():
+        render_diagnostics_panel(profiler)
+
+def render_page():
+    stage("data")
     st.title("Расширенный Анализ Чистого Оборотного Капитала (ЧОК)")
     st.markdown("Этот инструмент предназначен для анализа структуры ЧОК, оценки точности прогнозов и выявления статей, оказывающих наибольшее влияние на итоговый ЧОК. Используйте боковую панель для загрузки данных и настройки параметров анализа.")
 
-    if 'df_main_articles' not in st.session_state:
-        st.session_state.df_main_articles = get_demo_data()
-        st.session_state.data_source = "демо"
+    if 'dataset_handle' not in st.session_state:
+        use_demo_data()
 
     st.sidebar.header("Управление данными")
-    uploaded_file = st.sidebar.file_uploader("Загрузить Excel (см. шаблон ниже)", type=["xlsx", "xls"], key="file_uploader")
+    uploaded_file = st.sidebar.file_uploader("Загрузить Excel, CSV или Parquet (см. шаблон ниже)", type=[ext.lstrip(".") for ext in SUPPORTED_EXTENSIONS],
+                                             key="file_uploader")
+    sheets_as_entities = st.sidebar.checkbox("Каждый лист Excel — отдельное юрлицо", key="sheets_as_entities",
+                                             help="Листы книги объединяются, имя листа записывается в столбец «Юрлицо».")
     col1, col2 = st.sidebar.columns(2)  # Corrected: Removed extra space
     if col1.button("Использ. демо-данные", key="use_demo_data_btn", use_container_width=True): # Сократил название кнопки
-        st.session_state.df_main_articles = get_demo_data()
-        st.session_state.data_source = "демо"
+        use_demo_data()
         st.rerun()
-    template_bytes = generate_template_excel_bytes()
-    col2.download_button(label="Скачать шаблон", data=template_bytes, file_name="ЧОК_анализ_шаблон_данных.xlsx",
+    # Книга шаблона формируется по нажатию (функция вместо байтов), если Streamlit это поддерживает
+    col2.download_button(label="Скачать шаблон", data=template_excel_bytes if LAZY_DOWNLOADS else template_excel_bytes(), file_name="ЧОК_анализ_шаблон_данных.xlsx",
                          mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", key="download_template_btn", use_container_width=True)
 
     if uploaded_file:
-        current_file_id = f"{uploaded_file.name}_{uploaded_file.size}"
+        # Файл читается один раз на загрузку (в фоновой задаче); повторно загруженный файл с тем же содержимым не разбирается заново
+        current_file_id = (getattr(uploaded_file, 'file_id', None) or f"{uploaded_file.name}_{uploaded_file.size}", sheets_as_entities)
         if st.session_state.get('last_uploaded_file_id') != current_file_id:
-            df_custom = load_external_data(uploaded_file)
-            if df_custom is not None:
-                st.session_state.df_main_articles = df_custom
-                st.session_state.data_source = "загруженный файл"
-                st.session_state.last_uploaded_file_id = current_file_id
+            st.session_state.last_uploaded_file_id = current_file_id
+            start_task("upload", "Загрузка файла", load_external_data, uploaded_file.getvalue(), uploaded_file.name, sheets_as_entities)
+    upload_task = finished_task("upload")
+    if upload_task is not None:
+        df_custom, file_hash, upload_diagnostics = upload_task.result if upload_task.status == "done" else (None, None, [])
+        show_diagnostics(upload_diagnostics)
+        if df_custom is not None:
+            st.success("Файл успешно загружен!")
+            if file_hash != st.session_state.get('df_main_hash'):
+                set_main_articles(df_custom, "загруженный файл", file_hash)
                 st.rerun()
-            else:
-                st.session_state.last_uploaded_file_id = None
-    df_main_articles = st.session_state.df_main_articles
+        else:
+            # Файл не прочитан (ошибка, отмена или пустой результат) - его можно загрузить снова
+            st.session_state.last_uploaded_file_id = None
+    with st.sidebar:
+        render_task_progress("upload")
+    df_main_articles = st.session_state.dataset_handle.frame()
     st.sidebar.caption(f"Источник данных: {st.session_state.data_source}")
-    with st.sidebar.expander("Инструкция и формат шаблона Excel", expanded=False):
-        st.markdown(EXCEL_TEMPLATE_INFO_UPDATED)
+    lazy_expander(st.sidebar, "Инструкция и формат шаблона Excel", "template_info_expander", lambda: st.markdown(EXCEL_TEMPLATE_INFO_UPDATED))
 
-    available_cols = df_main_articles.columns.drop(['Статья', 'Тип']).tolist()
-    fact_actual_columns_all = [col for col in available_cols if "факт" in col.lower()]
-    forecast_actual_columns_available = [col for col in available_cols if "прогноз" in col.lower()]
+    # Заголовки периодов разбираются один раз на набор данных; списки периодов - в хронологическом порядке
+    period_index = get_default_cache().get_or_compute('build_period_index', make_key(st.session_state.get('df_main_hash')),
+                                                      lambda: build_period_index(df_main_articles))
+    fact_actual_columns_all, forecast_actual_columns_available = classify_period_columns(df_main_articles, period_index)
 
+    stage("settings")
     st.sidebar.header("Настройки анализа")
-    selected_fact_columns = st.sidebar.multiselect("Фактические периоды для анализа:", options=fact_actual_columns_all, default=fact_actual_columns_all)
+    # Группа компаний: итоги всех узлов считаются один раз на набор данных, выбор узла - поиск готовых итогов
+    rollup_tree, hierarchy_node = None, ()
+    if hierarchy_levels(df_main_articles):
+        rollup_tree = get_default_cache().get_or_compute(
+            'RollupTree', make_key(st.session_state.get('df_main_hash')),
+            lambda: RollupTree(df_main_articles, fact_actual_columns_all + forecast_actual_columns_available))
+        hierarchy_node = st.sidebar.selectbox("Уровень консолидации:", options=rollup_tree.nodes(), key="hierarchy_node",
+                                              format_func=lambda node: "\u00a0\u00a0\u00a0" * len(node) + node_label(node))
+        df_main_articles = rollup_tree.articles(hierarchy_node)
+    st.session_state.hierarchy_node_selected = hierarchy_node
+    fact_range_months = st.sidebar.selectbox("Диапазон фактических периодов:", options=[0, 12, 24, 36, 60], key="fact_range_months",
+                                             format_func=lambda months: f"Последние {months} мес." if months else "Все периоды")
+    default_fact_columns = period_index.last_facts(fact_range_months) if fact_range_months else fact_actual_columns_all
+    selected_fact_columns = st.sidebar.multiselect("Фактические периоды для анализа:", options=fact_actual_columns_all, default=default_fact_columns)
     base_for_deviation_analysis = st.sidebar.selectbox("Базовый факт. период для сравнения:", options=fact_actual_columns_all,
                                                        index=len(fact_actual_columns_all)-1 if fact_actual_columns_all else 0, disabled=not fact_actual_columns_all)
     forecast_actual_column_selected = st.sidebar.selectbox("Прогнозный период для анализа:", options=forecast_actual_columns_available,
@@ -267,10 +356,16 @@ def main():
         key="materiality_method_selector"
     )
 
-    active_value_columns = sorted(list(set(selected_fact_columns + ([forecast_actual_column_selected] if forecast_actual_column_selected else []))))
+    active_value_columns = period_index.ordered(selected_fact_columns + ([forecast_actual_column_selected] if forecast_actual_column_selected else []))
     active_value_columns = [col for col in active_value_columns if col in df_main_articles.columns]
-    all_period_totals = calculate_period_totals(df_main_articles, active_value_columns)
-
+    stage("totals")
+    def period_totals(columns):
+        return cached('calculate_period_totals', columns,
+                      lambda diagnostics: calculate_period_totals(df_main_articles, columns) if rollup_tree is None
+                      else rollup_tree.period_totals(hierarchy_node, columns))
+    all_period_totals = period_totals(active_value_columns)
+
+    stage("section 1")
     st.header("1. Данные по статьям и итоги ЧОК (тыс. руб.)")
     # ... (код отображения Раздела 1 с подробными пояснениями из предыдущего ответа) ...
     st.markdown("""
@@ -283,22 +378,33 @@ def main():
     - **Итого КО:** Общая сумма всех краткосрочных обязательств.
     - **ЧОК (Чистый Оборотный Капитал):** Рассчитывается как `Итого ОА - Итого КО`. Это ключевой показатель, отражающий способность компании финансировать свою текущую операционную деятельность и выполнять краткосрочные обязательства. Положительный ЧОК обычно указывает на наличие достаточных краткосрочных активов для покрытия краткосрочных обязательств.
     """)
-    df_main_for_export, df_totals_for_export = pd.DataFrame(), pd.DataFrame()
+    df_main_for_export, df_totals_for_export, df_hierarchy_for_export = pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
     if active_value_columns:
         common_formatters = {col: "{:.0f}" for col in active_value_columns}
         st.subheader("Детализация по статьям:")
         cols_to_show_main = ['Статья', 'Тип'] + active_value_columns
         df_main_for_export = df_main_articles[cols_to_show_main]
-        st.dataframe(df_main_for_export.style.format(common_formatters))
+        show_table(df_main_for_export, common_formatters, key="table_articles")
 
         st.subheader("Итоги по периодам (ОА, КО, ЧОК):")
-        totals_display_rows = [{'Показатель': name, **{col: all_period_totals.get(col, {}).get(name, np.nan) for col in active_value_columns}}
-                               for name in ['Итого ОА', 'Итого КО', 'ЧОК']]
-        df_totals_for_export = pd.DataFrame(totals_display_rows).set_index('Показатель')
-        st.dataframe(df_totals_for_export.style.format(common_formatters))
+        df_totals_for_export = period_totals_frame(all_period_totals, active_value_columns)
+        show_table(df_totals_for_export, common_formatters, key="table_totals")
+        value_precision = st.session_state.dataset_handle.frame().attrs.get('value_precision', "float64")
+        if value_precision != "float64":
+            # Точность хранения задается NWC_VALUE_PRECISION; граница ошибки - см. nwc_dtypes
+            chok_error_bound = total_error_bound(df_main_articles, active_value_columns, value_precision)
+            st.caption(f"Значения хранятся с точностью «{VALUE_PRECISIONS[value_precision]}»: погрешность итогов не более "
+                       f"{np.max(chok_error_bound, initial=0.0):.2f} тыс. руб.")
+        if rollup_tree is not None:
+            hierarchy_column = forecast_actual_column_selected or active_value_columns[-1]
+            st.subheader(f"Итоги по уровням иерархии ({hierarchy_column}):")
+            df_hierarchy_for_export = rollup_tree.totals_frame(hierarchy_column)
+            show_table(df_hierarchy_for_export, {col: "{:.0f}" for col in ['Итого ОА', 'Итого КО', 'ЧОК']}, key="table_hierarchy",
+                       hide_index=True, top_n_column='ЧОК')
     else:
         st.info("Выберите периоды для отображения в боковой панели.")
 
+    stage("section 2")
     st.header(f"2. Анализ существенности статей ЧОК")
     st.markdown("""
     **Для чего нужен анализ существенности, если есть анализ допустимых ошибок (Раздел 4)?**
@@ -323,13 +429,16 @@ def main():
 
     df_materiality_calculated = pd.DataFrame()
     if selected_fact_columns:
-        df_materiality_calculated = calculate_materiality(df_main_articles, all_period_totals, selected_fact_columns, materiality_method_key)
+        df_materiality_calculated = cached('calculate_materiality', (selected_fact_columns, materiality_method_key),
+                                           lambda diagnostics: calculate_materiality(df_main_articles, all_period_totals, selected_fact_columns, materiality_method_key))
         if not df_materiality_calculated.empty:
             materiality_format = {col: "{:.2f}%" for col in df_materiality_calculated.columns if 'Сущ-ть' in col}
-            st.dataframe(df_materiality_calculated.style.format(materiality_format))
+            show_table(df_materiality_calculated, materiality_format, key="table_materiality",
+                       top_n_column=next(iter(materiality_format), None))
     else:
         st.info("Выберите фактические периоды для расчета существенности.")
 
+    stage("section 3")
     st.header(f"3. Анализ точности прогноза")
     # ... (код Раздела 3 с подробными пояснениями из предыдущего ответа) ...
     st.markdown("""
@@ -343,14 +452,17 @@ def main():
        forecast_actual_column_selected in df_main_articles.columns and \
        base_for_deviation_analysis in df_main_articles.columns:
         st.markdown(f"Сравнение прогноза **{forecast_actual_column_selected}** с фактом **{base_for_deviation_analysis}**")
-        df_article_deviations, df_summary_indicator_deviations = calculate_forecast_deviations(
-            df_main_articles, all_period_totals, forecast_actual_column_selected, base_for_deviation_analysis
+        df_article_deviations, df_summary_indicator_deviations = cached(
+            'calculate_forecast_deviations', (forecast_actual_column_selected, base_for_deviation_analysis),
+            lambda diagnostics: calculate_forecast_deviations(df_main_articles, all_period_totals, forecast_actual_column_selected,
+                                                              base_for_deviation_analysis, diagnostics)
         )
         st.subheader("Отклонения прогноза по статьям:")
         if not df_article_deviations.empty:
             dev_art_fmt = {c: "{:.0f}" for c in df_article_deviations.columns if 'Абс.' in c}
             dev_art_fmt.update({c: "{:.2f}%" for c in df_article_deviations.columns if 'Отн.' in c})
-            st.dataframe(df_article_deviations.style.format(dev_art_fmt))
+            show_table(df_article_deviations, dev_art_fmt, key="table_deviations",
+                       top_n_column=next((c for c in df_article_deviations.columns if 'Абс.' in c), None))
         st.subheader("Отклонения прогноза по итоговым показателям:")
         if not df_summary_indicator_deviations.empty:
             dev_sum_fmt = {'Прогноз': "{:.0f}", f'Факт ({base_for_deviation_analysis.split(" ")[0]})': "{:.0f}",
@@ -359,14 +471,53 @@ def main():
     else:
         st.info("Выберите корректный прогнозный и базовый фактический период для анализа отклонений.")
 
+    stage("section 3.1")
+    st.header("3.1. Бэктестинг: все прогнозы против фактов тех же периодов")
+    st.markdown(f"""
+    Раздел 3 сравнивает один прогноз с одним фактом. Здесь за один расчет сравниваются **все** прогнозные периоды, для которых в данных есть факт того же периода.
+    - **MAPE (%):** средняя абсолютная ошибка прогноза статьи в % от факта; **Смещение:** средняя ошибка со знаком (`Прогноз - Факт`) — систематическое завышение (>0) или занижение (<0).
+    - **RMSE:** среднеквадратичная ошибка в тыс. руб. (чувствительна к крупным промахам).
+    - **Доля попаданий в лимит (%):** доля периодов, в которых ошибка одной этой статьи не выводит ЧОК за лимит **+/- {chok_deviation_limit_percentage}%** от прогнозного ЧОК периода.
+    """)
+    backtest_result = None
+    backtest_pair_list = backtest_pairs(fact_actual_columns_all, forecast_actual_columns_available, period_index)
+    if backtest_pair_list:
+        backtest_result = cached('run_backtest', (backtest_pair_list, chok_deviation_limit_percentage),
+                                 lambda diagnostics: run_backtest(df_main_articles, backtest_pair_list, chok_deviation_limit_percentage))
+        bt_col1, bt_col2, bt_col3 = st.columns(3)
+        bt_col1.metric("Пар прогноз/факт", len(backtest_pair_list))
+        bt_col2.metric("ЧОК в пределах лимита", f"{backtest_result.periods['ЧОК в пределах лимита'].mean() * 100:.0f}% периодов")
+        bt_col3.metric("Средняя |откл.| ЧОК", f"{backtest_result.periods['Абс. откл. ЧОК'].abs().mean():.0f} тыс. руб.")
+        st.subheader("Точность прогноза ЧОК по периодам:")
+        show_table(backtest_result.periods, {'ЧОК прогноз': "{:.0f}", 'ЧОК факт': "{:.0f}", 'Абс. откл. ЧОК': "{:.0f}",
+                                             'Отн. откл. ЧОК (%)': "{:.2f}%"}, key="table_backtest_periods", hide_index=True)
+        st.subheader("Точность прогноза по статьям (по всем парам):")
+        show_table(backtest_result.articles, {'MAPE (%)': "{:.2f}%", 'Смещение (%)': "{:.2f}%", 'Смещение (тыс. руб.)': "{:.0f}",
+                                              'RMSE (тыс. руб.)': "{:.0f}", 'Доля попаданий в лимит (%)': "{:.0f}%"},
+                   key="table_backtest_articles", top_n_column='RMSE (тыс. руб.)')
+    else:
+        st.info("В данных нет прогнозов, для которых есть факт того же периода (например, «Янв 2024 Прогноз» и «Янв 2024 Факт»).")
+
+    stage("section 4")
     st.header(f"4. Анализ чувствительности прогноза ЧОК к ошибкам в статьях")
     # ... (код Раздела 4 с подробными пояснениями из предыдущего ответа) ...
-    df_allowed_article_errors = pd.DataFrame()
+    df_allowed_article_errors, df_error_budget, df_sensitivity_limit = pd.DataFrame(), pd.DataFrame(), pd.DataFrame()
     if forecast_actual_column_selected and forecast_actual_column_selected in df_main_articles.columns:
         forecasted_chok_value = all_period_totals.get(forecast_actual_column_selected, {}).get('ЧОК', np.nan)
-        df_allowed_article_errors, max_abs_chok_dev_value = calculate_allowed_article_error_range(
-            df_main_articles, forecast_actual_column_selected, forecasted_chok_value, chok_deviation_limit_percentage
-        )
+        # Допуски по всем прогнозным периодам и лимитам считаются один раз на набор данных (и узел иерархии);
+        # движение ползунка лимита и смена периода - выбор готового среза
+        sensitivity_surface = cached('build_sensitivity_surface', forecast_actual_columns_available, lambda diagnostics: build_sensitivity_surface(
+            df_main_articles, forecast_actual_columns_available,
+            forecast_chok=[period_totals(forecast_actual_columns_available).get(col, {}).get('ЧОК', np.nan) for col in forecast_actual_columns_available]))
+        if pd.isna(forecasted_chok_value):
+            df_allowed_article_errors, max_abs_chok_dev_value = cached(
+                'calculate_allowed_article_error_range', (forecast_actual_column_selected, chok_deviation_limit_percentage),
+                lambda diagnostics: calculate_allowed_article_error_range(df_main_articles, forecast_actual_column_selected, forecasted_chok_value,
+                                                                          chok_deviation_limit_percentage, diagnostics)
+            )
+        else:
+            df_allowed_article_errors, max_abs_chok_dev_value = sensitivity_surface.allowed_errors_frame(
+                forecast_actual_column_selected, chok_deviation_limit_percentage)
         if not pd.isna(forecasted_chok_value):
              st.markdown(f"""
             Анализ для прогноза **{forecast_actual_column_selected}**. Прогнозный ЧОК = **{forecasted_chok_value:.0f} тыс. руб.**
@@ -391,10 +542,42 @@ def main():
         """)
         if not df_allowed_article_errors.empty:
             allowed_err_fmt = {c: "{:.2f}%" for c in df_allowed_article_errors.columns if 'Макс. ошибка' in c}
-            st.dataframe(df_allowed_article_errors.replace(np.inf, "Любая (прогноз статьи=0)").style.format(allowed_err_fmt))
+            show_table(df_allowed_article_errors, allowed_err_fmt, key="table_allowed_errors", top_n_column=next(iter(allowed_err_fmt), None),
+                       top_n_ascending=True, inf_label="Любая (прогноз статьи=0)")
+
+        if not pd.isna(forecasted_chok_value):
+            st.subheader("Совместный бюджет ошибок: ошибаются все статьи одновременно")
+            st.markdown(f"""
+            Таблица выше предполагает, что ошибается только одна статья. Если ошибаются все статьи сразу и в худшую для ЧОК сторону,
+            допустимое отклонение ЧОК (**+/- {max_abs_chok_dev_value:.2f} тыс. руб.**) нужно разделить между ними:
+            - **поровну:** каждой статье достается одинаковая часть в тыс. руб. (допуски одной статьи уменьшаются в число статей раз);
+            - **по доле прогноза:** часть пропорциональна доле статьи (|прогноз| / сумма модулей всех статей) — у всех статей одинаковый допуск в %;
+            - **по существенности:** часть пропорциональна средней существенности статьи по выбранным фактическим периодам
+              (метод Раздела 2: **{materiality_method_key}**) — существенным в факте статьям достается больше.
+
+            Если каждая статья ошибется не больше своего совместного допуска, ЧОК останется в пределах лимита **+/- {chok_deviation_limit_percentage}%**.
+            """)
+            article_weights = cached('materiality_weights', (selected_fact_columns, materiality_method_key),
+                                     lambda diagnostics: materiality_weights(df_main_articles, all_period_totals, selected_fact_columns,
+                                                                             materiality_method_key))
+            df_error_budget = sensitivity_surface.error_budget_frame(forecast_actual_column_selected, chok_deviation_limit_percentage,
+                                                                     article_weights)
+            df_sensitivity_limit = sensitivity_surface.limit_frame(chok_deviation_limit_percentage)
+            allocation_method = st.radio("Распределение бюджета на диаграмме:", options=list(ALLOCATION_METHODS), format_func=ALLOCATION_METHODS.get,
+                                         horizontal=True, key="allocation_method")
+            df_tornado = tornado_frame(df_error_budget, allocation_method)
+            if not df_tornado.empty:
+                st.markdown(f"Самые чувствительные статьи (не более {df_tornado['Статья'].nunique()}): допуск одной статьи и совместный допуск, +/- %")
+                st.vega_lite_chart(df_tornado, tornado_chart_spec(df_tornado), use_container_width=True)
+            budget_fmt = {col: "{:.2f}%" for col in df_error_budget.columns if '%' in col}
+            budget_fmt.update({col: "{:.2f}" for col in df_error_budget.columns if 'тыс. руб.' in col})
+            budget_fmt['Прогноз'] = "{:.0f}"
+            show_table(df_error_budget, budget_fmt, key="table_error_budget", top_n_column='Одна статья (+/- %)', top_n_ascending=True,
+                       inf_label="Любая (прогноз статьи=0)")
     else:
         st.info("Выберите прогнозный период для анализа чувствительности.")
 
+    stage("section 4.1")
     st.header("4.1. Модулятор ошибок прогноза статей")
     st.markdown("""
     Этот инструмент позволяет вам моделировать влияние различных ошибок прогноза статей на итоговый ЧОК.
@@ -404,60 +587,79 @@ def main():
     if forecast_actual_column_selected and forecast_actual_column_selected in df_main_articles.columns:
         forecasted_chok_value = all_period_totals.get(forecast_actual_column_selected, {}).get('ЧОК', np.nan)
         if not pd.isna(forecasted_chok_value):
-            st.markdown(f"Базовый прогнозный ЧОК: **{forecasted_chok_value:.0f} тыс. руб.** (для периода {forecast_actual_column_selected})")
-
-            error_modulator_data = {'Статья': df_main_articles['Статья'].tolist(), 'Тип': df_main_articles['Тип'].tolist(),
-                                    'Прогноз': df_main_articles[forecast_actual_column_selected].tolist(), 'Ошибка (%)': [0.0] * len(df_main_articles)}
-            df_error_modulator = pd.DataFrame(error_modulator_data)
-
-            edited_df = st.data_editor(df_error_modulator, column_config={"Ошибка (%)": st.column_config.NumberColumn(min_value=-100.0, max_value=100.0, step=0.1, format="%.1f")},
-                                      hide_index=True, use_container_width=True, num_rows="dynamic")
-
-            if edited_df is not None:
-                modified_chok = forecasted_chok_value
-                chok_deviation = 0.0
-                modified_values = []
-                for _, row in edited_df.iterrows():
-                    forecast_value, error_percentage = row['Прогноз'], row['Ошибка (%)']
-                    if not pd.isna(forecast_value):
-                        modified_value = forecast_value * (1 + error_percentage / 100)
-                        modified_values.append(modified_value)
-                        if row['Тип'] == 'ОА':
-                            chok_deviation += (modified_value - forecast_value)
-                        elif row['Тип'] == 'КО':
-                            chok_deviation -= (modified_value - forecast_value)
-                    else:
-                        modified_values.append(np.nan)
-                edited_df['С учетом ошибки'] = modified_values
-                modified_chok += chok_deviation
-                chok_deviation_percentage = (chok_deviation / forecasted_chok_value) * 100 if forecasted_chok_value != 0 else 0
-
-                st.subheader("Результат моделирования:")
-                st.dataframe(edited_df[['Статья', 'Прогноз', 'Ошибка (%)', 'С учетом ошибки']].style.format({'Прогноз': "{:.0f}", 'С учетом ошибки': "{:.0f}", 'Ошибка (%)': "{:.1f}%"}), use_container_width=True)
-                st.metric(label="Изменение ЧОК", value=f"{modified_chok:.0f} тыс. руб.", delta=f"{chok_deviation:.0f} тыс. руб. ({chok_deviation_percentage:.2f}%)")
-
-                if abs(chok_deviation_percentage) > chok_deviation_limit_percentage:
-                    st.warning(f"Превышение допустимого отклонения ЧОК ({chok_deviation_limit_percentage}%).")
-                else:
-                    st.success("Отклонение ЧОК в пределах допустимого.")
-
-                # Подготовка данных для выгрузки в Excel
-                dfs_for_export = {}  # Инициализация словаря
-                if 'Модулятор_ошибок' not in dfs_for_export:
-                    dfs_for_export['Модулятор_ошибок'] = pd.DataFrame()
-                dfs_for_export['Модулятор_ошибок'] = edited_df[['Статья', 'Прогноз', 'Ошибка (%)', 'С учетом ошибки']]
-
+            render_error_modulator(df_main_articles, forecast_actual_column_selected, forecasted_chok_value, chok_deviation_limit_percentage)
         else:
             st.warning("Прогнозный ЧОК не определен, моделирование невозможно.")
     else:
         st.info("Выберите прогнозный период для моделирования ошибок.")
 
+    stage("section 4.2")
+    st.header("4.2. Моделирование Монте-Карло: ошибки всех статей одновременно")
+    st.markdown("""
+    Раздел 4 предполагает, что ошибается только одна статья, а модулятор 4.1 проверяет один заданный вручную сценарий.
+    Здесь для **каждой** статьи одновременно генерируются случайные ошибки прогноза из выбранного распределения, и по множеству сценариев оценивается:
+    - **распределение отклонения ЧОК** от прогнозного значения;
+    - **вероятность превышения** допустимого лимита отклонения ЧОК (из боковой панели);
+    - **вклад каждой статьи в дисперсию** отклонения ЧОК (сумма вкладов = 100%). Отрицательный вклад означает, что ошибки статьи частично компенсируют ошибки других.
+
+    СКО ошибки статьи можно оценить по истории (пары прогноз/факт одного периода, а при их отсутствии — изменчивость факта между соседними периодами) или задать одинаковым для всех статей.
+    """)
+    if forecast_actual_column_selected and forecast_actual_column_selected in df_main_articles.columns:
+        forecasted_chok_value = all_period_totals.get(forecast_actual_column_selected, {}).get('ЧОК', np.nan)
+        mc_col1, mc_col2, mc_col3 = st.columns(3)
+        mc_n_scenarios = mc_col1.number_input("Число сценариев:", min_value=1_000, max_value=5_000_000, value=100_000, step=10_000, key="mc_n_scenarios")
+        mc_distribution = mc_col2.selectbox("Распределение ошибок:", options=DISTRIBUTIONS, format_func=DISTRIBUTION_LABELS.get, key="mc_distribution")
+        mc_sigma_source = mc_col3.radio("СКО ошибки статей:", options=["history", "fixed"], key="mc_sigma_source",
+                                        format_func=lambda x: {"history": "по истории", "fixed": "одинаковое для всех"}[x])
+        mc_col4, mc_col5, mc_col6 = st.columns(3)
+        mc_fixed_sigma = mc_col4.number_input("СКО ошибки (%), если одинаковое:", min_value=0.0, max_value=100.0, value=5.0, step=0.5,
+                                              key="mc_fixed_sigma", disabled=mc_sigma_source != "fixed")
+        mc_workers = mc_col5.number_input("Процессов:", min_value=1, max_value=MC_MAX_WORKERS, value=1, step=1, key="mc_workers")
+        mc_seed = mc_col6.number_input("Зерно генератора:", min_value=0, value=42, step=1, key="mc_seed")
+
+        if mc_sigma_source == "history":
+            # Оценка по истории - один раз на набор данных (и узел иерархии), а не при каждом запуске страницы
+            mc_sigmas, mc_sigma_label = cached('estimate_error_sigmas', (fact_actual_columns_all, forecast_actual_columns_available),
+                                               lambda diagnostics: estimate_error_sigmas(df_main_articles, fact_actual_columns_all,
+                                                                                         forecast_actual_columns_available))
+        else:
+            mc_sigmas, mc_sigma_label = np.full(len(df_main_articles), mc_fixed_sigma), f"одинаковое {mc_fixed_sigma}%"
+        mc_params = (forecast_actual_column_selected, chok_deviation_limit_percentage, int(mc_n_scenarios), mc_distribution,
+                     mc_sigma_source, float(mc_fixed_sigma), int(mc_seed))
+        mc_key = make_key(current_data_key(), mc_params)  # результат относится к этим данным (и узлу иерархии) и настройкам
+        if st.button("Запустить моделирование", key="mc_run_btn", disabled=pd.isna(forecasted_chok_value)):
+            # Расчет идет в фоновой задаче; результат общий для сессий через кэш вычислений
+            start_task("mc", "Моделирование Монте-Карло", run_monte_carlo, mc_key, mc_params,
+                       df_main_articles, forecasted_chok_value, mc_sigmas, int(mc_workers))
+        mc_task = finished_task("mc")
+        if mc_task is not None and mc_task.status == "done":
+            st.session_state.mc_result = mc_task.result
+        render_task_progress("mc")
+        # Результат показывается, пока данные и настройки совпадают с запущенными
+        mc_finished_key, mc_result = st.session_state.get('mc_result', (None, None))
+        if mc_finished_key == mc_key:
+            mc_quantiles = mc_result.quantiles
+            st.caption(f"СКО ошибок статей: {mc_sigma_label}. Сценариев: {mc_result.n_scenarios:,}".replace(",", " "))
+            m1, m2, m3 = st.columns(3)
+            m1.metric(f"Вероятность превышения лимита {chok_deviation_limit_percentage}%", f"{mc_result.breach_probability * 100:.2f}%")
+            m2.metric("Отклонение ЧОК, 5-й перцентиль", f"{mc_quantiles[0.05]:.0f} тыс. руб.")
+            m3.metric("Отклонение ЧОК, 95-й перцентиль", f"{mc_quantiles[0.95]:.0f} тыс. руб.")
+            st.subheader("Распределение отклонения ЧОК (% от прогноза):")
+            st.bar_chart(mc_result.histogram, x='Отклонение ЧОК (%)', y='Сценариев')
+            st.subheader("Вклад статей в дисперсию отклонения ЧОК:")
+            show_table(mc_result.contributions, {'Прогноз': "{:.0f}", 'СКО ошибки (%)': "{:.2f}%", 'Вклад в дисперсию': "{:.0f}",
+                                                 'Доля в дисперсии (%)': "{:.2f}%"}, key="table_mc_contributions", top_n_column='Доля в дисперсии (%)')
+    else:
+        st.info("Выберите прогнозный период для моделирования.")
+
+    stage("section 5")
     st.header("5. Выгрузка данных в Excel")
     # ... (код Раздела 5 с подробными пояснениями из предыдущего ответа) ...
-    st.markdown("Нажмите кнопку ниже, чтобы скачать все рассчитанные таблицы (на основе текущих настроек в боковой панели) в одном Excel файле. Каждая таблица будет размещена на отдельном листе.")
+    st.markdown("Нажмите «Сформировать файл», а затем кнопку скачивания, чтобы получить все рассчитанные таблицы (на основе текущих настроек в боковой панели) в одном Excel файле. Каждая таблица будет размещена на отдельном листе. Для машинной обработки доступны также zip-архивы CSV и Parquet (по файлу на таблицу).")
     dfs_for_export = {} # Инициализация словаря
     if not df_main_for_export.empty: dfs_for_export["Данные_статьи"] = df_main_for_export
     if not df_totals_for_export.empty: dfs_for_export["Данные_итоги"] = df_totals_for_export  # Corrected: Removed extra space
+    if not df_hierarchy_for_export.empty: dfs_for_export["Иерархия"] = df_hierarchy_for_export
     if not df_materiality_calculated.empty:
         sheet_name_materiality = f"Сущ_{materiality_method_key}"[:31] # ИСПРАВЛЕНО: сокращаем имя листа
         dfs_for_export[sheet_name_materiality] = df_materiality_calculated
@@ -465,16 +667,38 @@ def main():
     if not df_summary_indicator_deviations.empty:
         dfs_for_export["Отклонения_итоги"] = df_summary_indicator_deviations.set_index('Показатель') if 'Показатель' in df_summary_indicator_deviations else df_summary_indicator_deviations
     if not df_allowed_article_errors.empty: dfs_for_export["Допустимые_ошибки"] = df_allowed_article_errors  # Corrected: Removed extra space
+    if not df_error_budget.empty: dfs_for_export["Совместный_бюджет"] = df_error_budget
+    if not df_sensitivity_limit.empty: dfs_for_export[f"Чувствительность_лимит_{chok_deviation_limit_percentage}"] = df_sensitivity_limit
+    if backtest_result is not None:
+        dfs_for_export["Бэктест_периоды"] = backtest_result.periods
+        dfs_for_export["Бэктест_статьи"] = backtest_result.articles
 
     if dfs_for_export:
-        excel_bytes = dfs_to_excel_bytes(dfs_for_export)
-        st.download_button(
-           label="📥 Скачать все расчеты в Excel",
-           data=excel_bytes,
-           file_name=f"анализ_чок_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-           mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-           key="download_excel_button"
-        )
+        # Файл формируется только по кнопке и пишется во временный файл (Excel - потоково, в режиме constant_memory)
+        export_format = st.selectbox("Формат выгрузки:", options=list(EXPORT_FORMATS), format_func=lambda x: EXPORT_FORMATS[x]["label"], key="export_format")
+        export_settings = (current_data_key(), active_value_columns, selected_fact_columns, materiality_method_key,
+                           forecast_actual_column_selected, base_for_deviation_analysis, chok_deviation_limit_percentage, export_format)
+        if st.button("Сформировать файл", key="prepare_export_btn"):
+            # Файл пишется в фоновой задаче; по готовности путь и настройки переносятся в session_state
+            start_task("export", "Формирование файла", run_export, dfs_for_export, export_format, export_settings)
+        export_task = finished_task("export")
+        if export_task is not None and export_task.status == "done":
+            remove_export_file(st.session_state.get('export_file_path'))
+            st.session_state.export_file_path, st.session_state.export_file_settings, finished_format = export_task.result
+            st.session_state.export_file_name = f"анализ_чок_{pd.Timestamp.now().strftime('%Y%m%d_%H%M%S')}{EXPORT_FORMATS[finished_format]['extension']}"
+        render_task_progress("export")
+        export_file_path = st.session_state.get('export_file_path')
+        if export_file_path and os.path.exists(export_file_path) and st.session_state.get('export_file_settings') == export_settings:
+            # Файл читается в память только по нажатию (если Streamlit поддерживает отложенные данные), а не при каждом запуске
+            st.download_button(
+                label="📥 Скачать все расчеты",
+                data=(lambda: read_export_file(export_file_path)) if LAZY_DOWNLOADS else read_export_file(export_file_path),
+                file_name=st.session_state.export_file_name,
+                mime=EXPORT_FORMATS[export_format]["mime"],
+                key="download_excel_button"
+            )
+        elif export_file_path:
+            st.caption("Настройки анализа изменились после формирования файла. Сформируйте файл заново.")
     else:
         st.info("Нет данных для формирования Excel файла. Выберите периоды и/или загрузите данные для проведения расчетов.")
 
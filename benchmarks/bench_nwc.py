@@ -0,0 +1,147 @@
+# --- Замеры производительности расчетов ЧОК ---
+# Для каждого уровня размера данных измеряются время (медиана по повторам) и пиковая память (tracemalloc)
+# загрузки, итогов, существенности (все методы), отклонений, допустимых ошибок и выгрузки.
+# Результаты можно сохранить как базовую линию и сравнить с ней, чтобы обнаружить регрессии.
+#
+# Примеры:
+#   python benchmarks/bench_nwc.py --tiers small medium --save benchmarks/baselines/local.json
+#   python benchmarks/bench_nwc.py --tiers small medium --compare benchmarks/baselines/local.json
+import argparse
+import gc
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic_data import generate_articles  # noqa: E402
+from nwc_analysis import (calculate_allowed_article_error_range, calculate_forecast_deviations,  # noqa: E402
+                          calculate_materiality, calculate_period_totals, classify_period_columns, load_articles)
+from nwc_engine import MATERIALITY_METHODS  # noqa: E402
+from nwc_export import dfs_to_excel_bytes, export_to_tempfile, remove_export_file  # noqa: E402
+
+# (статей, фактических периодов, юрлиц)
+TIERS = {
+    "small": (100, 12, 1),
+    "medium": (2_000, 36, 1),
+    "large": (10_000, 72, 1),
+    "group": (500, 36, 40),
+}
+DEFAULT_REGRESSION_THRESHOLD = 1.25
+
+
+def measure(func, repeats=3):
+    # Медиана времени по повторам и пик памяти на отдельном (последнем) запуске под tracemalloc
+    timings = []
+    for _ in range(repeats):
+        gc.collect()
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {'time_s': statistics.median(timings), 'peak_mb': peak / 1024 / 1024}
+
+
+def build_cases(df_articles, excel_bytes, csv_bytes):
+    fact_columns, forecast_columns = classify_period_columns(df_articles)
+    forecast_column, base_column = forecast_columns[0], fact_columns[-1]
+    active_columns = fact_columns + [forecast_column]
+    totals = calculate_period_totals(df_articles, active_columns)
+    forecast_chok = totals[forecast_column]['ЧОК']
+    cases = {
+        'load_external_data[xlsx]': lambda: load_articles(excel_bytes, file_name="bench.xlsx"),
+        'load_external_data[csv]': lambda: load_articles(csv_bytes, file_name="bench.csv"),
+        'calculate_period_totals': lambda: calculate_period_totals(df_articles, active_columns),
+    }
+    for method in MATERIALITY_METHODS:
+        cases[f'calculate_materiality[{method}]'] = (
+            lambda method=method: calculate_materiality(df_articles, totals, fact_columns, method))
+    cases['calculate_forecast_deviations'] = lambda: calculate_forecast_deviations(df_articles, totals, forecast_column, base_column)
+    cases['calculate_allowed_article_error_range'] = lambda: calculate_allowed_article_error_range(df_articles, forecast_column, forecast_chok, 5)
+    export_frames = {'Данные_статьи': df_articles,
+                     'Сущ_vs_CHOK': calculate_materiality(df_articles, totals, fact_columns, 'vs_CHOK')}
+    cases['dfs_to_excel_bytes'] = lambda: dfs_to_excel_bytes(export_frames)
+    cases['export_to_tempfile[xlsx]'] = lambda: remove_export_file(export_to_tempfile(export_frames, 'xlsx'))
+    return cases
+
+
+def run_tier(tier, repeats, only=None):
+    n_articles, n_periods, n_entities = TIERS[tier]
+    df_articles = generate_articles(n_articles, n_periods, n_entities=n_entities, seed=42)
+    excel_buffer = io.BytesIO()
+    df_articles.to_excel(excel_buffer, index=False)
+    csv_bytes = df_articles.to_csv(index=False).encode('utf-8')
+    results = {}
+    for name, func in build_cases(df_articles, excel_buffer.getvalue(), csv_bytes).items():
+        if only and not any(pattern in name for pattern in only):
+            continue
+        results[name] = measure(func, repeats)
+        print(f"{tier:>7} | {name:<45} | {results[name]['time_s'] * 1000:10.1f} мс | {results[name]['peak_mb']:8.1f} МБ", file=sys.stderr)
+    return {'shape': list(df_articles.shape), 'results': results}
+
+
+def compare(current, baseline, threshold=DEFAULT_REGRESSION_THRESHOLD):
+    # Регрессия: время или пиковая память выросли более чем в threshold раз
+    regressions = []
+    for tier, tier_data in current['tiers'].items():
+        baseline_results = baseline.get('tiers', {}).get(tier, {}).get('results', {})
+        for name, metrics in tier_data['results'].items():
+            reference = baseline_results.get(name)
+            if not reference:
+                continue
+            for metric in ('time_s', 'peak_mb'):
+                if reference[metric] > 0 and metrics[metric] / reference[metric] > threshold:
+                    regressions.append({'tier': tier, 'case': name, 'metric': metric,
+                                        'baseline': reference[metric], 'current': metrics[metric],
+                                        'ratio': metrics[metric] / reference[metric]})
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры времени и памяти расчетов ЧОК на синтетических данных.")
+    parser.add_argument("--tiers", nargs="+", choices=list(TIERS), default=["small", "medium"], help="Уровни размера данных")
+    parser.add_argument("--repeats", type=int, default=3, help="Повторов для медианы времени")
+    parser.add_argument("--only", nargs="+", help="Запускать только замеры, содержащие эти подстроки")
+    parser.add_argument("--save", help="Сохранить результаты в JSON (базовая линия)")
+    parser.add_argument("--compare", help="Сравнить с сохраненной базовой линией")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD, help="Допустимый рост времени/памяти, раз")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = {
+        'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+        'tiers': {tier: run_tier(tier, args.repeats, args.only) for tier in args.tiers},
+    }
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w', encoding='utf-8') as baseline_file:
+            json.dump(report, baseline_file, ensure_ascii=False, indent=2)
+        print(f"Базовая линия сохранена: {args.save}", file=sys.stderr)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as baseline_file:
+            regressions = compare(report, json.load(baseline_file), args.threshold)
+        for regression in regressions:
+            print(f"РЕГРЕССИЯ {regression['tier']} | {regression['case']} | {regression['metric']}: "
+                  f"{regression['baseline']:.4f} -> {regression['current']:.4f} (x{regression['ratio']:.2f})", file=sys.stderr)
+        if regressions:
+            return 1
+        print("Регрессий не обнаружено.", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# --- Замеры холодного старта и перезапусков страницы ---
+# Каждый холодный старт - отдельный процесс Python: приложение открывается через streamlit.testing (AppTest)
+# на демо-данных, затем страница перезапускается без изменений (как при простых действиях пользователя).
+# Время берется из профилей запусков ("startup" и "rerun", см. nwc_profiling) и сравнивается с бюджетами
+# NWC_STARTUP_BUDGET_MS и NWC_RERUN_BUDGET_MS. Код возврата 1 - медиана старта или p95 перезапуска сверх бюджета.
+#
+# Примеры:
+#   python benchmarks/bench_startup.py
+#   NWC_RERUN_BUDGET_MS=250 python benchmarks/bench_startup.py --starts 5 --reruns 20 --save benchmarks/baselines/startup.json
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from nwc_profiling import RUN_BUDGETS_MS, perf_logger  # noqa: E402
+
+
+class _RecordCollector(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.INFO)
+        self.records = []
+
+    def emit(self, record):
+        if record.levelno == logging.INFO:
+            self.records.append(json.loads(record.getMessage()))
+
+
+def child(n_reruns):
+    # Один холодный старт: печатает JSON с длительностями запусков
+    from streamlit.testing.v1 import AppTest
+    collector = _RecordCollector()
+    perf_logger.addHandler(collector)
+    perf_logger.setLevel(logging.INFO)
+    perf_logger.propagate = False
+    app_test = AppTest.from_file(os.path.join(ROOT, "app.py"), default_timeout=120)
+    started = time.perf_counter()
+    app_test.run()
+    first_run_ms = (time.perf_counter() - started) * 1000
+    for _ in range(n_reruns):
+        app_test.run()
+    if app_test.exception:
+        raise RuntimeError(f"Ошибка при запуске приложения: {app_test.exception[0].value}")
+    totals = {}
+    for record in collector.records:
+        totals.setdefault(record['event'], []).append(record['total_ms'])
+    print(json.dumps({'first_run_ms': first_run_ms, 'startup_ms': totals.get('startup', [None])[0],
+                      'rerun_ms': totals.get('rerun', [])}))
+
+
+def measure_starts(n_starts, n_reruns):
+    starts = []
+    for _ in range(n_starts):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", "--reruns", str(n_reruns)],
+                                capture_output=True, text=True, check=True, cwd=ROOT).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        result['process_ms'] = (time.perf_counter() - started) * 1000
+        starts.append(result)
+        print(f"старт: {result['startup_ms']:8.1f} мс (процесс целиком {result['process_ms']:8.1f} мс), "
+              f"перезапуск p50: {statistics.median(result['rerun_ms']):6.1f} мс", file=sys.stderr)
+    return starts
+
+
+def summarize(starts):
+    reruns = sorted(ms for start in starts for ms in start['rerun_ms'])
+    startup_p50 = statistics.median(start['startup_ms'] for start in starts)
+    rerun_p50 = statistics.median(reruns)
+    rerun_p95 = reruns[min(len(reruns) - 1, int(round(0.95 * (len(reruns) - 1))))]
+    return {'startup_p50_ms': startup_p50, 'process_p50_ms': statistics.median(start['process_ms'] for start in starts),
+            'rerun_p50_ms': rerun_p50, 'rerun_p95_ms': rerun_p95,
+            'startup_budget_ms': RUN_BUDGETS_MS['startup'], 'rerun_budget_ms': RUN_BUDGETS_MS['rerun'],
+            'startup_over_budget': startup_p50 > RUN_BUDGETS_MS['startup'],
+            'rerun_over_budget': rerun_p95 > RUN_BUDGETS_MS['rerun']}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры холодного старта и перезапусков страницы приложения ЧОК.")
+    parser.add_argument("--starts", type=int, default=3, help="Холодных стартов (отдельных процессов)")
+    parser.add_argument("--reruns", type=int, default=10, help="Перезапусков страницы после каждого старта")
+    parser.add_argument("--save", help="Сохранить результаты в JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.child:
+        child(args.reruns)
+        return 0
+    starts = measure_starts(args.starts, max(args.reruns, 1))
+    summary = summarize(starts)
+    print(f"Холодный старт p50: {summary['startup_p50_ms']:.1f} мс (бюджет {summary['startup_budget_ms']:.0f} мс); "
+          f"перезапуск p50/p95: {summary['rerun_p50_ms']:.1f}/{summary['rerun_p95_ms']:.1f} мс (бюджет {summary['rerun_budget_ms']:.0f} мс)",
+          file=sys.stderr)
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        report = {'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+                  'environment': {'python': platform.python_version(), 'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+                  'summary': summary, 'starts': starts}
+        with open(args.save, 'w', encoding='utf-8') as report_file:
+            json.dump(report, report_file, ensure_ascii=False, indent=2)
+        print(f"Результаты сохранены: {args.save}", file=sys.stderr)
+    if summary['startup_over_budget'] or summary['rerun_over_budget']:
+        print("ПРЕВЫШЕН БЮДЖЕТ времени запуска.", file=sys.stderr)
+        return 1
+    print("Бюджеты времени запуска соблюдены.", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
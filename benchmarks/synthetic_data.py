@@ -0,0 +1,60 @@
+# --- Генератор синтетических данных ЧОК ---
+# Таблица в формате приложения: Статья, Тип, "<период> Факт" ... "<период> Прогноз"
+# с произвольным числом статей, периодов и юрлиц, а также пропусками (NaN) и нулевыми прогнозами.
+import numpy as np
+import pandas as pd
+
+MONTHS = ['Янв', 'Фев', 'Мар', 'Апр', 'Май', 'Июн', 'Июл', 'Авг', 'Сен', 'Окт', 'Ноя', 'Дек']
+OA_ARTICLES = ['Денежные средства', 'Дебиторская задолженность', 'Сырье и материалы', 'Незавершенное производство',
+               'Готовая продукция', 'Авансы выданные', 'НДС к возмещению', 'Прочие оборотные активы']
+CO_ARTICLES = ['Кредиторская задолженность', 'Краткосрочные кредиты и займы', 'Налоги (к уплате)',
+               'Авансы полученные', 'Задолженность перед персоналом', 'Прочие краткосрочные обязательства']
+
+
+def period_labels(n_periods, start_year=2020, frequency="month"):
+    if frequency == "quarter":
+        return [f"Q{i % 4 + 1} {start_year + i // 4}" for i in range(n_periods)]
+    return [f"{MONTHS[i % 12]} {start_year + i // 12}" for i in range(n_periods)]
+
+
+def generate_articles(n_articles=100, n_periods=12, n_forecast_periods=1, n_entities=1, nan_fraction=0.02,
+                      zero_forecast_fraction=0.02, oa_share=0.6, frequency="month", entity_column=None,
+                      backtest_forecasts=False, seed=0):
+    # n_articles - статей на одно юрлицо; всего строк n_articles * n_entities.
+    # entity_column - имя столбца с юрлицом; если не задано, юрлицо добавляется к названию статьи.
+    # backtest_forecasts - добавить прогнозы и для фактических периодов (для оценки точности прогнозов).
+    rng = np.random.default_rng(seed)
+    n_rows = n_articles * n_entities
+    is_oa = rng.random(n_articles) < oa_share
+    base_names = [f"{(OA_ARTICLES if oa else CO_ARTICLES)[i % len(OA_ARTICLES if oa else CO_ARTICLES)]} {i + 1}"
+                  for i, oa in enumerate(is_oa)]
+    entities = np.repeat([f"ЮЛ {k + 1:04d}" for k in range(n_entities)], n_articles)
+    names = np.tile(base_names, n_entities)
+    if entity_column is None and n_entities > 1:
+        names = np.char.add(np.char.add(names.astype(str), " / "), entities)
+
+    data = {}
+    if entity_column is not None:
+        data[entity_column] = entities
+    data['Статья'] = names
+    data['Тип'] = np.where(np.tile(is_oa, n_entities), 'ОА', 'КО')
+
+    # Уровень статьи (логнормальный) и случайное блуждание по периодам
+    labels = period_labels(n_periods + n_forecast_periods, frequency=frequency)
+    level = rng.lognormal(mean=6.0, sigma=1.2, size=n_rows)
+    steps = rng.normal(0.0, 0.05, size=(n_rows, n_periods + n_forecast_periods))
+    values = np.round(level[:, None] * np.exp(np.cumsum(steps, axis=1)), 1)
+
+    for j in range(n_periods):
+        column = values[:, j].copy()
+        column[rng.random(n_rows) < nan_fraction] = np.nan
+        data[f"{labels[j]} Факт"] = column
+    forecast_indices = list(range(n_periods, n_periods + n_forecast_periods))
+    if backtest_forecasts:
+        forecast_indices = list(range(n_periods)) + forecast_indices
+    for j in forecast_indices:
+        column = np.round(values[:, j] * (1 + rng.normal(0.0, 0.08, size=n_rows)), 1)
+        column[rng.random(n_rows) < zero_forecast_fraction] = 0.0
+        column[rng.random(n_rows) < nan_fraction] = np.nan
+        data[f"{labels[j]} Прогноз"] = column
+    return pd.DataFrame(data)
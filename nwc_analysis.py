@@ -0,0 +1,260 @@
+# --- Расчеты ЧОК без интерфейса ---
+# Модуль не зависит от Streamlit: функции возвращают результаты и список диагностических
+# сообщений (Diagnostic) вместо вызовов st.warning / st.error. Используется приложением app.py
+# и пакетной обработкой nwc_batch.py.
+import os
+from collections import namedtuple
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from nwc_backtest import backtest_pairs, run_backtest
+from nwc_dtypes import DEFAULT_VALUE_PRECISION, article_names, compact_articles
+from nwc_engine import ArticleMatrix, TOTAL_NAMES, deviation_arrays, totals_to_arrays
+from nwc_hierarchy import ENTITY_COLUMN, HIERARCHY_COLUMNS, RollupTree, hierarchy_levels
+from nwc_io import content_hash, get_default_parsed_cache, read_entity_sheets, read_table
+from nwc_periods import PeriodIndex
+from nwc_profiling import profiled
+
+# level: "error" | "warning" | "info"
+Diagnostic = namedtuple('Diagnostic', ['level', 'message'])
+
+
+def _report(diagnostics, level, message):
+    if diagnostics is not None:
+        diagnostics.append(Diagnostic(level, message))
+
+
+# --- 1. ЗАГРУЗКА И ПОДГОТОВКА ДАННЫХ ---
+def validate_articles(df, diagnostics=None):
+    # Проверка структуры и приведение столбцов периодов к числам за один проход. None при ошибке.
+    if 'Статья' not in df.columns or 'Тип' not in df.columns:
+        _report(diagnostics, "error", "Ошибка: В файле отсутствуют столбцы 'Статья' и/или 'Тип'.")
+        return None
+    if not df['Тип'].isin(['ОА', 'КО']).all():
+        _report(diagnostics, "error", "Ошибка: Столбец 'Тип' может содержать только 'ОА' или 'КО'.")
+        return None
+    # Столбцы иерархии (Сегмент, Юрлицо) - текстовые и в периоды не входят
+    data_cols = df.columns.drop(['Статья', 'Тип'] + [col for col in HIERARCHY_COLUMNS if col in df.columns])
+    if not data_cols.tolist():
+        _report(diagnostics, "error", "Ошибка: В файле отсутствуют столбцы с данными по периодам.")
+        return None
+    # Столбцы, уже прочитанные как числа, не пересчитываются; остальные приводятся одним присваиванием
+    non_numeric_cols = [col for col in data_cols if not pd.api.types.is_numeric_dtype(df[col])]
+    if non_numeric_cols:
+        df[non_numeric_cols] = df[non_numeric_cols].apply(pd.to_numeric, errors='coerce')
+    return df
+
+
+@profiled
+def load_articles(source, diagnostics=None, file_name=None, sheets_as_entities=False, precision=DEFAULT_VALUE_PRECISION):
+    # source: путь к файлу, байты или файловый объект (Excel, CSV, Parquet). Читается первый лист;
+    # sheets_as_entities - читаются все листы книги, каждый лист - отдельное юрлицо.
+    # Таблица возвращается в компактных типах (nwc_dtypes), precision - точность хранения значений.
+    try:
+        data, file_name = _read_source_bytes(source, file_name)
+        df = read_entity_sheets(data, file_name, ENTITY_COLUMN) if sheets_as_entities else read_table(data, file_name)
+    except Exception as e:
+        _report(diagnostics, "error", f"Ошибка при чтении файла: {e}")
+        return None
+    if df.attrs.get('unknown_scenarios'):
+        _report(diagnostics, "warning", f"Строки с неизвестным сценарием пропущены: {', '.join(df.attrs['unknown_scenarios'][:10])}.")
+    df = validate_articles(df, diagnostics)
+    return compact_articles(df, precision) if df is not None else None
+
+
+@profiled
+def load_articles_cached(source, diagnostics=None, file_name=None, parsed_cache=None, sheets_as_entities=False,
+                         precision=DEFAULT_VALUE_PRECISION):
+    # То же, что load_articles, но с Parquet-кэшем разобранных таблиц по хэшу содержимого файла.
+    # Возвращает (таблица или None, хэш содержимого; для режима "лист = юрлицо" и неполной точности - с суффиксами).
+    try:
+        data, file_name = _read_source_bytes(source, file_name)
+    except Exception as e:
+        _report(diagnostics, "error", f"Ошибка при чтении файла: {e}")
+        return None, None
+    file_hash = content_hash(data) + ("-sheets" if sheets_as_entities else "") + (f"-{precision}" if precision != "float64" else "")
+    parsed_cache = parsed_cache or get_default_parsed_cache()
+    df = parsed_cache.get(file_hash)
+    if df is not None:
+        return df, file_hash
+    df = load_articles(data, diagnostics, file_name, sheets_as_entities, precision)
+    if df is not None:
+        parsed_cache.put(file_hash, df)
+    return df, file_hash
+
+
+def _read_source_bytes(source, file_name=None):
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source), file_name or ""
+    if isinstance(source, (str, os.PathLike)):
+        path = Path(source)
+        return path.read_bytes(), file_name or path.name
+    data = source.getvalue() if hasattr(source, 'getvalue') else source.read()
+    return data, file_name or getattr(source, 'name', "")
+
+
+def build_period_index(df_articles):
+    # Вид периода: из столбца "Сценарий" длинного формата (df.attrs), иначе по ключевым словам в названии
+    return PeriodIndex.from_frame(df_articles)
+
+
+def classify_period_columns(df_articles, period_index=None):
+    # Фактические и прогнозные столбцы в хронологическом порядке
+    period_index = period_index or build_period_index(df_articles)
+    return list(period_index.facts), list(period_index.forecasts)
+
+
+@profiled
+def calculate_period_totals(df_articles, columns_to_calculate):
+    matrix = ArticleMatrix(df_articles, columns_to_calculate)
+    totals = matrix.totals()
+    period_totals_data = {}
+    for i, col_name in enumerate(matrix.columns):
+        period_totals_data[col_name] = {name: totals[name][i] for name in TOTAL_NAMES}
+    return period_totals_data
+
+
+def period_totals_frame(period_totals_data, columns):
+    totals_rows = [{'Показатель': name, **{col: period_totals_data.get(col, {}).get(name, np.nan) for col in columns}}
+                   for name in TOTAL_NAMES]
+    return pd.DataFrame(totals_rows).set_index('Показатель')
+
+
+# --- 2. РАСЧЕТ СУЩЕСТВЕННОСТИ (НЕСКОЛЬКО МЕТОДОВ) ---
+@profiled
+def calculate_materiality(df_articles, period_totals_data, data_columns_list, method="vs_CHOK"):
+    matrix = ArticleMatrix(df_articles, data_columns_list)
+    materiality_matrix = matrix.materiality(method, totals_to_arrays(period_totals_data, matrix.columns))
+    materiality_data = {}
+    for i, col_name in enumerate(matrix.columns):
+        materiality_data[f'Сущ-ть ({col_name.split(" ")[0]}) (%)'] = materiality_matrix[:, i]
+
+    #  ИЗМЕНЕНО: Формирование названия столбца с годом
+    materiality_data_with_year = {'Статья': article_names(df_articles)}
+    for col_name in data_columns_list:
+        materiality_data_with_year[f"Сущ-ть ({col_name.replace(' Факт', '').replace(' Прогноз', '')}) (%)"] = materiality_data.get(f'Сущ-ть ({col_name.split(" ")[0]}) (%)', [])
+    return pd.DataFrame(materiality_data_with_year)
+
+
+# --- 3. ОТКЛОНЕНИЯ ПРОГНОЗА ---
+@profiled
+def calculate_forecast_deviations(df_articles, period_totals_data, forecast_col_name, base_col_name, diagnostics=None):
+    deviations_data = {'Статья': article_names(df_articles)}
+    if base_col_name not in df_articles.columns or forecast_col_name not in df_articles.columns:
+        _report(diagnostics, "warning", f"Колонки для отклонений ('{base_col_name}'/'{forecast_col_name}') не найдены.")
+        empty_df_articles = pd.DataFrame(deviations_data)
+        empty_df_summary = pd.DataFrame(columns=['Показатель', 'Прогноз', f'Факт ({base_col_name.split(" ")[0]})', 'Абс. откл.', 'Отн. откл. (%)'])
+        return empty_df_articles, empty_df_summary
+    matrix = ArticleMatrix(df_articles, [forecast_col_name, base_col_name])
+    abs_deviations, rel_deviations = matrix.deviations(forecast_col_name, base_col_name)
+    deviations_data[f'Абс. откл. (Прогноз - {base_col_name.split(" ")[0]})'] = abs_deviations
+    deviations_data[f'Отн. откл. (Прогноз - {base_col_name.split(" ")[0]}) (%)'] = rel_deviations
+    df_deviations_result = pd.DataFrame(deviations_data)
+    prog_data = period_totals_data.get(forecast_col_name, {})
+    base_data = period_totals_data.get(base_col_name, {})
+    prog_vals = [prog_data.get(indicator, np.nan) for indicator in TOTAL_NAMES]
+    base_vals = [base_data.get(indicator, np.nan) for indicator in TOTAL_NAMES]
+    abs_d, rel_d = deviation_arrays(prog_vals, base_vals)  # прогноз - факт
+    df_summary = pd.DataFrame({
+        'Показатель': TOTAL_NAMES, 'Прогноз': prog_vals, f'Факт ({base_col_name.split(" ")[0]})': base_vals,
+        'Абс. откл.': abs_d, 'Отн. откл. (%)': rel_d
+    })
+    return df_deviations_result, df_summary
+
+
+# --- 4. ДОПУСТИМЫЙ ДИАПАЗОН ОШИБКИ ПРОГНОЗА СТАТЬИ ---
+@profiled
+def calculate_allowed_article_error_range(df_articles, forecast_col_name, forecast_chok_value, wc_deviation_perc_limit=5, diagnostics=None):
+    if forecast_col_name not in df_articles.columns:
+        _report(diagnostics, "warning", f"Прогнозная колонка '{forecast_col_name}' отсутствует.")
+        return pd.DataFrame({'Статья': article_names(df_articles)}), np.nan
+    if pd.isna(forecast_chok_value):
+        _report(diagnostics, "warning", "Прогнозный ЧОК не определен, анализ чувствительности невозможен.")
+        return pd.DataFrame({'Статья': article_names(df_articles)}), np.nan
+    matrix = ArticleMatrix(df_articles, [forecast_col_name])
+    error_range_percentages, max_abs_wc_deviation_allowed = matrix.allowed_error_range(
+        forecast_col_name, forecast_chok_value, wc_deviation_perc_limit)
+    allowed_error_ranges_data = {'Статья': article_names(df_articles)}
+    allowed_error_ranges_data[f'Макс. ошибка статьи (+/- %) для откл. ЧОК до {wc_deviation_perc_limit}%'] = error_range_percentages
+    return pd.DataFrame(allowed_error_ranges_data), max_abs_wc_deviation_allowed
+
+
+# --- ПОЛНЫЙ АНАЛИЗ ОДНОЙ ТАБЛИЦЫ ---
+@dataclass
+class AnalysisResult:
+    fact_columns: list
+    forecast_column: object
+    base_column: object
+    totals: pd.DataFrame
+    materiality: pd.DataFrame
+    deviations: pd.DataFrame
+    deviations_summary: pd.DataFrame
+    allowed_errors: pd.DataFrame
+    max_abs_chok_deviation: float
+    diagnostics: list = field(default_factory=list)
+    hierarchy_totals: pd.DataFrame = field(default_factory=pd.DataFrame)  # итоги всех узлов иерархии (если она есть)
+    backtest: object = None  # BacktestResult по всем парам прогноз/факт одного периода (если они есть)
+
+
+@profiled
+def analyze_articles(df_articles, materiality_method="vs_CHOK", chok_deviation_limit_percentage=5,
+                     fact_columns=None, forecast_column=None, base_column=None, node=()):
+    # Все разделы анализа с теми же настройками по умолчанию, что и в боковой панели приложения:
+    # все фактические периоды, последний факт как база, первый прогнозный период.
+    # Если есть столбцы иерархии, анализ выполняется для узла node (по умолчанию - вся группа).
+    diagnostics = []
+    period_index = build_period_index(df_articles)
+    fact_columns_all, forecast_columns_all = classify_period_columns(df_articles, period_index)
+    if fact_columns is None:
+        fact_columns = fact_columns_all
+    if base_column is None:
+        base_column = fact_columns_all[-1] if fact_columns_all else None
+    if forecast_column is None:
+        forecast_column = forecast_columns_all[0] if forecast_columns_all else None
+    if not fact_columns:
+        _report(diagnostics, "warning", "Фактические периоды не найдены.")
+    if forecast_column is None:
+        _report(diagnostics, "warning", "Прогнозные периоды не найдены.")
+
+    active_columns = period_index.ordered(fact_columns + ([forecast_column] if forecast_column else []))
+    active_columns = [col for col in active_columns if col in df_articles.columns]
+    # Итоги считаются и по базовому периоду, даже если его нет среди выбранных фактов (нужен для отклонений)
+    total_columns = period_index.ordered(active_columns + ([base_column] if base_column and base_column not in active_columns else []))
+    total_columns = [col for col in total_columns if col in df_articles.columns]
+    df_hierarchy_totals = pd.DataFrame()
+    if hierarchy_levels(df_articles):
+        tree = RollupTree(df_articles, total_columns)
+        hierarchy_column = next((col for col in (forecast_column, base_column) if col in total_columns), None)
+        if hierarchy_column:
+            df_hierarchy_totals = tree.totals_frame(hierarchy_column)
+        df_articles, all_period_totals = tree.articles(node), tree.period_totals(node)
+    else:
+        all_period_totals = calculate_period_totals(df_articles, total_columns)
+    df_totals = period_totals_frame(all_period_totals, active_columns) if active_columns else pd.DataFrame()
+
+    df_materiality = pd.DataFrame()
+    if fact_columns:
+        df_materiality = calculate_materiality(df_articles, all_period_totals, fact_columns, materiality_method)
+
+    df_deviations, df_deviations_summary = pd.DataFrame(), pd.DataFrame()
+    if forecast_column and base_column:
+        df_deviations, df_deviations_summary = calculate_forecast_deviations(
+            df_articles, all_period_totals, forecast_column, base_column, diagnostics)
+
+    df_allowed_errors, max_abs_chok_deviation = pd.DataFrame(), np.nan
+    if forecast_column:
+        forecast_chok_value = all_period_totals.get(forecast_column, {}).get('ЧОК', np.nan)
+        df_allowed_errors, max_abs_chok_deviation = calculate_allowed_article_error_range(
+            df_articles, forecast_column, forecast_chok_value, chok_deviation_limit_percentage, diagnostics)
+
+    pairs = backtest_pairs(fact_columns_all, forecast_columns_all, period_index)
+    backtest = run_backtest(df_articles, pairs, chok_deviation_limit_percentage) if pairs else None
+
+    return AnalysisResult(fact_columns=fact_columns, forecast_column=forecast_column, base_column=base_column,
+                          totals=df_totals, materiality=df_materiality, deviations=df_deviations,
+                          deviations_summary=df_deviations_summary, allowed_errors=df_allowed_errors,
+                          max_abs_chok_deviation=max_abs_chok_deviation, diagnostics=diagnostics,
+                          hierarchy_totals=df_hierarchy_totals, backtest=backtest)
@@ -0,0 +1,69 @@
+# --- Бэктестинг точности прогнозов ---
+# Все пары "прогноз - факт того же периода" (по индексу периодов) обрабатываются одной матричной операцией:
+# матрицы прогнозов и фактов "статьи x пары" берутся из одной ArticleMatrix и вычитаются целиком, затем статистика по статье
+# сворачивается по оси пар (nan-функции NumPy пропускают отсутствующие значения). Циклов по парам нет.
+import warnings
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from nwc_dtypes import article_names
+from nwc_engine import ArticleMatrix, deviation_arrays
+from nwc_periods import PeriodIndex
+from nwc_profiling import profiled
+
+
+@dataclass
+class BacktestResult:
+    periods: pd.DataFrame  # по одной строке на пару: прогноз и факт ЧОК, отклонение, попадание в лимит
+    articles: pd.DataFrame  # по одной строке на статью: MAPE, смещение, RMSE, доля попаданий
+    limit_percentage: float
+
+
+def backtest_pairs(fact_columns, forecast_columns, period_index=None):
+    # [(прогнозный столбец, фактический столбец)] в хронологическом порядке прогнозов
+    period_index = period_index or PeriodIndex(list(fact_columns) + list(forecast_columns))
+    matches = period_index.matching_facts(period_index.ordered(forecast_columns))
+    return [(forecast, fact) for forecast, fact in matches.items() if fact is not None]
+
+
+@profiled
+def run_backtest(df_articles, pairs, limit_percentage=5):
+    # limit_percentage - допустимое отклонение ЧОК (% от прогнозного ЧОК периода): ошибка статьи
+    # считается попаданием, если одна она не выводит ЧОК за лимит (как в Разделе 4)
+    forecast_columns = [forecast for forecast, _ in pairs]
+    fact_columns = [fact for _, fact in pairs]
+    matrix = ArticleMatrix(df_articles, list(dict.fromkeys(forecast_columns + fact_columns)))
+    forecast_positions = [matrix.column_index(col) for col in forecast_columns]
+    fact_positions = [matrix.column_index(col) for col in fact_columns]
+    # Отклонения статьи x пары теми же правилами, что и в Разделе 3 (прогноз - факт, % от факта)
+    errors, relative_errors = deviation_arrays(matrix.values[:, forecast_positions], matrix.values[:, fact_positions])
+
+    chok = matrix.totals()['ЧОК']
+    forecast_chok, fact_chok = chok[forecast_positions], chok[fact_positions]
+    chok_deviation, chok_deviation_percentage = deviation_arrays(forecast_chok, fact_chok)
+    allowed_abs_deviation = np.abs(forecast_chok) * limit_percentage / 100.0
+    periods = pd.DataFrame({
+        'Прогноз': forecast_columns, 'Факт': fact_columns,
+        'ЧОК прогноз': forecast_chok, 'ЧОК факт': fact_chok,
+        'Абс. откл. ЧОК': chok_deviation, 'Отн. откл. ЧОК (%)': chok_deviation_percentage,
+        'ЧОК в пределах лимита': np.abs(chok_deviation) <= allowed_abs_deviation,
+    })
+
+    observed = ~np.isnan(errors)
+    n_pairs = observed.sum(axis=1)
+    hits = (np.abs(errors) <= allowed_abs_deviation[None, :]) & observed
+    # nanmean по статье без единой пары дает NaN с RuntimeWarning - здесь это ожидаемо
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        articles = pd.DataFrame({
+            'Статья': article_names(df_articles), 'Тип': df_articles['Тип'].reset_index(drop=True), 'Пар': n_pairs,
+            'MAPE (%)': np.nanmean(np.abs(relative_errors), axis=1),
+            'Смещение (%)': np.nanmean(relative_errors, axis=1),
+            'Смещение (тыс. руб.)': np.nanmean(errors, axis=1),
+            'RMSE (тыс. руб.)': np.sqrt(np.nanmean(errors ** 2, axis=1)),
+            'Доля попаданий в лимит (%)': np.where(n_pairs > 0, hits.sum(axis=1) / np.maximum(n_pairs, 1) * 100, np.nan),
+        })
+    return BacktestResult(periods=periods, articles=articles, limit_percentage=limit_percentage)
+
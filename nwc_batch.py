@@ -0,0 +1,224 @@
+# --- Пакетная обработка файлов без интерфейса ---
+# Обрабатывает каталог файлов с данными ЧОК в пуле процессов и формирует один сводный отчет,
+# журнал ошибок по файлам и сводку по времени обработки.
+#
+# Пример:
+#   python nwc_batch.py ./данные -o сводный_отчет.xlsx --workers 8 --limit 5 --method vs_CHOK
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from nwc_analysis import analyze_articles, load_articles
+from nwc_engine import MATERIALITY_METHODS
+from nwc_export import write_xlsx
+
+DEFAULT_PATTERNS = ("*.xlsx", "*.xls", "*.csv", "*.parquet")
+
+
+def find_input_files(input_dir, patterns=DEFAULT_PATTERNS):
+    files = set()
+    for pattern in patterns:
+        files.update(path for path in Path(input_dir).glob(pattern) if path.is_file() and not path.name.startswith("~$"))
+    return sorted(files)
+
+
+def _new_outcome(path):
+    path = Path(path)
+    return {'file': path.name, 'path': str(path), 'status': 'ok', 'diagnostics': [], 'timings': {}, 'result': None}
+
+
+def _failed_outcome(path, error):
+    # Файл, результат которого не удалось получить из пула (процесс упал, результат не передан)
+    outcome = _new_outcome(path)
+    outcome['status'] = 'error'
+    outcome['diagnostics'].append(('error', f"{type(error).__name__}: {error}"))
+    return outcome
+
+
+def process_file(path, materiality_method="vs_CHOK", chok_deviation_limit_percentage=5):
+    # Выполняется в процессе пула: загрузка и полный анализ одного файла.
+    # Исключения не пробрасываются, а попадают в результат, чтобы один файл не останавливал пакет.
+    path = Path(path)
+    outcome = _new_outcome(path)
+    started = time.perf_counter()
+    try:
+        diagnostics = []
+        df_articles = load_articles(path, diagnostics)
+        outcome['timings']['load'] = time.perf_counter() - started
+        if df_articles is None:
+            outcome['status'] = 'error'
+            outcome['diagnostics'] = [tuple(d) for d in diagnostics]
+            return outcome
+        analysis_started = time.perf_counter()
+        result = analyze_articles(df_articles, materiality_method, chok_deviation_limit_percentage)
+        outcome['timings']['analysis'] = time.perf_counter() - analysis_started
+        outcome['diagnostics'] = [tuple(d) for d in diagnostics + result.diagnostics]
+        outcome['n_articles'] = len(df_articles)
+        outcome['result'] = result
+        if any(level == 'warning' for level, _ in outcome['diagnostics']):
+            outcome['status'] = 'warning'
+    except Exception as e:
+        outcome['status'] = 'error'
+        outcome['diagnostics'].append(('error', f"{type(e).__name__}: {e}"))
+    finally:
+        outcome['timings']['total'] = time.perf_counter() - started
+    return outcome
+
+
+def run_batch(files, materiality_method="vs_CHOK", chok_deviation_limit_percentage=5, workers=None, on_done=None):
+    outcomes = []
+    if workers == 1:
+        for path in files:
+            outcome = process_file(path, materiality_method, chok_deviation_limit_percentage)
+            outcomes.append(outcome)
+            if on_done:
+                on_done(outcome)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(process_file, path, materiality_method, chok_deviation_limit_percentage): path for path in files}
+            for future in as_completed(futures):
+                # Падение процесса пула (BrokenProcessPool) или ошибка передачи результата - ошибка этого файла,
+                # а не всего пакета
+                try:
+                    outcome = future.result()
+                except Exception as e:
+                    outcome = _failed_outcome(futures[future], e)
+                outcomes.append(outcome)
+                if on_done:
+                    on_done(outcome)
+    outcomes.sort(key=lambda outcome: outcome['file'])
+    return outcomes
+
+
+def _with_file_column(df, file_name, index_name=None):
+    df = df.reset_index() if index_name else df.copy()
+    df.insert(0, 'Файл', file_name)
+    return df
+
+
+def build_consolidated_report(outcomes):
+    # Сводный отчет: по одной строке на файл + объединенные таблицы всех успешно обработанных файлов
+    summary_rows, totals, hierarchy, deviation_summaries, allowed_errors, materiality, backtests, errors, timings = \
+        [], [], [], [], [], [], [], [], []
+    for outcome in outcomes:
+        result = outcome['result']
+        row = {'Файл': outcome['file'], 'Статус': outcome['status'], 'Статей': outcome.get('n_articles', np.nan)}
+        if result is not None:
+            forecast_chok = result.totals.loc['ЧОК', result.forecast_column] if result.forecast_column in result.totals.columns else np.nan
+            base_chok = result.totals.loc['ЧОК', result.base_column] if result.base_column in result.totals.columns else np.nan
+            row.update({'Прогнозный период': result.forecast_column, 'Базовый факт': result.base_column,
+                        'ЧОК прогноз': forecast_chok, 'ЧОК факт (база)': base_chok,
+                        'Макс. допуст. абс. откл. ЧОК': result.max_abs_chok_deviation})
+            if not result.deviations_summary.empty:
+                chok_row = result.deviations_summary.set_index('Показатель').loc['ЧОК']
+                row.update({'Абс. откл. ЧОК': chok_row['Абс. откл.'], 'Отн. откл. ЧОК (%)': chok_row['Отн. откл. (%)']})
+            if not result.totals.empty:
+                totals.append(_with_file_column(result.totals, outcome['file'], index_name='Показатель'))
+            if not result.hierarchy_totals.empty:
+                hierarchy.append(_with_file_column(result.hierarchy_totals, outcome['file']))
+            if not result.deviations_summary.empty:
+                deviation_summaries.append(_with_file_column(result.deviations_summary, outcome['file']))
+            if not result.allowed_errors.empty:
+                allowed_errors.append(_with_file_column(result.allowed_errors, outcome['file']))
+            if not result.materiality.empty:
+                materiality.append(_with_file_column(result.materiality, outcome['file']))
+            if result.backtest is not None:
+                row['Бэктест: пар в пределах лимита (%)'] = result.backtest.periods['ЧОК в пределах лимита'].mean() * 100
+                backtests.append(_with_file_column(result.backtest.periods, outcome['file']))
+        summary_rows.append(row)
+        for level, message in outcome['diagnostics']:
+            errors.append({'Файл': outcome['file'], 'Уровень': level, 'Сообщение': message})
+        timings.append({'Файл': outcome['file'], **{f'{stage}, с': value for stage, value in outcome['timings'].items()}})
+
+    report = {'Сводка': pd.DataFrame(summary_rows)}
+    if totals:
+        report['Итоги'] = pd.concat(totals, ignore_index=True)
+    if hierarchy:
+        report['Иерархия'] = pd.concat(hierarchy, ignore_index=True)
+    if deviation_summaries:
+        report['Отклонения_итоги'] = pd.concat(deviation_summaries, ignore_index=True)
+    if allowed_errors:
+        report['Допустимые_ошибки'] = pd.concat(allowed_errors, ignore_index=True)
+    if materiality:
+        report['Существенность'] = pd.concat(materiality, ignore_index=True)
+    if backtests:
+        report['Бэктест'] = pd.concat(backtests, ignore_index=True)
+    report['Журнал'] = pd.DataFrame(errors, columns=['Файл', 'Уровень', 'Сообщение'])
+    report['Время'] = pd.DataFrame(timings)
+    return report
+
+
+def write_report(report, output_path):
+    # Потоковая запись (constant_memory): объем сводного отчета не ограничен памятью процесса
+    write_xlsx(report, output_path, index=False)
+
+
+def write_error_log(outcomes, log_path):
+    # Журнал в формате JSON Lines: одна строка на файл с сообщениями уровня warning/error
+    with open(log_path, 'w', encoding='utf-8') as log_file:
+        for outcome in outcomes:
+            if outcome['status'] == 'ok':
+                continue
+            record = {'file': outcome['path'], 'status': outcome['status'],
+                      'messages': [{'level': level, 'message': message} for level, message in outcome['diagnostics']]}
+            log_file.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def timing_summary(outcomes, wall_time):
+    totals = np.array([outcome['timings'].get('total', np.nan) for outcome in outcomes], dtype=np.float64)
+    statuses = [outcome['status'] for outcome in outcomes]
+    slowest = sorted(outcomes, key=lambda outcome: outcome['timings'].get('total', 0), reverse=True)[:5]
+    return {
+        'files': len(outcomes),
+        'ok': statuses.count('ok'), 'warning': statuses.count('warning'), 'error': statuses.count('error'),
+        'wall_time_s': wall_time,
+        'per_file_time_sum_s': float(np.nansum(totals)) if len(totals) else 0.0,
+        'per_file_mean_s': float(np.nanmean(totals)) if len(totals) else np.nan,
+        'per_file_p50_s': float(np.nanpercentile(totals, 50)) if len(totals) else np.nan,
+        'per_file_p95_s': float(np.nanpercentile(totals, 95)) if len(totals) else np.nan,
+        'slowest': [(outcome['file'], outcome['timings'].get('total')) for outcome in slowest],
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетный анализ ЧОК по каталогу файлов с единым сводным отчетом.")
+    parser.add_argument("input_dir", help="Каталог с файлами данных")
+    parser.add_argument("-o", "--output", default="сводный_отчет_чок.xlsx", help="Путь к сводному отчету Excel")
+    parser.add_argument("--pattern", action="append", help="Шаблон имен файлов (можно указать несколько раз), по умолчанию *.xlsx, *.xls, *.csv и *.parquet")
+    parser.add_argument("--workers", type=int, default=None, help="Число процессов (по умолчанию - число ядер; 1 - без пула)")
+    parser.add_argument("--method", choices=MATERIALITY_METHODS, default="vs_CHOK", help="Метод расчета существенности")
+    parser.add_argument("--limit", type=int, default=5, help="Допустимый лимит отклонения ЧОК, %%")
+    parser.add_argument("--error-log", default=None, help="Журнал ошибок по файлам (JSON Lines), по умолчанию <output>.errors.jsonl")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    files = find_input_files(args.input_dir, tuple(args.pattern) if args.pattern else DEFAULT_PATTERNS)
+    if not files:
+        print(f"В каталоге {args.input_dir} не найдено файлов для обработки.", file=sys.stderr)
+        return 1
+
+    def report_progress(outcome):
+        print(f"[{outcome['status']:>7}] {outcome['file']} ({outcome['timings'].get('total', 0):.2f} с)", file=sys.stderr)
+
+    started = time.perf_counter()
+    outcomes = run_batch(files, args.method, args.limit, args.workers, on_done=report_progress)
+    write_report(build_consolidated_report(outcomes), args.output)
+    error_log_path = args.error_log or f"{os.path.splitext(args.output)[0]}.errors.jsonl"
+    write_error_log(outcomes, error_log_path)
+    summary = timing_summary(outcomes, time.perf_counter() - started)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+    print(f"Сводный отчет: {args.output}; журнал ошибок: {error_log_path}", file=sys.stderr)
+    return 0 if summary['error'] == 0 else 2
+
+
+if __name__ == '__main__':
+    sys.exit(main())
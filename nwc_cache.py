@@ -0,0 +1,97 @@
+# --- Кэш вычислений между перезапусками Streamlit ---
+# Ключ записи: имя функции + хэш содержимого таблицы статей + значимые настройки боковой панели.
+# Для каждой функции свой ограниченный LRU-список записей со сроком жизни (TTL).
+# Кэш общий для процесса (всех сессий), поэтому возвращаемые объекты нельзя изменять на месте.
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+DEFAULT_MAX_ENTRIES_PER_FUNCTION = int(os.environ.get("NWC_CACHE_MAX_ENTRIES", "32"))
+DEFAULT_TTL_SECONDS = float(os.environ.get("NWC_CACHE_TTL_SECONDS", "3600"))
+
+
+def dataframe_content_hash(df):
+    # Хэш содержимого таблицы: значения, индекс, названия и типы столбцов
+    digest = hashlib.sha256()
+    digest.update(repr([(str(col), str(dtype)) for col, dtype in df.dtypes.items()]).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def make_key(*parts):
+    # Списки и словари настроек приводятся к хэшируемому виду
+    return tuple(_freeze(part) for part in parts)
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    if isinstance(value, set):
+        return tuple(sorted(_freeze(item) for item in value))
+    return value
+
+
+class ComputationCache:
+    def __init__(self, max_entries_per_function=DEFAULT_MAX_ENTRIES_PER_FUNCTION, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 clock=time.monotonic):
+        self.max_entries_per_function = max_entries_per_function
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock  # источник времени для TTL; подменяется в тестах
+        self._entries = {}  # имя функции -> OrderedDict(ключ -> (время записи, значение))
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_compute(self, func_name, key, compute):
+        now = self._clock()
+        with self._lock:
+            entries = self._entries.setdefault(func_name, OrderedDict())
+            cached = entries.get(key)
+            if cached is not None and now - cached[0] <= self.ttl_seconds:
+                entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            if cached is not None:
+                del entries[key]
+            self.misses += 1
+        # Вычисление вне блокировки, чтобы не задерживать другие сессии
+        value = compute()
+        with self._lock:
+            entries = self._entries.setdefault(func_name, OrderedDict())
+            entries[key] = (self._clock(), value)
+            entries.move_to_end(key)
+            while len(entries) > self.max_entries_per_function:
+                entries.popitem(last=False)
+        return value
+
+    def evict_expired(self):
+        now = self._clock()
+        with self._lock:
+            for entries in self._entries.values():
+                for key in [key for key, (stored_at, _) in entries.items() if now - stored_at > self.ttl_seconds]:
+                    del entries[key]
+
+    def clear(self, func_name=None):
+        with self._lock:
+            if func_name is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(func_name, None)
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': {func_name: len(entries) for func_name, entries in self._entries.items()}}
+
+
+_default_cache = ComputationCache()
+
+
+def get_default_cache():
+    return _default_cache
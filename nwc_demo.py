@@ -0,0 +1,43 @@
+# --- Демо-данные и шаблон Excel ---
+# Статичные артефакты строятся один раз на процесс, а не при каждом запуске скрипта Streamlit
+# (app.py выполняется заново целиком, поэтому кэш держится здесь, в импортируемом модуле).
+# Демо-таблица отдается копией, поэтому вызывающий код может ее изменять; байты шаблона неизменяемы.
+import io
+from functools import lru_cache
+
+import pandas as pd
+
+TEMPLATE_SHEET_NAME = "Шаблон_ЧОК_Данные"
+
+
+def get_demo_data():
+    return _demo_data().copy()
+
+
+@lru_cache(maxsize=1)
+def _demo_data():
+    data = {
+        'Статья': [
+            'Денежные средства (ДС)', 'Дебиторская задолженность (ДЗ)',
+            'Сырье и материалы (СиМ)', 'Незавершенное производство (НЗП)', 'Готовая продукция (ГП)',
+            'Прочие оборотные активы',
+            'Кредиторская задолженность (КЗ)', 'Краткосрочные кредиты и займы',
+            'Налоги (к уплате)', 'Прочие краткосрочные обязательства'
+        ],
+        'Тип': ['ОА', 'ОА', 'ОА', 'ОА', 'ОА', 'ОА', 'КО', 'КО', 'КО', 'КО'],
+        'Q1 2024 Факт': [500, 1200, 300, 200, 400, 50,  700, 400, 50, 150],
+        'Q2 2024 Факт': [550, 1300, 320, 210, 420, 55,  750, 420, 60, 160],
+        'Q3 2024 Факт': [520, 1250, 310, 205, 405, 52,  720, 410, 55, 155],
+        'Q4 2024 Факт': [600, 1400, 350, 230, 450, 60,  800, 450, 70, 170],
+        'Q1 2025 Прогноз': [620, 1450, 360, 240, 460, 65, 820, 460, 75, 175]
+    }
+    return pd.DataFrame(data)
+
+
+@lru_cache(maxsize=1)
+def template_excel_bytes():
+    # Книга строится при первом скачивании шаблона: xlsxwriter импортируется только тогда
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        _demo_data().to_excel(writer, sheet_name=TEMPLATE_SHEET_NAME, index=False)
+    return output.getvalue()
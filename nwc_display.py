@@ -0,0 +1,124 @@
+# --- Отображение больших таблиц ---
+# Небольшие таблицы выводятся как раньше (pandas Styler). Styler превращает в HTML/JSON каждую ячейку,
+# поэтому для больших таблиц числа форматируются через column_config, а в браузер отправляется
+# только текущая страница: сортировка, фильтр по названию статьи и отбор топ-N выполняются на сервере.
+import os
+import re
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+LARGE_TABLE_CELLS = int(os.environ.get("NWC_LARGE_TABLE_CELLS", "20000"))
+PAGE_SIZES = [50, 100, 250, 500, 1000]
+DEFAULT_TOP_N = 100
+
+
+def is_large_table(df_data, max_cells=None):
+    return df_data.size > (LARGE_TABLE_CELLS if max_cells is None else max_cells)
+
+
+def styler_to_printf(style_format):
+    # "{:.2f}%" -> "%.2f%%" (формат NumberColumn)
+    match = re.fullmatch(r"\{:(\.\d+f)\}(.*)", style_format)
+    if not match:
+        return None
+    return f"%{match.group(1)}{match.group(2).replace('%', '%%')}"
+
+
+def _text_safe_format(style_format):
+    # Подписи вместо чисел (например, для бесконечности) выводятся как есть
+    return lambda value: value if isinstance(value, str) else style_format.format(value)
+
+
+def _label_infinite(df_data, formats, inf_label):
+    # Столбец с подписью вместо бесконечности форматируется заранее в текст: смешанный столбец
+    # (числа и строки) не сериализуется в Arrow напрямую
+    df_labeled = df_data
+    for col, style_format in formats.items():
+        if col in df_data.columns and pd.api.types.is_numeric_dtype(df_data[col]) and np.isposinf(df_data[col]).any():
+            if df_labeled is df_data:
+                df_labeled = df_data.copy()
+            df_labeled[col] = [inf_label if np.isposinf(value) else style_format.format(value) for value in df_data[col]]
+    return df_labeled
+
+
+def number_column_config(formats, help_texts=None):
+    config = {}
+    for col, style_format in (formats or {}).items():
+        printf_format = styler_to_printf(style_format)
+        if printf_format:
+            config[col] = st.column_config.NumberColumn(format=printf_format, help=(help_texts or {}).get(col))
+    return config
+
+
+def page_frame(df_data, name_filter=None, sort_column=None, ascending=True, top_n=None, top_n_column=None,
+               top_n_ascending=False, page=1, page_size=PAGE_SIZES[0], name_column='Статья'):
+    # Отбор строк для одной страницы. Возвращает (страница, строк после фильтра/топ-N, число страниц).
+    # Сортировка идет по позициям (argsort), поэтому копируется только итоговая страница.
+    positions = np.arange(len(df_data))
+    if name_filter and name_column in df_data.columns:
+        names = df_data[name_column].astype(str)
+        positions = positions[names.str.contains(name_filter, case=False, regex=False).to_numpy()]
+    if top_n and top_n_column in df_data.columns and len(positions) > top_n:
+        # Топ-N по модулю значения; пропуски в отбор не попадают
+        values = np.abs(pd.to_numeric(df_data[top_n_column], errors='coerce').to_numpy(dtype=np.float64)[positions])
+        values = np.where(np.isnan(values), np.inf if top_n_ascending else -np.inf, values)
+        order = np.argsort(values if top_n_ascending else -values, kind='stable')
+        positions = positions[np.sort(order[:top_n])]
+    if sort_column in df_data.columns:
+        sort_values = df_data[sort_column].iloc[positions]
+        order = np.argsort(sort_values.to_numpy(), kind='stable') if pd.api.types.is_numeric_dtype(sort_values) \
+            else np.argsort(sort_values.astype(str).to_numpy(), kind='stable')
+        if not ascending:
+            order = order[::-1]
+        positions = positions[order]
+        if pd.api.types.is_numeric_dtype(sort_values):
+            # Пропуски всегда в конце, как в sort_values
+            missing = np.isnan(sort_values.to_numpy(dtype=np.float64)[order])
+            positions = np.concatenate([positions[~missing], positions[missing]])
+    n_rows = len(positions)
+    n_pages = max(1, -(-n_rows // page_size))
+    page = min(max(1, page), n_pages)
+    page_positions = positions[(page - 1) * page_size:page * page_size]
+    return df_data.iloc[page_positions], n_rows, n_pages
+
+
+def show_table(df_data, formats=None, key="table", hide_index=False, top_n_column=None, top_n_ascending=False,
+               inf_label=None, max_cells=None):
+    # formats - форматы Styler ("{:.0f}", "{:.2f}%"); для больших таблиц переводятся в column_config.
+    # top_n_column - столбец для отбора топ-N (по модулю; top_n_ascending=True - наименьшие значения).
+    # inf_label - подпись для бесконечных значений (в малой таблице заменяет значение, в большой - в подсказке).
+    formats = formats or {}
+    if not is_large_table(df_data, max_cells):
+        df_small = _label_infinite(df_data, formats, inf_label) if inf_label else df_data
+        st.dataframe(df_small.style.format({col: _text_safe_format(style_format) for col, style_format in formats.items()}),
+                     hide_index=hide_index)
+        return
+
+    st.caption(f"Большая таблица ({len(df_data):,} строк): показывается постранично.".replace(",", " "))
+    control_col1, control_col2, control_col3, control_col4 = st.columns([3, 3, 1, 2])
+    name_filter = control_col1.text_input("Фильтр по статье:", key=f"{key}_filter")
+    sort_options = [""] + list(df_data.columns)
+    sort_column = control_col2.selectbox("Сортировка:", options=sort_options, format_func=lambda x: x or "Исходный порядок",
+                                         key=f"{key}_sort")
+    ascending = control_col3.toggle("По возр.", value=True, key=f"{key}_ascending")
+    page_size = control_col4.selectbox("Строк на странице:", options=PAGE_SIZES, key=f"{key}_page_size")
+    top_n = None
+    if top_n_column in df_data.columns:
+        top_label = "наименьших" if top_n_ascending else "наибольших"
+        if st.checkbox(f"Только топ-N {top_label} по «{top_n_column}»", key=f"{key}_top_enabled"):
+            top_n = int(st.number_input("N:", min_value=1, max_value=max(len(df_data), 1), value=min(DEFAULT_TOP_N, len(df_data)),
+                                        step=10, key=f"{key}_top_n"))
+
+    page = int(st.session_state.get(f"{key}_page", 1))
+    df_page, n_rows, n_pages = page_frame(df_data, name_filter, sort_column or None, ascending, top_n, top_n_column,
+                                          top_n_ascending, page, page_size)
+    help_texts = {col: f"inf: {inf_label}" for col in formats} if inf_label else None
+    st.dataframe(df_page, column_config=number_column_config(formats, help_texts), hide_index=hide_index)
+    page_col1, page_col2 = st.columns([1, 3])
+    # Номер страницы ограничивается после изменения фильтра/размера страницы
+    if page > n_pages:
+        st.session_state[f"{key}_page"] = n_pages
+    page_col1.number_input("Страница:", min_value=1, max_value=n_pages, step=1, key=f"{key}_page")
+    page_col2.caption(f"Строк: {n_rows:,}, страниц: {n_pages}".replace(",", " "))
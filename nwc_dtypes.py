@@ -0,0 +1,74 @@
+# --- Компактное представление таблицы статей ---
+# Статья, Тип и столбцы иерархии хранятся как категориальные (коды + словарь уникальных значений),
+# значения периодов - в выбранной точности (NWC_VALUE_PRECISION). Расчеты (nwc_engine, RollupTree,
+# Монте-Карло, бэктест) переводят нужные столбцы в float64 перед вычислением, поэтому точность хранения
+# влияет только на входные значения, а не на накопление ошибок в суммах:
+#   "float64"       - без потерь (по умолчанию);
+#   "float32"       - вдвое меньше памяти; относительная ошибка каждого значения не более 2^-24 (~6e-8),
+#                     ошибка итога (ОА, КО, ЧОК) не более 2^-24 * сумма модулей статей периода.
+#                     Например, при обороте статей 1e9 тыс. руб. - не более 60 тыс. руб.;
+#   "int_thousands" - значения округляются до целых тыс. руб. (Int32, пропуски сохраняются): ошибка значения
+#                     не более 0.5 тыс. руб., ошибка итога по n статьям - не более 0.5 * n тыс. руб.
+#                     Столбец, не помещающийся в Int32, остается в float64.
+# Консолидированные статьи верхних уровней иерархии (RollupTree.articles) складываются в той же точности,
+# поэтому для них граница ошибки удваивается (total_error_bound по таблице с отметкой CONSOLIDATED_ATTR).
+# Итоги узлов считаются в float64 и под это правило не попадают.
+import os
+
+import numpy as np
+import pandas as pd
+
+from nwc_hierarchy import CONSOLIDATED_ATTR, HIERARCHY_COLUMNS
+
+VALUE_PRECISIONS = {
+    "float64": "float64 (без потерь)",
+    "float32": "float32 (ошибка значения до 6e-8 отн.)",
+    "int_thousands": "целые тыс. руб. (ошибка значения до 0.5)",
+}
+DEFAULT_VALUE_PRECISION = os.environ.get("NWC_VALUE_PRECISION", "float64")
+CATEGORY_COLUMNS = ['Статья', 'Тип'] + HIERARCHY_COLUMNS
+FLOAT32_RELATIVE_ERROR = 2.0 ** -24
+INT32_LIMIT = np.iinfo(np.int32).max
+
+
+def compact_articles(df_articles, precision=DEFAULT_VALUE_PRECISION):
+    # Новая таблица в компактных типах; исходная не изменяется. df.attrs сохраняются
+    if precision not in VALUE_PRECISIONS:
+        raise ValueError(f"Неизвестная точность хранения: {precision}. Допустимые: {', '.join(VALUE_PRECISIONS)}")
+    columns = {}
+    for col in df_articles.columns:
+        series = df_articles[col]
+        if col in CATEGORY_COLUMNS:
+            columns[col] = series if isinstance(series.dtype, pd.CategoricalDtype) else series.astype('category')
+        elif precision == "float32" and pd.api.types.is_float_dtype(series):
+            columns[col] = series.astype(np.float32)
+        elif precision == "int_thousands" and pd.api.types.is_numeric_dtype(series):
+            rounded = np.round(series.to_numpy(dtype=np.float64))
+            fits = np.nanmax(np.abs(rounded), initial=0.0) <= INT32_LIMIT
+            missing = np.isnan(rounded)
+            columns[col] = pd.Series(pd.arrays.IntegerArray(np.where(missing, 0, rounded).astype(np.int32), missing), index=series.index) \
+                if fits else series.astype(np.float64)
+        else:
+            columns[col] = series
+    df_compact = pd.DataFrame(columns, index=df_articles.index)
+    df_compact.attrs.update(df_articles.attrs)
+    df_compact.attrs['value_precision'] = precision
+    return df_compact
+
+
+def total_error_bound(df_articles, columns, precision=None):
+    # Верхняя граница абсолютной ошибки итогов (ОА, КО, ЧОК) по каждому столбцу из-за точности хранения;
+    # для консолидированных статей (RollupTree.articles верхних уровней) - вдвое больше
+    precision = precision or df_articles.attrs.get('value_precision', "float64")
+    values = np.abs(df_articles[columns].to_numpy(dtype=np.float64))
+    factor = 2.0 if df_articles.attrs.get(CONSOLIDATED_ATTR) else 1.0
+    if precision == "float32":
+        return factor * np.nansum(values, axis=0) * FLOAT32_RELATIVE_ERROR
+    if precision == "int_thousands":
+        return factor * 0.5 * np.sum(~np.isnan(values), axis=0)
+    return np.zeros(len(columns))
+
+
+def article_names(df_articles):
+    # Столбец "Статья" для таблиц результатов: та же категориальная колонка (без копии списка названий)
+    return df_articles['Статья'].reset_index(drop=True)
@@ -0,0 +1,91 @@
+# --- Колоночный движок расчетов ЧОК ---
+# Все расчеты выполняются сразу по всем выбранным периодам как матричные операции NumPy
+# над массивом "статьи x периоды". Функции app.py (calculate_*) являются тонкими обертками
+# над этим модулем и возвращают те же числа, что и прежние построчные циклы iterrows.
+import numpy as np
+import pandas as pd
+
+TOTAL_NAMES = ['Итого ОА', 'Итого КО', 'ЧОК']
+MATERIALITY_METHODS = ["vs_CHOK", "vs_TotalComponents", "within_OA_CO"]
+
+
+class ArticleMatrix:
+    # Значения статей хранятся в Fortran-порядке (каждый период непрерывен в памяти):
+    # так суммы по столбцу совпадают побитно с pandas Series.sum().
+    def __init__(self, df_articles, columns):
+        self.columns = [col for col in columns if col in df_articles.columns]
+        self.values = np.asfortranarray(df_articles[self.columns].to_numpy(dtype=np.float64))
+        types = df_articles['Тип'].to_numpy()
+        self.is_oa = types == 'ОА'
+        self.is_co = types == 'КО'
+
+    def column_index(self, col_name):
+        return self.columns.index(col_name)
+
+    def column(self, col_name):
+        return self.values[:, self.column_index(col_name)]
+
+    def totals(self):
+        # Итого ОА / Итого КО / ЧОК для всех периодов: словарь массивов длины n_periods
+        oa_total = np.nansum(np.asfortranarray(self.values[self.is_oa]), axis=0)
+        co_total = np.nansum(np.asfortranarray(self.values[self.is_co]), axis=0)
+        return {'Итого ОА': oa_total, 'Итого КО': co_total, 'ЧОК': oa_total - co_total}
+
+    def materiality(self, method="vs_CHOK", totals=None):
+        # Матрица существенности (%) статьи x периоды. totals - словарь массивов как в totals()
+        if totals is None:
+            totals = self.totals()
+        n_rows, n_cols = self.values.shape
+        if method == "vs_CHOK":
+            base = np.broadcast_to(totals['ЧОК'], (n_rows, n_cols))
+        elif method == "vs_TotalComponents":
+            base_total_components = np.nansum(np.abs(self.values), axis=0)
+            base = np.broadcast_to(base_total_components, (n_rows, n_cols))
+        elif method == "within_OA_CO":
+            base = np.zeros((n_rows, n_cols))
+            base[self.is_oa] = totals['Итого ОА']
+            base[self.is_co] = totals['Итого КО']
+        else:
+            base = np.zeros((n_rows, n_cols))
+        return _safe_ratio_percent(np.abs(self.values), np.abs(base), invalid=np.isnan(self.values) | (base == 0))
+
+    def deviations(self, forecast_col_name, base_col_name):
+        # Абсолютные и относительные (%) отклонения прогноза от факта по каждой статье
+        return deviation_arrays(self.column(forecast_col_name), self.column(base_col_name))
+
+    def allowed_error_range(self, forecast_col_name, forecast_chok_value, wc_deviation_perc_limit=5):
+        # Макс. ошибка статьи (+/- %), при которой ЧОК отклонится не более чем на лимит
+        max_abs_wc_deviation_allowed = np.abs(forecast_chok_value * (wc_deviation_perc_limit / 100.0))
+        forecast_values = self.column(forecast_col_name)
+        error_range = _safe_ratio_percent(np.full(forecast_values.shape, max_abs_wc_deviation_allowed), np.abs(forecast_values),
+                                          invalid=np.isnan(forecast_values) | (forecast_values == 0), fill=np.inf)
+        return error_range, max_abs_wc_deviation_allowed
+
+
+def _safe_ratio_percent(numerator, denominator, invalid, fill=np.nan):
+    # (numerator / denominator) * 100 там, где invalid == False, иначе fill
+    result = np.full(np.shape(invalid), fill, dtype=np.float64)
+    valid = ~invalid
+    with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+        np.divide(numerator, denominator, out=result, where=valid)
+        np.multiply(result, 100, out=result, where=valid)
+    return result
+
+
+def deviation_arrays(forecast_values, base_values):
+    forecast_values = np.asarray(forecast_values, dtype=np.float64)
+    base_values = np.asarray(base_values, dtype=np.float64)
+    missing = np.isnan(forecast_values) | np.isnan(base_values)
+    with np.errstate(invalid='ignore', over='ignore'):
+        abs_dev = forecast_values - base_values
+    # Нулевой факт: отклонение не определено, если прогноз ненулевой, и равно 0 при нулевом прогнозе
+    rel_dev = _safe_ratio_percent(abs_dev, base_values, invalid=missing | (base_values == 0))
+    rel_dev[~missing & (base_values == 0) & (forecast_values == 0)] = 0.0
+    abs_dev[missing] = np.nan
+    return abs_dev, rel_dev
+
+
+def totals_to_arrays(period_totals_data, columns, default=0):
+    # Словарь {период: {показатель: значение}} -> словарь массивов по показателям
+    return {name: np.array([period_totals_data.get(col, {}).get(name, default) for col in columns], dtype=np.float64)
+            for name in TOTAL_NAMES}
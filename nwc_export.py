@@ -0,0 +1,174 @@
+# --- Выгрузка результатов ---
+# Файл формируется только по запросу и пишется сразу во временный файл на диске:
+# Excel - через xlsxwriter в режиме constant_memory (строки сбрасываются на диск по мере записи),
+# для машинной обработки - zip-архив CSV или Parquet (по файлу на лист).
+# Потоково только формирование файла: при скачивании Streamlit передает файл из памяти целиком
+# (read_export_file), поэтому приложение читает его лишь по нажатию кнопки скачивания.
+# Файлы старше NWC_EXPORT_TTL_SECONDS (в том числе оставшиеся от закрытых сессий) удаляются при следующей выгрузке.
+import glob
+import io
+import math
+import os
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from nwc_profiling import profiled
+
+EXPORT_FORMATS = {
+    "xlsx": {"label": "Excel (.xlsx)", "extension": ".xlsx",
+             "mime": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"},
+    "csv_zip": {"label": "CSV в zip-архиве", "extension": ".zip", "mime": "application/zip"},
+    "parquet_zip": {"label": "Parquet в zip-архиве", "extension": ".zip", "mime": "application/zip"},
+}
+ROWS_PER_BATCH = 10_000
+MAX_EXPORT_THREADS = int(os.environ.get("NWC_EXPORT_THREADS", "4"))
+EXPORT_FILE_PREFIX = "nwc_export_"
+EXPORT_FILE_TTL_SECONDS = float(os.environ.get("NWC_EXPORT_TTL_SECONDS", "3600"))
+# Листы с построчными таблицами по статьям выгружаются без индекса
+NO_INDEX_SHEET_PREFIXES = ("Данные_статьи", "Сущ_", "Отклонения_статьи", "Допустимые_ошибки", "Иерархия", "Бэктест",
+                          "Совместный_бюджет", "Чувствительность")
+
+
+def _exportable(dfs_dict):
+    return {sheet_name[:31]: df_data for sheet_name, df_data in dfs_dict.items()
+            if df_data is not None and isinstance(df_data, pd.DataFrame) and not df_data.empty}
+
+
+def _sheet_index_flag(safe_sheet_name, index=None):
+    if index is not None:
+        return index
+    return not safe_sheet_name.startswith(NO_INDEX_SHEET_PREFIXES)
+
+
+def dfs_to_excel_bytes(dfs_dict):
+    # Книга целиком в памяти (pandas + xlsxwriter); для небольших таблиц и обратной совместимости
+    output = io.BytesIO()
+    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+        for safe_sheet_name, df_data in _exportable(dfs_dict).items():
+            df_data.to_excel(writer, sheet_name=safe_sheet_name, index=_sheet_index_flag(safe_sheet_name))
+    return output.getvalue()
+
+
+def _excel_value(value):
+    # Как в pandas.to_excel: пропуски - пустая ячейка, бесконечность - текст "inf"/"-inf"
+    if value is None or value is pd.NA or value is pd.NaT:
+        return None
+    if isinstance(value, float):
+        if math.isnan(value):
+            return None
+        if math.isinf(value):
+            return "inf" if value > 0 else "-inf"
+    return value
+
+
+def _iter_rows(df_data, index):
+    for start in range(0, len(df_data), ROWS_PER_BATCH):
+        batch = df_data.iloc[start:start + ROWS_PER_BATCH]
+        columns = [batch.index.tolist()] if index else []
+        columns += [batch.iloc[:, i].tolist() for i in range(batch.shape[1])]
+        for row in zip(*columns):
+            yield [_excel_value(value) for value in row]
+
+
+def write_xlsx(dfs_dict, path, index=None, progress=None):
+    # Потоковая запись: в constant_memory строки должны идти строго по порядку, поэтому
+    # ячейки пишутся построчно напрямую через xlsxwriter (pandas пишет по столбцам).
+    # progress(доля, сообщение) вызывается после каждого блока строк (для фоновых задач nwc_tasks)
+    import xlsxwriter
+    sheets = _exportable(dfs_dict)
+    total_rows, rows_written = max(sum(len(df_data) for df_data in sheets.values()), 1), 0
+    workbook = xlsxwriter.Workbook(path, {'constant_memory': True, 'tmpdir': tempfile.gettempdir()})
+    try:
+        header_format = workbook.add_format({'bold': True, 'border': 1, 'align': 'center', 'valign': 'top'})
+        for safe_sheet_name, df_data in sheets.items():
+            worksheet = workbook.add_worksheet(safe_sheet_name)
+            with_index = _sheet_index_flag(safe_sheet_name, index)
+            header = ([df_data.index.name or ""] if with_index else []) + [str(col) for col in df_data.columns]
+            worksheet.write_row(0, 0, header, header_format)
+            for row_number, row in enumerate(_iter_rows(df_data, with_index), start=1):
+                worksheet.write_row(row_number, 0, row)
+                if progress is not None and row_number % ROWS_PER_BATCH == 0:
+                    progress((rows_written + row_number) / total_rows, f"лист {safe_sheet_name}")
+            rows_written += len(df_data)
+            if progress is not None:
+                progress(rows_written / total_rows, f"лист {safe_sheet_name}")
+    finally:
+        workbook.close()
+    return path
+
+
+def _csv_bytes(df_data, with_index):
+    return df_data.to_csv(index=with_index).encode('utf-8-sig')
+
+
+def _parquet_bytes(df_data, with_index):
+    output = io.BytesIO()
+    df_data.rename(columns=str).to_parquet(output, index=with_index)
+    return output.getvalue()
+
+
+def write_zip(dfs_dict, path, file_format="csv", index=None, progress=None):
+    # Листы сериализуются параллельно в пуле потоков (pyarrow и сжатие освобождают GIL),
+    # затем по одному добавляются в архив
+    sheets = _exportable(dfs_dict)
+    serializer, extension = (_parquet_bytes, ".parquet") if file_format == "parquet" else (_csv_bytes, ".csv")
+    with ThreadPoolExecutor(max_workers=max(1, min(MAX_EXPORT_THREADS, len(sheets)))) as pool:
+        futures = {sheet_name: pool.submit(serializer, df_data, _sheet_index_flag(sheet_name, index))
+                   for sheet_name, df_data in sheets.items()}
+        with zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+            for i, (sheet_name, future) in enumerate(futures.items(), start=1):
+                archive.writestr(f"{sheet_name}{extension}", future.result())
+                if progress is not None:
+                    progress(i / len(futures), f"файл {sheet_name}{extension}")
+    return path
+
+
+@profiled
+def export_to_tempfile(dfs_dict, export_format="xlsx", directory=None, progress=None):
+    # Возвращает путь к временному файлу; удаление - забота вызывающего кода (remove_export_file).
+    # Исключение из progress (например, отмена фоновой задачи) прерывает запись, файл удаляется.
+    sweep_export_files(directory)
+    extension = EXPORT_FORMATS[export_format]["extension"]
+    handle, path = tempfile.mkstemp(prefix=EXPORT_FILE_PREFIX, suffix=extension, dir=directory)
+    os.close(handle)
+    try:
+        if export_format == "xlsx":
+            write_xlsx(dfs_dict, path, progress=progress)
+        elif export_format == "csv_zip":
+            write_zip(dfs_dict, path, "csv", progress=progress)
+        elif export_format == "parquet_zip":
+            write_zip(dfs_dict, path, "parquet", progress=progress)
+        else:
+            raise ValueError(f"Неизвестный формат выгрузки: {export_format}")
+    except Exception:
+        remove_export_file(path)
+        raise
+    return path
+
+
+def remove_export_file(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+
+def read_export_file(path):
+    with open(path, 'rb') as export_file:
+        return export_file.read()
+
+
+def sweep_export_files(directory=None, ttl_seconds=EXPORT_FILE_TTL_SECONDS):
+    # Удаление файлов выгрузки старше ttl_seconds; возвращает число удаленных файлов
+    removed = 0
+    expired_before = time.time() - ttl_seconds
+    for path in glob.glob(os.path.join(directory or tempfile.gettempdir(), f"{EXPORT_FILE_PREFIX}*")):
+        try:
+            if os.path.getmtime(path) < expired_before:
+                os.remove(path)
+                removed += 1
+        except OSError:  # файл уже удален другой сессией
+            pass
+    return removed
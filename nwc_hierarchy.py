@@ -0,0 +1,109 @@
+# --- Консолидация группы компаний ---
+# Необязательные столбцы иерархии (Сегмент, Юрлицо) задают дерево: группа -> сегменты -> юрлица.
+# RollupTree за один сгруппированный проход считает Итого ОА / Итого КО / ЧОК для всех листьев
+# и сворачивает их вверх по дереву, поэтому переход между уровнями - поиск по словарю, а не пересчет.
+# Итоги узла возвращаются в формате calculate_period_totals и подходят для существенности и отклонений.
+import numpy as np
+import pandas as pd
+
+from nwc_engine import TOTAL_NAMES
+
+# Порядок - от верхнего уровня к нижнему
+HIERARCHY_COLUMNS = ['Сегмент', 'Юрлицо']
+ENTITY_COLUMN = 'Юрлицо'
+GROUP_LABEL = "Группа (все юрлица)"
+MISSING_LABEL = "—"
+# Отметка в df.attrs: статьи сложены по нескольким юрлицам (граница ошибки хранения удваивается, см. nwc_dtypes)
+CONSOLIDATED_ATTR = 'consolidated'
+
+
+def hierarchy_levels(df_articles):
+    return [col for col in HIERARCHY_COLUMNS if col in df_articles.columns]
+
+
+def node_label(node):
+    return GROUP_LABEL if not node else " / ".join(node)
+
+
+class RollupTree:
+    # node - кортеж значений уровней иерархии от верхнего: () - вся группа, ('Сегмент А',), ('Сегмент А', 'ЮЛ 1')
+    def __init__(self, df_articles, columns, levels=None):
+        self.df_articles = df_articles
+        self.levels = list(levels) if levels is not None else hierarchy_levels(df_articles)
+        self.columns = [col for col in columns if col in df_articles.columns]
+        keys = df_articles[self.levels].astype(object).where(df_articles[self.levels].notna(), MISSING_LABEL).astype(str)
+        if self.levels:
+            self.row_codes, leaves = pd.factorize(pd.MultiIndex.from_frame(keys))
+            self.leaves = [tuple(leaf) for leaf in leaves]
+        else:
+            self.row_codes, self.leaves = np.zeros(len(df_articles), dtype=np.intp), [()]
+        self._articles = {}
+        self._build()
+
+    def _build(self):
+        # Суммы листьев: строки упорядочиваются по листу (устойчиво) и складываются reduceat за один проход
+        values = np.nan_to_num(self.df_articles[self.columns].to_numpy(dtype=np.float64), nan=0.0)
+        types = self.df_articles['Тип'].to_numpy()
+        n_leaves = len(self.leaves)
+        leaf_oa = np.zeros((n_leaves, len(self.columns)))
+        leaf_co = np.zeros((n_leaves, len(self.columns)))
+        if len(values):
+            order = np.argsort(self.row_codes, kind='stable')
+            starts = np.flatnonzero(np.r_[True, np.diff(self.row_codes[order]) != 0])
+            present = self.row_codes[order][starts]
+            ordered_values, ordered_types = values[order], types[order]
+            leaf_oa[present] = np.add.reduceat(np.where((ordered_types == 'ОА')[:, None], ordered_values, 0.0), starts, axis=0)
+            leaf_co[present] = np.add.reduceat(np.where((ordered_types == 'КО')[:, None], ordered_values, 0.0), starts, axis=0)
+
+        # Свертка вверх: узел уровня k - префикс длины k значений листа
+        self.node_totals = {}
+        self.node_leaves = {}
+        for depth in range(len(self.levels) + 1):
+            prefix_index = {}
+            prefix_codes = np.array([prefix_index.setdefault(leaf[:depth], len(prefix_index)) for leaf in self.leaves], dtype=np.intp)
+            prefixes = list(prefix_index)
+            oa = np.zeros((len(prefixes), len(self.columns)))
+            co = np.zeros((len(prefixes), len(self.columns)))
+            np.add.at(oa, prefix_codes, leaf_oa)
+            np.add.at(co, prefix_codes, leaf_co)
+            for i, prefix in enumerate(prefixes):
+                self.node_totals[prefix] = (oa[i], co[i])
+                self.node_leaves[prefix] = np.flatnonzero(prefix_codes == i)
+
+    def nodes(self):
+        # Узлы в порядке обхода дерева (группа, сегмент, его юрлица, следующий сегмент...)
+        return sorted(self.node_totals)
+
+    def children(self, node):
+        return [child for child in self.nodes() if len(child) == len(node) + 1 and child[:len(node)] == tuple(node)]
+
+    def period_totals(self, node=(), columns=None):
+        # Итоги узла в формате calculate_period_totals: {период: {'Итого ОА', 'Итого КО', 'ЧОК'}}
+        oa, co = self.node_totals[tuple(node)]
+        return {col: dict(zip(TOTAL_NAMES, (oa[i], co[i], oa[i] - co[i]))) for i, col in enumerate(self.columns)
+                if columns is None or col in columns}
+
+    def articles(self, node=()):
+        # Статьи узла. Для листа - строки юрлица как есть; для верхних уровней статьи с одинаковыми
+        # названием и типом суммируются по юрлицам узла (пропуск остается пропуском, если нет ни одного значения).
+        node = tuple(node)
+        if node not in self._articles:
+            rows = np.isin(self.row_codes, self.node_leaves[node])
+            df_node = self.df_articles.loc[rows].drop(columns=self.levels)
+            if len(node) < len(self.levels):
+                value_columns = [col for col in df_node.columns if col not in ('Статья', 'Тип')]
+                df_node = df_node.groupby(['Статья', 'Тип'], sort=False)[value_columns].sum(min_count=1).reset_index()
+                df_node.attrs = {**df_node.attrs, CONSOLIDATED_ATTR: True}
+            self._articles[node] = df_node.reset_index(drop=True)
+        return self._articles[node]
+
+    def totals_frame(self, col_name):
+        # Итоги всех узлов за один период: для таблицы "Итоги по уровням иерархии"
+        i = self.columns.index(col_name)
+        rows = []
+        for node in self.nodes():
+            oa, co = self.node_totals[node]
+            level_values = {level: (node[k] if k < len(node) else "") for k, level in enumerate(self.levels)}
+            rows.append({'Уровень': len(node), 'Узел': node_label(node), **level_values,
+                         'Итого ОА': oa[i], 'Итого КО': co[i], 'ЧОК': oa[i] - co[i]})
+        return pd.DataFrame(rows)
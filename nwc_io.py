@@ -0,0 +1,158 @@
+# --- Быстрое чтение входных файлов ---
+# Excel читается через calamine (если установлен пакет python-calamine) или потоково через
+# openpyxl в режиме read-only; поддерживаются также CSV и Parquet.
+# Разобранные таблицы сохраняются в локальный Parquet-кэш с ключом по хэшу содержимого файла,
+# поэтому повторная загрузка того же файла (в том числе после перезапуска сервера) почти бесплатна.
+import csv
+import hashlib
+import importlib.util
+import io
+import os
+from pathlib import Path
+
+import pandas as pd
+
+EXCEL_EXTENSIONS = (".xlsx", ".xlsm", ".xls")
+CSV_EXTENSIONS = (".csv",)
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+SUPPORTED_EXTENSIONS = EXCEL_EXTENSIONS + CSV_EXTENSIONS + PARQUET_EXTENSIONS
+
+DEFAULT_PARSED_CACHE_DIR = os.environ.get("NWC_PARSED_CACHE_DIR", os.path.join(Path.home(), ".cache", "networkingcapital", "parsed"))
+DEFAULT_PARSED_CACHE_MAX_MB = float(os.environ.get("NWC_PARSED_CACHE_MAX_MB", "1024"))
+# Версия формата кэша: меняется при изменении правил разбора, чтобы не использовать устаревшие записи
+PARSED_CACHE_VERSION = "3"
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def has_calamine():
+    return importlib.util.find_spec("python_calamine") is not None
+
+
+def read_table(data, file_name):
+    # data: байты файла; тип определяется по расширению имени файла. Читается первый лист.
+    extension = os.path.splitext(str(file_name))[1].lower()
+    if extension in CSV_EXTENSIONS + PARQUET_EXTENSIONS:
+        # Длинный формат (Период / Сценарий / Значение) разворачивается в таблицу потоково
+        from nwc_longformat import is_long_format, peek_columns, read_long_table
+        if is_long_format(peek_columns(data, file_name)):
+            return read_long_table(data, file_name)
+    if extension in CSV_EXTENSIONS:
+        return read_csv_bytes(data)
+    if extension in PARQUET_EXTENSIONS:
+        return pd.read_parquet(io.BytesIO(data))
+    if extension in (".xlsx", ".xlsm"):
+        if has_calamine():
+            return pd.read_excel(io.BytesIO(data), sheet_name=0, engine="calamine")
+        return read_xlsx_streaming(data)
+    return pd.read_excel(io.BytesIO(data), sheet_name=0)
+
+
+def read_entity_sheets(data, file_name, entity_column="Юрлицо"):
+    # Книга "лист = юрлицо": все листы одинаковой структуры объединяются, имя листа - в столбец юрлица
+    extension = os.path.splitext(str(file_name))[1].lower()
+    if extension not in EXCEL_EXTENSIONS:
+        return read_table(data, file_name)
+    engine = "calamine" if extension in (".xlsx", ".xlsm") and has_calamine() else None
+    sheets = pd.read_excel(io.BytesIO(data), sheet_name=None, engine=engine)
+    frames = [df_sheet.assign(**{entity_column: str(sheet_name)}) for sheet_name, df_sheet in sheets.items() if not df_sheet.empty]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    return df[[entity_column] + [col for col in df.columns if col != entity_column]]
+
+
+def csv_dialect(data):
+    # Разделитель определяется по строке заголовка; для ";" десятичный разделитель - запятая (русская локаль Excel)
+    head = data[:65536].decode("utf-8-sig", errors="ignore")
+    first_line = head.splitlines()[0] if head else ""
+    try:
+        delimiter = csv.Sniffer().sniff(first_line, delimiters=";,\t").delimiter
+    except csv.Error:
+        delimiter = ","
+    return delimiter, "," if delimiter == ";" else "."
+
+
+def read_csv_bytes(data):
+    delimiter, decimal = csv_dialect(data)
+    return pd.read_csv(io.BytesIO(data), sep=delimiter, decimal=decimal, encoding="utf-8-sig")
+
+
+def read_xlsx_streaming(data):
+    # Потоковое чтение первого листа openpyxl в режиме read-only (без построения модели всей книги)
+    import openpyxl
+    workbook = openpyxl.load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, None)
+        if header is None:
+            return pd.DataFrame()
+        records = list(rows)
+    finally:
+        workbook.close()
+    # Пустые строки в конце листа (остатки форматирования) отбрасываются, как и в pd.read_excel
+    while records and all(value is None for value in records[-1]):
+        records.pop()
+    columns = [value if value is not None else f"Unnamed: {i}" for i, value in enumerate(header)]
+    df = pd.DataFrame.from_records(records, columns=columns)
+    # Пустые столбцы без заголовка справа также отбрасываются
+    while df.shape[1] and header[df.shape[1] - 1] is None and df.iloc[:, -1].isna().all():
+        df = df.iloc[:, :-1]
+    return df
+
+
+class ParsedCache:
+    # Каталог с разобранными и проверенными таблицами: <хэш содержимого>.parquet.
+    # При превышении лимита размера удаляются самые давно использованные файлы.
+    def __init__(self, cache_dir=DEFAULT_PARSED_CACHE_DIR, max_mb=DEFAULT_PARSED_CACHE_MAX_MB):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = int(max_mb * 1024 * 1024)
+
+    def _path(self, key):
+        return self.cache_dir / f"{key}-v{PARSED_CACHE_VERSION}.parquet"
+
+    def get(self, key):
+        path = self._path(key)
+        if not path.exists():
+            return None
+        try:
+            df = pd.read_parquet(path)
+            os.utime(path)  # отметка использования для вытеснения по давности
+            return df
+        except Exception:
+            path.unlink(missing_ok=True)
+            return None
+
+    def put(self, key, df):
+        # Parquet требует строковые названия столбцов; такие таблицы просто не кэшируются
+        if not all(isinstance(col, str) for col in df.columns):
+            return False
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            tmp_path = self._path(key).with_suffix(".tmp")
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, self._path(key))
+        except Exception:
+            return False
+        self.prune()
+        return True
+
+    def prune(self):
+        files = sorted(self.cache_dir.glob("*.parquet"), key=lambda path: path.stat().st_mtime, reverse=True)
+        used = 0
+        for path in files:
+            used += path.stat().st_size
+            if used > self.max_bytes:
+                path.unlink(missing_ok=True)
+
+
+_default_parsed_cache = None
+
+
+def get_default_parsed_cache():
+    global _default_parsed_cache
+    if _default_parsed_cache is None:
+        _default_parsed_cache = ParsedCache()
+    return _default_parsed_cache
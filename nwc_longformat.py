@@ -0,0 +1,173 @@
+# --- Входные данные в длинном формате ---
+# Выгрузки ERP: одна строка на значение - [Сегмент], [Юрлицо], Статья, Тип, Период, Сценарий, Значение.
+# Файл читается блоками (CSV - read_csv с chunksize, Parquet - пакетами строк), каждый блок сразу
+# раскладывается в матрицу "статьи x периоды", поэтому пиковая память определяется размером блока
+# и итоговой таблицы, а не числом строк файла. Повторяющиеся строки с одним ключом суммируются.
+#
+# Вид периода (факт/прогноз) берется из столбца "Сценарий" и сохраняется в df.attrs[PERIOD_KINDS_ATTR];
+# столбцы итоговой таблицы называются "<период> Факт" / "<период> Прогноз".
+#
+# Преобразование файла: python nwc_longformat.py выгрузка.csv -o таблица.parquet
+import io
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from nwc_hierarchy import HIERARCHY_COLUMNS
+from nwc_io import csv_dialect
+
+PERIOD_COLUMN = 'Период'
+SCENARIO_COLUMN = 'Сценарий'
+VALUE_COLUMN = 'Значение'
+KEY_COLUMNS = ['Статья', 'Тип']
+PERIOD_KINDS_ATTR = 'period_kinds'
+SCENARIO_ALIASES = {'факт': 'fact', 'fact': 'fact', 'actual': 'fact',
+                    'прогноз': 'forecast', 'forecast': 'forecast', 'план': 'forecast', 'plan': 'forecast'}
+SCENARIO_SUFFIXES = {'fact': 'Факт', 'forecast': 'Прогноз'}
+DEFAULT_CHUNK_ROWS = int(os.environ.get("NWC_LONG_CHUNK_ROWS", "500000"))
+
+
+def is_long_format(columns):
+    return all(col in columns for col in KEY_COLUMNS + [PERIOD_COLUMN, SCENARIO_COLUMN, VALUE_COLUMN])
+
+
+def peek_columns(data, file_name):
+    # Заголовок файла без чтения данных
+    extension = os.path.splitext(str(file_name))[1].lower()
+    if extension == ".csv":
+        delimiter, _ = csv_dialect(data)
+        header_line = data.split(b"\n", 1)[0]
+        return pd.read_csv(io.BytesIO(header_line), sep=delimiter, nrows=0, encoding="utf-8-sig").columns.tolist() if header_line.strip() else []
+    if extension in (".parquet", ".pq"):
+        import pyarrow.parquet as pq
+        return pq.read_schema(io.BytesIO(data)).names
+    return []
+
+
+def _period_label(value):
+    if isinstance(value, pd.Timestamp):
+        return value.strftime("%Y-%m")
+    return str(value).strip()
+
+
+class LongFormatPivot:
+    # Накопитель: блоки добавляются по мере чтения, матрица растет удвоением емкости
+    def __init__(self, row_columns):
+        self.row_columns = row_columns
+        self.row_index = {}  # ключ строки (иерархия..., статья, тип) -> номер строки
+        self.column_index = {}  # (период, вид) -> номер столбца
+        self.sums = np.zeros((0, 0))
+        self.seen = np.zeros((0, 0), dtype=bool)
+        self.unknown_scenarios = set()
+
+    def _codes(self, key_arrays, index):
+        # Коды блока: каждый столбец ключа факторизуется отдельно, составной ключ - целое число;
+        # в словарь глобальной нумерации попадают только уникальные ключи блока, а не все строки
+        combined = np.zeros(len(key_arrays[0]), dtype=np.int64)
+        column_codes, column_uniques = [], []
+        for values in key_arrays:
+            codes, uniques = pd.factorize(values)
+            combined = pd.factorize(combined * len(uniques) + codes)[0].astype(np.int64)
+            column_codes.append(codes)
+            column_uniques.append(np.asarray(uniques, dtype=object))
+        local_codes = combined
+        n_unique = int(local_codes.max()) + 1 if len(local_codes) else 0
+        first_rows = np.empty(n_unique, dtype=np.intp)
+        first_rows[local_codes[::-1]] = np.arange(len(local_codes))[::-1]
+        keys = zip(*[uniques[codes[first_rows]] for codes, uniques in zip(column_codes, column_uniques)])
+        mapping = np.array([index.setdefault(key, len(index)) for key in keys], dtype=np.intp)
+        return mapping[local_codes] if n_unique else np.zeros(0, dtype=np.intp)
+
+    def _ensure_capacity(self):
+        n_rows, n_cols = len(self.row_index), len(self.column_index)
+        cap_rows, cap_cols = self.sums.shape
+        if n_rows <= cap_rows and n_cols <= cap_cols:
+            return
+        new_shape = (max(n_rows, 2 * cap_rows, 16) if n_rows > cap_rows else cap_rows,
+                     max(n_cols, 2 * cap_cols, 8) if n_cols > cap_cols else cap_cols)
+        sums, seen = np.zeros(new_shape), np.zeros(new_shape, dtype=bool)
+        sums[:cap_rows, :cap_cols], seen[:cap_rows, :cap_cols] = self.sums, self.seen
+        self.sums, self.seen = sums, seen
+
+    def add_chunk(self, chunk):
+        # Сценарии и периоды переводятся по уникальным значениям блока, а не построчно
+        scenario_codes, scenarios = pd.factorize(chunk[SCENARIO_COLUMN])
+        scenario_kinds = np.array([SCENARIO_ALIASES.get(str(value).strip().lower()) for value in scenarios] + [None], dtype=object)
+        kinds = scenario_kinds[scenario_codes]  # код -1 (пустой сценарий) попадает на None
+        known = pd.notna(kinds)
+        if not known.all():
+            self.unknown_scenarios.update(str(value) for value, kind in zip(scenarios, scenario_kinds) if kind is None)
+            chunk, kinds = chunk.loc[known], kinds[known]
+        if chunk.empty:
+            return
+        period_codes, periods = pd.factorize(chunk[PERIOD_COLUMN])
+        period_labels = np.array([_period_label(value) for value in periods] + [""], dtype=object)[period_codes]
+        row_codes = self._codes([chunk[col].fillna("").astype(str).to_numpy() for col in self.row_columns], self.row_index)
+        column_codes = self._codes([period_labels, kinds], self.column_index)
+        self._ensure_capacity()
+        # Строка с пустым значением все равно создает статью и период (ячейка остается NaN)
+        values = pd.to_numeric(chunk[VALUE_COLUMN], errors='coerce').to_numpy(dtype=np.float64)
+        present = ~np.isnan(values)
+        flat = row_codes[present] * self.sums.shape[1] + column_codes[present]
+        np.add.at(self.sums.reshape(-1), flat, values[present])
+        self.seen.reshape(-1)[flat] = True
+
+    def result(self):
+        n_rows, n_cols = len(self.row_index), len(self.column_index)
+        values = np.where(self.seen[:n_rows, :n_cols], self.sums[:n_rows, :n_cols], np.nan)
+        column_names = [f"{period} {SCENARIO_SUFFIXES[kind]}" for period, kind in self.column_index]
+        df = pd.DataFrame(list(self.row_index), columns=self.row_columns)
+        df = pd.concat([df, pd.DataFrame(values, columns=column_names)], axis=1)
+        df.attrs[PERIOD_KINDS_ATTR] = {name: kind for name, (_, kind) in zip(column_names, self.column_index)}
+        return df
+
+
+def iter_long_chunks(data, file_name, chunk_rows=DEFAULT_CHUNK_ROWS):
+    # data: байты файла или путь
+    extension = os.path.splitext(str(file_name))[1].lower()
+    source = io.BytesIO(data) if isinstance(data, (bytes, bytearray)) else data
+    if extension in (".parquet", ".pq"):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+        return
+    if isinstance(data, (bytes, bytearray)):
+        head = data
+    else:
+        with open(data, 'rb') as source_file:
+            head = source_file.read(65536)
+    delimiter, decimal = csv_dialect(head)
+    yield from pd.read_csv(source, sep=delimiter, decimal=decimal, encoding="utf-8-sig", chunksize=chunk_rows,
+                           dtype={col: str for col in HIERARCHY_COLUMNS + KEY_COLUMNS + [PERIOD_COLUMN, SCENARIO_COLUMN]})
+
+
+def read_long_table(data, file_name, chunk_rows=DEFAULT_CHUNK_ROWS):
+    # Длинная таблица -> широкая (формат приложения) за один потоковый проход
+    pivot = None
+    for chunk in iter_long_chunks(data, file_name, chunk_rows):
+        if pivot is None:
+            pivot = LongFormatPivot([col for col in HIERARCHY_COLUMNS if col in chunk.columns] + KEY_COLUMNS)
+        pivot.add_chunk(chunk)
+    if pivot is None:
+        return pd.DataFrame(columns=KEY_COLUMNS)
+    df = pivot.result()
+    if pivot.unknown_scenarios:
+        df.attrs['unknown_scenarios'] = sorted(pivot.unknown_scenarios)
+    return df
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Преобразование длинной выгрузки (CSV/Parquet) в таблицу статьи x периоды.")
+    parser.add_argument("input", help="Файл в длинном формате")
+    parser.add_argument("-o", "--output", required=True, help="Итоговый файл (.parquet или .csv)")
+    parser.add_argument("--chunk-rows", type=int, default=DEFAULT_CHUNK_ROWS, help="Строк в блоке чтения")
+    args = parser.parse_args()
+    df_wide = read_long_table(args.input, args.input, args.chunk_rows)
+    if args.output.lower().endswith(".csv"):
+        df_wide.to_csv(args.output, index=False, encoding="utf-8-sig")
+    else:
+        df_wide.to_parquet(args.output, index=False)
+    print(f"Статей: {len(df_wide)}, периодов: {len(df_wide.attrs.get(PERIOD_KINDS_ATTR, {}))}", file=sys.stderr)
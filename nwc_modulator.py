@@ -0,0 +1,111 @@
+# --- Инкрементальный модулятор ошибок прогноза (Раздел 4.1) ---
+# Хранит базовый вектор прогноза и текущее отклонение ЧОК; при изменении ошибок пересчитываются
+# только изменившиеся строки (вклад строки в отклонение заменяется на новый), а не вся таблица.
+import numpy as np
+import pandas as pd
+
+ERROR_COLUMN = 'Ошибка (%)'
+
+
+class ErrorModulator:
+    def __init__(self, articles, types, forecast_values, key=None):
+        self.key = key  # для проверки, что модулятор построен для текущих данных и периода
+        self.articles = pd.Series(articles).reset_index(drop=True)
+        self.types = np.asarray(types, dtype=object)
+        self.forecast = np.asarray(forecast_values, dtype=np.float64)
+        signs = np.where(self.types == 'ОА', 1.0, np.where(self.types == 'КО', -1.0, 0.0))
+        # Строки без прогноза или с неизвестным типом не влияют на ЧОК
+        self._signs = np.where(np.isnan(self.forecast), 0.0, signs)
+        self.baseline_errors = np.zeros(len(self.forecast))  # ошибки, заложенные в таблицу редактора
+        self.errors = self.baseline_errors.copy()
+        self.modified = self.forecast.copy()
+        self._contributions = np.zeros(len(self.forecast))  # вклад строки в отклонение ЧОК (может быть NaN)
+        self._finite_sum = 0.0
+        self._nan_rows = 0
+        self._dirty_rows = set()  # строки, где ошибка отличается от baseline_errors
+        self._editor_frame = None
+
+    def __len__(self):
+        return len(self.forecast)
+
+    @property
+    def chok_deviation(self):
+        # NaN, если хотя бы у одной строки с прогнозом не задана ошибка (как в построчном расчете)
+        return np.nan if self._nan_rows else self._finite_sum
+
+    def deviation_percentage(self, forecast_chok_value):
+        return (self.chok_deviation / forecast_chok_value) * 100 if forecast_chok_value != 0 else 0
+
+    def set_errors(self, rows, error_percentages):
+        # Применяет ошибки к строкам rows; пересчитываются только строки с изменившимся значением
+        rows = np.asarray(rows, dtype=np.int64).reshape(-1)
+        new_errors = np.broadcast_to(np.asarray(error_percentages, dtype=np.float64), rows.shape)
+        # Повторяющаяся строка учитывается один раз, с последним значением (как при поочередном присваивании)
+        rows, last_positions = np.unique(rows[::-1], return_index=True)
+        new_errors = new_errors[::-1][last_positions]
+        old_errors = self.errors[rows]
+        changed = ~((new_errors == old_errors) | (np.isnan(new_errors) & np.isnan(old_errors)))
+        rows, new_errors = rows[changed], new_errors[changed]
+        if not len(rows):
+            return 0
+        forecast = self.forecast[rows]
+        with np.errstate(invalid='ignore', over='ignore'):
+            modified = forecast * (1 + new_errors / 100)
+            contributions = np.where(self._signs[rows] != 0, (modified - forecast) * self._signs[rows], 0.0)
+        old_contributions = self._contributions[rows]
+        self._finite_sum += np.nansum(contributions) - np.nansum(old_contributions)
+        self._nan_rows += int(np.isnan(contributions).sum() - np.isnan(old_contributions).sum())
+        self.errors[rows] = new_errors
+        self.modified[rows] = modified
+        self._contributions[rows] = contributions
+        for row, error in zip(rows.tolist(), new_errors.tolist()):
+            baseline = self.baseline_errors[row]
+            if error == baseline or (np.isnan(error) and np.isnan(baseline)):
+                self._dirty_rows.discard(row)
+            else:
+                self._dirty_rows.add(row)
+        return len(rows)
+
+    def apply_editor_edits(self, edited_rows, column=ERROR_COLUMN):
+        # edited_rows - накопленные правки st.data_editor ({номер строки: {столбец: значение}}).
+        # Строки, правка которых отменена, возвращаются к значению из таблицы редактора.
+        target = {}
+        for row in self._dirty_rows:
+            target[row] = self.baseline_errors[row]
+        for row, values in edited_rows.items():
+            if column in values:
+                value = values[column]
+                target[int(row)] = np.nan if value is None else float(value)
+        if not target:
+            return 0
+        rows = np.fromiter(target.keys(), dtype=np.int64, count=len(target))
+        return self.set_errors(rows, np.fromiter(target.values(), dtype=np.float64, count=len(target)))
+
+    def bulk_set(self, error_percentage, mask):
+        # Массовая правка: одна и та же ошибка (%) для всех строк, отобранных маской
+        return self.set_errors(np.flatnonzero(np.asarray(mask, dtype=bool)), error_percentage)
+
+    def commit_baseline(self):
+        # Текущие ошибки становятся исходными значениями таблицы редактора
+        self.baseline_errors = self.errors.copy()
+        self._dirty_rows.clear()
+        self._editor_frame = None
+
+    def article_mask(self, type_filter=None, name_contains=None):
+        mask = np.ones(len(self), dtype=bool)
+        if type_filter:
+            mask &= self.types == type_filter
+        if name_contains:
+            mask &= self.articles.astype(str).str.contains(name_contains, case=False, regex=False).to_numpy()
+        return mask
+
+    def editor_frame(self):
+        # Таблица для st.data_editor; строится только при смене исходных ошибок, чтобы редактор сохранял правки
+        if self._editor_frame is None:
+            self._editor_frame = pd.DataFrame({'Статья': self.articles, 'Тип': self.types, 'Прогноз': self.forecast,
+                                               ERROR_COLUMN: self.baseline_errors.copy()})
+        return self._editor_frame
+
+    def result_frame(self):
+        return pd.DataFrame({'Статья': self.articles, 'Прогноз': self.forecast, ERROR_COLUMN: self.errors,
+                             'С учетом ошибки': self.modified})
@@ -0,0 +1,225 @@
+# --- Моделирование Монте-Карло влияния ошибок прогноза на ЧОК ---
+# В отличие от Раздела 4 (ошибается одна статья) здесь ошибки задаются сразу для всех статей:
+# для каждого сценария выбирается вектор относительных ошибок из заданного распределения,
+# и рассчитывается отклонение ЧОК. Сценарии обрабатываются блоками (память ограничена размером блока),
+# блоки можно распределить по процессам. Каждый блок получает собственное зерно генератора,
+# поэтому результат не зависит от числа процессов.
+#
+# Процессы общие для всех сессий: один пул на процесс сервера, не больше MC_MAX_WORKERS процессов
+# (NWC_MC_MAX_WORKERS, по умолчанию - число ядер). n_workers задает только число частей расчета,
+# поэтому одновременные запуски разных пользователей делят одни и те же процессы.
+import os
+import threading
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from nwc_dtypes import article_names
+from nwc_periods import PeriodIndex
+from nwc_profiling import profiled
+
+DISTRIBUTIONS = ["normal", "t", "laplace", "uniform"]
+DISTRIBUTION_LABELS = {"normal": "Нормальное", "t": "Стьюдента (тяжелые хвосты, 4 ст. св.)",
+                       "laplace": "Лапласа", "uniform": "Равномерное"}
+T_DEGREES_OF_FREEDOM = 4
+DEFAULT_CHUNK_MEMORY_MB = 64
+QUANTILE_LEVELS = (0.01, 0.05, 0.5, 0.95, 0.99)
+HISTOGRAM_BINS = 50
+PROGRESS_POLL_SECONDS = 0.25  # как часто многопроцессный расчет сообщает прогресс (и проверяет отмену)
+CPU_COUNT = os.cpu_count() or 1
+MC_MAX_WORKERS = max(1, min(int(os.environ.get("NWC_MC_MAX_WORKERS", "0")) or CPU_COUNT, CPU_COUNT))
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_process_pool():
+    # Общий пул процессов, создается при первом многопроцессном расчете
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=MC_MAX_WORKERS)
+        return _pool
+
+
+def _discard_process_pool(pool):
+    # Сломанный пул (процесс завершился аварийно) заменяется новым при следующем расчете
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _standard_draws(rng, distribution, shape):
+    # Выборка с нулевым средним и единичной дисперсией
+    if distribution == "normal":
+        return rng.standard_normal(shape)
+    if distribution == "t":
+        return rng.standard_t(T_DEGREES_OF_FREEDOM, shape) * np.sqrt((T_DEGREES_OF_FREEDOM - 2) / T_DEGREES_OF_FREEDOM)
+    if distribution == "laplace":
+        return rng.laplace(0.0, 1.0 / np.sqrt(2.0), shape)
+    if distribution == "uniform":
+        return rng.uniform(-np.sqrt(3.0), np.sqrt(3.0), shape)
+    raise ValueError(f"Неизвестное распределение: {distribution}")
+
+
+def estimate_error_sigmas(df_articles, fact_columns, forecast_columns):
+    # Стандартное отклонение относительной ошибки (%) по каждой статье.
+    # Источник 1: пары "прогноз - факт" одного периода (по индексу периодов).
+    # Источник 2 (если пар нет): изменчивость факта между соседними периодами.
+    # Возвращает (массив сигм в %, описание источника).
+    matches = PeriodIndex(list(fact_columns) + list(forecast_columns)).matching_facts(forecast_columns)
+    pairs = [(forecast, fact) for forecast, fact in matches.items() if fact is not None]
+    if pairs:
+        forecast_values = df_articles[[forecast for forecast, _ in pairs]].to_numpy(dtype=np.float64)
+        fact_values = df_articles[[fact for _, fact in pairs]].to_numpy(dtype=np.float64)
+        source = f"история прогноз/факт ({len(pairs)} пар)"
+    elif len(fact_columns) >= 2:
+        values = df_articles[fact_columns].to_numpy(dtype=np.float64)
+        forecast_values, fact_values = values[:, :-1], values[:, 1:]
+        source = f"изменчивость факта ({len(fact_columns) - 1} изменений)"
+    else:
+        return np.zeros(len(df_articles)), "нет истории"
+    with np.errstate(divide='ignore', invalid='ignore'):
+        relative_errors = (forecast_values - fact_values) / np.abs(fact_values) * 100
+    relative_errors[~np.isfinite(relative_errors)] = np.nan
+    # Среднеквадратичная ошибка (с учетом смещения): для одной пары это модуль ошибки
+    with np.errstate(invalid='ignore'):
+        counts = np.sum(~np.isnan(relative_errors), axis=1)
+        sigmas = np.sqrt(np.nansum(relative_errors ** 2, axis=1) / np.maximum(counts, 1))
+    sigmas[counts == 0] = 0.0
+    return sigmas, source
+
+
+def _chunk_sizes(n_scenarios, chunk_size):
+    full, rest = divmod(n_scenarios, chunk_size)
+    return [chunk_size] * full + ([rest] if rest else [])
+
+
+def auto_chunk_size(n_articles, memory_mb=DEFAULT_CHUNK_MEMORY_MB):
+    # В памяти одновременно ~3 матрицы "сценарии x статьи" float64
+    return max(1, int(memory_mb * 1024 * 1024 // (8 * 3 * max(n_articles, 1))))
+
+
+def _simulate_chunks(signed_values, sigma_fractions, bias_fractions, distribution, chunk_sizes, seeds, progress=None):
+    # Обработка списка блоков: отклонения ЧОК по сценариям и суммы для ковариаций вкладов статей.
+    # progress(доля) - после каждого блока (только в текущем процессе)
+    n_articles = len(signed_values)
+    deviations = []
+    sum_contrib = np.zeros(n_articles)
+    sum_contrib_dev = np.zeros(n_articles)
+    for i, (size, seed) in enumerate(zip(chunk_sizes, seeds)):
+        if progress is not None:
+            progress(i / len(chunk_sizes))
+        rng = np.random.default_rng(seed)
+        contributions = _standard_draws(rng, distribution, (size, n_articles))
+        contributions *= sigma_fractions
+        contributions += bias_fractions
+        contributions *= signed_values  # вклад статьи в отклонение ЧОК (ОА со знаком +, КО со знаком -)
+        chunk_deviation = contributions.sum(axis=1)
+        deviations.append(chunk_deviation)
+        sum_contrib += contributions.sum(axis=0)
+        sum_contrib_dev += chunk_deviation @ contributions
+    return np.concatenate(deviations) if deviations else np.zeros(0), sum_contrib, sum_contrib_dev
+
+
+@dataclass
+class MonteCarloResult:
+    deviations: np.ndarray  # отклонение ЧОК (тыс. руб.) по сценариям
+    deviation_percentages: np.ndarray  # то же в % от прогнозного ЧОК
+    breach_probability: float
+    contributions: pd.DataFrame  # вклад статей в дисперсию отклонения ЧОК
+    forecast_chok_value: float
+    limit_percentage: float
+
+    def quantiles(self, levels=QUANTILE_LEVELS):
+        return {level: float(np.quantile(self.deviations, level)) for level in levels}
+
+    def histogram(self, bins=HISTOGRAM_BINS):
+        counts, edges = np.histogram(self.deviation_percentages[np.isfinite(self.deviation_percentages)], bins=bins)
+        centers = (edges[:-1] + edges[1:]) / 2
+        return pd.DataFrame({'Отклонение ЧОК (%)': np.round(centers, 2), 'Сценариев': counts})
+
+    def summary(self, levels=QUANTILE_LEVELS, bins=HISTOGRAM_BINS):
+        # Итоги без массивов сценариев (до 5 млн значений на массив): то, что хранится в кэше и в сессии
+        return MonteCarloSummary(n_scenarios=len(self.deviations), breach_probability=self.breach_probability,
+                                 quantiles=self.quantiles(levels), histogram=self.histogram(bins), contributions=self.contributions,
+                                 forecast_chok_value=self.forecast_chok_value, limit_percentage=self.limit_percentage)
+
+
+@dataclass
+class MonteCarloSummary:
+    n_scenarios: int
+    breach_probability: float
+    quantiles: dict  # уровень -> отклонение ЧОК (тыс. руб.)
+    histogram: pd.DataFrame  # распределение отклонения ЧОК (%)
+    contributions: pd.DataFrame
+    forecast_chok_value: float
+    limit_percentage: float
+
+
+@profiled
+def simulate_chok_deviation(df_articles, forecast_col_name, forecast_chok_value, sigma_percentages,
+                            limit_percentage=5, n_scenarios=100_000, distribution="normal", bias_percentages=0.0,
+                            seed=None, chunk_size=None, n_workers=1, progress=None):
+    # sigma_percentages / bias_percentages: СКО и смещение относительной ошибки каждой статьи (% от прогноза).
+    # progress(доля) - необязательный обратный вызов для фоновых задач; его исключение прерывает расчет
+    forecast_values = df_articles[forecast_col_name].to_numpy(dtype=np.float64)
+    types = df_articles['Тип'].to_numpy()
+    signs = np.where(types == 'ОА', 1.0, np.where(types == 'КО', -1.0, 0.0))
+    signed_values = np.nan_to_num(forecast_values * signs, nan=0.0)
+    n_articles = len(signed_values)
+    sigma_fractions = np.nan_to_num(np.broadcast_to(np.asarray(sigma_percentages, dtype=np.float64), (n_articles,)) / 100.0)
+    bias_fractions = np.nan_to_num(np.broadcast_to(np.asarray(bias_percentages, dtype=np.float64), (n_articles,)) / 100.0)
+
+    chunk_sizes = _chunk_sizes(int(n_scenarios), chunk_size or auto_chunk_size(n_articles))
+    seeds = np.random.SeedSequence(seed).spawn(len(chunk_sizes))
+    args = (signed_values, sigma_fractions, bias_fractions, distribution)
+    n_workers = min(n_workers or 1, MC_MAX_WORKERS)
+    if n_workers > 1 and len(chunk_sizes) > 1:
+        # Блоки делятся на части непрерывными отрезками, порядок сценариев сохраняется
+        bounds = np.linspace(0, len(chunk_sizes), min(n_workers, len(chunk_sizes)) + 1).astype(int)
+        pool, futures = get_process_pool(), []
+        try:
+            futures = [pool.submit(_simulate_chunks, *args, chunk_sizes[start:stop], seeds[start:stop])
+                       for start, stop in zip(bounds[:-1], bounds[1:])]
+            pending = set(futures)
+            while pending:
+                # progress вызывается и пока части считаются: отмена (исключение из progress) не ждет их завершения
+                _, pending = wait(pending, timeout=PROGRESS_POLL_SECONDS, return_when=FIRST_COMPLETED)
+                if progress is not None:
+                    progress(1 - len(pending) / len(futures))
+            parts = [future.result() for future in futures]
+        except BaseException as error:
+            # Ожидающие части снимаются без ожидания; уже начатые части досчитываются в фоне.
+            # Общий пул остается для других расчетов, если он не сломан
+            for future in futures:
+                future.cancel()
+            if isinstance(error, BrokenProcessPool):
+                _discard_process_pool(pool)
+            raise
+        deviations = np.concatenate([part[0] for part in parts])
+        sum_contrib = np.sum([part[1] for part in parts], axis=0)
+        sum_contrib_dev = np.sum([part[2] for part in parts], axis=0)
+    else:
+        deviations, sum_contrib, sum_contrib_dev = _simulate_chunks(*args, chunk_sizes, seeds, progress)
+
+    # Вклад статьи в дисперсию = cov(вклад статьи, отклонение ЧОК); сумма вкладов равна дисперсии
+    n = len(deviations)
+    covariances = (sum_contrib_dev - sum_contrib * deviations.sum() / n) / max(n - 1, 1)
+    total_variance = deviations.var(ddof=1) if n > 1 else np.nan
+    with np.errstate(divide='ignore', invalid='ignore'):
+        deviation_percentages = deviations / forecast_chok_value * 100 if forecast_chok_value != 0 else np.full(n, np.nan)
+        shares = covariances / total_variance * 100
+    contributions = pd.DataFrame({
+        'Статья': article_names(df_articles), 'Тип': types, 'Прогноз': forecast_values,
+        'СКО ошибки (%)': sigma_fractions * 100, 'Вклад в дисперсию': covariances, 'Доля в дисперсии (%)': shares,
+    }).sort_values('Доля в дисперсии (%)', ascending=False, ignore_index=True)
+    breach_probability = float(np.mean(np.abs(deviation_percentages) > limit_percentage)) if n else np.nan
+    return MonteCarloResult(deviations=deviations, deviation_percentages=deviation_percentages,
+                            breach_probability=breach_probability, contributions=contributions,
+                            forecast_chok_value=forecast_chok_value, limit_percentage=limit_percentage)
@@ -0,0 +1,149 @@
+# --- Индекс периодов ---
+# Заголовки столбцов разбираются один раз в типизированные периоды (месяц / квартал / год + факт / прогноз).
+# Столбцы хранятся в хронологическом порядке (а не в лексическом, где "Q1 2025" идет раньше "Q2 2024"),
+# выбор диапазона - двоичным поиском по номеру последнего месяца периода, а сопоставление прогнозов
+# с фактами того же периода - одним searchsorted по всем прогнозам.
+import bisect
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+
+from nwc_hierarchy import HIERARCHY_COLUMNS
+
+# freq: "M" | "Q" | "Y" | None (не распознан); end_month - номер последнего месяца периода (год * 12 + месяц - 1)
+Period = namedtuple('Period', ['column', 'kind', 'freq', 'year', 'number', 'end_month', 'label'])
+
+FREQ_ORDER = {"M": 0, "Q": 1, "Y": 2, None: 3}
+MONTH_PREFIXES = {
+    'янв': 1, 'фев': 2, 'мар': 3, 'апр': 4, 'май': 5, 'мая': 5, 'июн': 6, 'июл': 7, 'авг': 8, 'сен': 9, 'окт': 10, 'ноя': 11, 'дек': 12,
+    'jan': 1, 'feb': 2, 'mar': 3, 'apr': 4, 'may': 5, 'jun': 6, 'jul': 7, 'aug': 8, 'sep': 9, 'oct': 10, 'nov': 11, 'dec': 12,
+}
+_KIND_WORDS = re.compile(r"факт|прогноз", re.IGNORECASE)
+_YEAR = r"((?:19|20)\d{2})"
+_QUARTER_PATTERNS = [
+    re.compile(rf"^q([1-4])\W*{_YEAR}$"), re.compile(rf"^{_YEAR}\W*q([1-4])$"), re.compile(rf"^([1-4])\s*(?:кв\.?|квартал)\s*{_YEAR}$"),
+    re.compile(rf"^(?:кв\.?|квартал)\s*([1-4])\s*{_YEAR}$"), re.compile(rf"^{_YEAR}\s*(?:кв\.?|квартал)\s*([1-4])$"),
+]
+_NUMERIC_MONTH_PATTERNS = [
+    re.compile(rf"^{_YEAR}[-./](\d{{1,2}})(?:[-./]\d{{1,2}})?$"),  # 2024-01, 2024-01-31
+    re.compile(rf"^(?:\d{{1,2}}[-./])?(\d{{1,2}})[-./]{_YEAR}$"),  # 01.2024, 31.01.2024
+]
+_NAMED_MONTH = re.compile(rf"^([a-zа-яё]+)\.?\s*{_YEAR}$")
+_YEAR_ONLY = re.compile(rf"^(?:год\s*)?{_YEAR}(?:\s*год)?$")
+# Столбцы таблицы статей, не являющиеся периодами
+NON_PERIOD_COLUMNS = ['Статья', 'Тип'] + HIERARCHY_COLUMNS
+
+
+def column_kind(col_name, period_kinds=None):
+    # Вид периода: из столбца "Сценарий" длинного формата, иначе по ключевому слову в названии
+    if period_kinds and col_name in period_kinds:
+        return period_kinds[col_name]
+    lowered = str(col_name).lower()
+    if "факт" in lowered:
+        return "fact"
+    if "прогноз" in lowered:
+        return "forecast"
+    return None
+
+
+@lru_cache(maxsize=65536)
+def parse_period_label(label):
+    # "Янв 2024", "Q1 2025", "1 кв. 2025", "2024-03", "03.2024", "2024" -> (freq, год, номер месяца/квартала)
+    text = " ".join(_KIND_WORDS.sub(" ", str(label)).lower().replace("ё", "е").split())
+    for pattern in _QUARTER_PATTERNS:
+        match = pattern.match(text)
+        if match:
+            groups = match.groups()
+            quarter, year = (groups[0], groups[1]) if len(groups[0]) == 1 else (groups[1], groups[0])
+            return "Q", int(year), int(quarter)
+    for i, pattern in enumerate(_NUMERIC_MONTH_PATTERNS):
+        match = pattern.match(text)
+        if match:
+            year, month = (match.group(1), match.group(2)) if i == 0 else (match.group(2), match.group(1))
+            if 1 <= int(month) <= 12:
+                return "M", int(year), int(month)
+    match = _NAMED_MONTH.match(text)
+    if match and match.group(1)[:3] in MONTH_PREFIXES:
+        return "M", int(match.group(2)), MONTH_PREFIXES[match.group(1)[:3]]
+    match = _YEAR_ONLY.match(text)
+    if match:
+        return "Y", int(match.group(1)), 1
+    return None, None, None
+
+
+def parse_period(col_name, period_kinds=None):
+    freq, year, number = parse_period_label(col_name)
+    end_month = None
+    if freq == "M":
+        end_month = year * 12 + number - 1
+    elif freq == "Q":
+        end_month = year * 12 + number * 3 - 1
+    elif freq == "Y":
+        end_month = year * 12 + 11
+    label = " ".join(_KIND_WORDS.sub(" ", str(col_name)).split())
+    return Period(col_name, column_kind(col_name, period_kinds), freq, year, number, end_month, label)
+
+
+def _sort_key(period):
+    # Нераспознанные периоды идут после распознанных в исходном порядке (sorted устойчив)
+    return (period.end_month is None, period.end_month or 0, FREQ_ORDER[period.freq])
+
+
+class PeriodIndex:
+    def __init__(self, columns, period_kinds=None):
+        periods = [parse_period(col, period_kinds) for col in columns]
+        self.periods = sorted(periods, key=_sort_key)
+        self.by_column = {period.column: period for period in self.periods}
+        self.position = {period.column: i for i, period in enumerate(self.periods)}
+        self.facts = [period.column for period in self.periods if period.kind == "fact"]
+        self.forecasts = [period.column for period in self.periods if period.kind == "forecast"]
+        self.unparsed = [period.column for period in self.periods if period.freq is None]
+        label_codes = {}
+        self._codes = {period.column: (period.end_month * 4 + FREQ_ORDER[period.freq]) if period.freq is not None
+                       else -1 - label_codes.setdefault(period.label.lower(), len(label_codes)) for period in self.periods}
+        # Для двоичного поиска: распознанные факты по возрастанию последнего месяца
+        self._fact_end_months = [self.by_column[col].end_month for col in self.facts if self.by_column[col].end_month is not None]
+        self._dated_facts = [col for col in self.facts if self.by_column[col].end_month is not None]
+
+    @classmethod
+    def from_frame(cls, df_articles, exclude=NON_PERIOD_COLUMNS):
+        columns = [col for col in df_articles.columns if col not in exclude]
+        return cls(columns, df_articles.attrs.get('period_kinds'))
+
+    def ordered(self, columns):
+        # Хронологический порядок произвольного набора столбцов (неизвестные столбцы - в конце)
+        return sorted(dict.fromkeys(columns), key=lambda col: self.position.get(col, len(self.position)))
+
+    def facts_between(self, start_month=None, end_month=None):
+        # Факты, последний месяц которых в [start_month, end_month]; O(log n) поиск границ
+        lo = 0 if start_month is None else bisect.bisect_left(self._fact_end_months, start_month)
+        hi = len(self._fact_end_months) if end_month is None else bisect.bisect_right(self._fact_end_months, end_month)
+        return self._dated_facts[lo:hi]
+
+    def last_facts(self, months):
+        # Факты за последние `months` месяцев до последнего фактического периода включительно
+        if not self._fact_end_months:
+            return list(self.facts)
+        last = self._fact_end_months[-1]
+        return self.facts_between(last - months + 1, last)
+
+    def period_codes(self, columns):
+        # Целочисленный код периода без учета вида (факт/прогноз): равные коды - один и тот же период.
+        # Распознанные: последний месяц * 4 + частота; нераспознанные - отрицательные коды по тексту названия.
+        return np.array([self._codes[col] for col in columns], dtype=np.int64)
+
+    def matching_facts(self, forecast_columns=None):
+        # Для каждого прогноза - факт того же периода (та же частота и тот же период) или None:
+        # один searchsorted кодов всех прогнозов по отсортированным кодам фактов
+        forecast_columns = self.forecasts if forecast_columns is None else list(forecast_columns)
+        if not self.facts or not forecast_columns:
+            return {col: None for col in forecast_columns}
+        fact_codes = self.period_codes(self.facts)
+        order = np.argsort(fact_codes, kind='stable')
+        sorted_codes = fact_codes[order]
+        query = self.period_codes(forecast_columns)
+        positions = np.minimum(np.searchsorted(sorted_codes, query), len(sorted_codes) - 1)
+        found = sorted_codes[positions] == query
+        return {col: (self.facts[order[positions[i]]] if found[i] else None) for i, col in enumerate(forecast_columns)}
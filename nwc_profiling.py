@@ -0,0 +1,256 @@
+# --- Замеры времени этапов обработки ---
+# Легковесные замеры: этапы main() и функции calculate_* записываются в профиль текущего запуска
+# (если он открыт), по желанию - с пиком памяти tracemalloc. По окончании запуска профиль выводится
+# одной JSON-строкой в журнал "nwc.perf", чтобы собирать p50/p95 по этапам между сессиями.
+#
+# Журнал: переменная окружения NWC_PERF_LOG = "stderr" или путь к файлу.
+# Первый запуск скрипта в процессе записывается как "startup" (холодный старт: импорт модулей, демо-данные),
+# остальные - как "rerun". Для них задаются бюджеты времени NWC_STARTUP_BUDGET_MS и NWC_RERUN_BUDGET_MS:
+# запуск сверх бюджета отмечается в записи журнала (over_budget) и предупреждением в логе "nwc.perf".
+# Сводка по журналу: python nwc_profiling.py perf.log
+import contextvars
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+
+perf_logger = logging.getLogger("nwc.perf")
+_current_profiler = contextvars.ContextVar("nwc_current_profiler", default=None)
+RUN_BUDGETS_MS = {
+    'startup': float(os.environ.get("NWC_STARTUP_BUDGET_MS", "3000")),
+    'rerun': float(os.environ.get("NWC_RERUN_BUDGET_MS", "500")),
+}
+_startup_lock = threading.Lock()
+# tracemalloc - общий для процесса: память трассирует не более одного запуска одновременно (владелец),
+# трассировка включается на время этого запуска и выключается после него
+_trace_lock = threading.Lock()
+_trace_owner = None
+_startup_pending = True
+
+
+def configure_perf_log(target=None):
+    target = target if target is not None else os.environ.get("NWC_PERF_LOG")
+    if not target or perf_logger.handlers:
+        return
+    handler = logging.StreamHandler(sys.stderr) if target == "stderr" else logging.FileHandler(target, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    perf_logger.addHandler(handler)
+    perf_logger.setLevel(logging.INFO)
+    perf_logger.propagate = False
+
+
+class RunProfiler:
+    # started_at - момент начала запуска (time.perf_counter()), если он начался раньше профиля
+    def __init__(self, run_name="rerun", session_id=None, trace_memory=False, started_at=None):
+        self.run_name = run_name
+        self.session_id = session_id
+        self.trace_memory = trace_memory
+        self.spans = []  # {'name', 'depth', 'ms', 'peak_mb'}
+        self._depth = 0
+        self._peaks = []  # стек открытых замеров: наибольший объем трассируемой памяти внутри каждого (байты)
+        self._stage = None
+        self._started = started_at if started_at is not None else time.perf_counter()
+        self.total_ms = None
+        self.budget_ms = RUN_BUDGETS_MS.get(run_name)
+        self._owns_tracing = trace_memory and _start_tracing(self)
+        # Если память уже трассирует другой запуск, этот запуск идет без замера памяти (пики смешались бы).
+        # Пик все равно учитывает выделения других потоков процесса за время замера.
+        self.trace_memory = self._owns_tracing
+
+    def _fold_peak(self):
+        # Текущий пик tracemalloc переносится в открытый замер, счетчик пика сбрасывается
+        if self._peaks:
+            self._peaks[-1] = max(self._peaks[-1], tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def span(self, name):
+        record = {'name': name, 'depth': self._depth, 'ms': None, 'peak_mb': None}
+        self.spans.append(record)
+        self._depth += 1
+        if self.trace_memory:
+            self._fold_peak()
+            memory_before = tracemalloc.get_traced_memory()[0]
+            self._peaks.append(memory_before)
+        started = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['ms'] = (time.perf_counter() - started) * 1000
+            if self.trace_memory:
+                self._fold_peak()
+                peak = self._peaks.pop()
+                record['peak_mb'] = max(peak - memory_before, 0) / 1024 / 1024
+                # Пик вложенного замера входит в пик внешнего
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+            self._depth -= 1
+
+    def stage(self, name):
+        # Последовательные этапы верхнего уровня: начало нового этапа закрывает предыдущий
+        self.end_stage()
+        self._stage = self.span(name)
+        self._stage.__enter__()
+
+    def end_stage(self):
+        if self._stage is not None:
+            stage, self._stage = self._stage, None
+            stage.__exit__(None, None, None)
+
+    def finish(self):
+        self.end_stage()
+        self.total_ms = (time.perf_counter() - self._started) * 1000
+        if self._owns_tracing:
+            _stop_tracing(self)
+            self._owns_tracing = False
+        return self
+
+    @property
+    def over_budget(self):
+        return self.budget_ms is not None and self.total_ms is not None and self.total_ms > self.budget_ms
+
+    def to_record(self):
+        record = {'event': self.run_name, 'session': self.session_id, 'ts': time.time(), 'total_ms': self.total_ms,
+                  'spans': [{key: value for key, value in span.items() if value is not None} for span in self.spans]}
+        if self.budget_ms is not None:
+            record.update(budget_ms=self.budget_ms, over_budget=self.over_budget)
+        return record
+
+    def emit(self):
+        if perf_logger.isEnabledFor(logging.INFO):
+            perf_logger.info(json.dumps(self.to_record(), ensure_ascii=False))
+        if self.over_budget:
+            perf_logger.warning(f"{self.run_name}: {self.total_ms:.0f} мс при бюджете {self.budget_ms:.0f} мс (сессия {self.session_id})")
+
+
+def _start_tracing(profiler):
+    global _trace_owner
+    with _trace_lock:
+        if _trace_owner is not None or tracemalloc.is_tracing():
+            return False
+        _trace_owner = profiler
+        tracemalloc.start()
+        return True
+
+
+def _stop_tracing(profiler):
+    global _trace_owner
+    with _trace_lock:
+        if _trace_owner is profiler:
+            tracemalloc.stop()
+            _trace_owner = None
+
+
+@contextmanager
+def profiled_run(run_name="rerun", session_id=None, trace_memory=False, started_at=None):
+    # Профиль одного запуска скрипта: становится текущим для stage()/span()/@profiled
+    profiler = RunProfiler(run_name, session_id, trace_memory, started_at)
+    token = _current_profiler.set(profiler)
+    try:
+        yield profiler
+    finally:
+        _current_profiler.reset(token)
+        profiler.finish().emit()
+
+
+def current_profiler():
+    return _current_profiler.get()
+
+
+@contextmanager
+def span(name):
+    profiler = _current_profiler.get()
+    if profiler is None:
+        yield None
+        return
+    with profiler.span(name) as record:
+        yield record
+
+
+def stage(name):
+    profiler = _current_profiler.get()
+    if profiler is not None:
+        profiler.stage(name)
+
+
+def profiled(func):
+    # Декоратор: время функции записывается в текущий профиль; без профиля накладных расходов почти нет
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        profiler = _current_profiler.get()
+        if profiler is None:
+            return func(*args, **kwargs)
+        with profiler.span(func.__name__):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def profiled_entry(run_name):
+    # Для точек входа, которые запускаются и отдельно (фрагменты Streamlit): внутри профиля страницы -
+    # вложенный замер, при самостоятельном запуске - собственный профиль с записью в журнал
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profiler = _current_profiler.get()
+            if profiler is not None:
+                with profiler.span(func.__name__):
+                    return func(*args, **kwargs)
+            with profiled_run(run_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def script_run_name():
+    # "startup" для первого запуска скрипта в процессе, далее "rerun"
+    global _startup_pending
+    with _startup_lock:
+        is_startup, _startup_pending = _startup_pending, False
+    return "startup" if is_startup else "rerun"
+
+
+def new_session_id():
+    return uuid.uuid4().hex[:12]
+
+
+def summarize_perf_log(lines):
+    # p50/p95/max длительности каждого этапа по JSON-строкам журнала
+    durations, over_budget, budgets = {}, {}, {}
+    for line in lines:
+        line = line.strip()
+        if not line.startswith("{"):
+            continue
+        record = json.loads(line)
+        total_name = f"{record.get('event')}:total"
+        durations.setdefault(total_name, []).append(record.get('total_ms') or 0.0)
+        if 'budget_ms' in record:
+            budgets[total_name] = record['budget_ms']
+            over_budget[total_name] = over_budget.get(total_name, 0) + bool(record.get('over_budget'))
+        for span_record in record.get('spans', []):
+            if 'ms' in span_record:
+                durations.setdefault(span_record['name'], []).append(span_record['ms'])
+    summary = {name: {'count': len(values), 'p50_ms': float(np.percentile(values, 50)),
+                      'p95_ms': float(np.percentile(values, 95)), 'max_ms': float(np.max(values))}
+               for name, values in sorted(durations.items())}
+    for name, budget_ms in budgets.items():
+        summary[name].update(budget_ms=budget_ms, over_budget=over_budget[name])
+    return summary
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Использование: python nwc_profiling.py <журнал NWC_PERF_LOG>", file=sys.stderr)
+        sys.exit(1)
+    with open(sys.argv[1], encoding="utf-8") as log_file:
+        summary = summarize_perf_log(log_file)
+    for name, stats in summary.items():
+        budget = f"  бюджет {stats['budget_ms']:.0f} мс, превышений {stats['over_budget']}" if 'budget_ms' in stats else ""
+        print(f"{name:<45} n={stats['count']:<6} p50={stats['p50_ms']:9.1f} мс  p95={stats['p95_ms']:9.1f} мс  max={stats['max_ms']:9.1f} мс{budget}")
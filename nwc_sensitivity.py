@@ -0,0 +1,161 @@
+# --- Поверхность чувствительности и совместный бюджет ошибок ---
+# Раздел 4 отвечает на вопрос для одного прогнозного периода и одного лимита. Здесь та же величина
+# (макс. ошибка статьи, +/- %) считается один раз на набор данных сразу для всех прогнозных периодов и всех
+# лимитов шкалы боковой панели (1-25%): плотный массив "лимиты x прогнозы x статьи". Смена лимита или периода -
+# выбор готового среза, а не пересчет. Размер массива: статьи x прогнозы x 25 значений float64.
+#
+# Совместный бюджет: сколько может ошибиться каждая статья, если ошибаются все статьи сразу и в худшую сторону
+# (ошибки складываются по модулю). Допустимое отклонение ЧОК делится между статьями:
+#   "equal"          - поровну в тыс. руб.: допуски Раздела 4 уменьшаются в n раз (n - статьи с ненулевым прогнозом);
+#   "forecast_share" - пропорционально доле |прогноз| / сумма модулей статей: у всех статей одинаковый допуск в %;
+#   "materiality"    - пропорционально существенности статьи выбранным в Разделе 2 методом по фактическим
+#                      периодам (materiality_weights): статьи, существенные в факте, получают большую часть бюджета.
+# Во всех случаях сумма |прогноз статьи| * допуск = допустимое отклонение ЧОК.
+import numpy as np
+import pandas as pd
+
+from nwc_dtypes import article_names
+from nwc_engine import ArticleMatrix, _safe_ratio_percent, totals_to_arrays
+from nwc_profiling import profiled
+
+SENSITIVITY_LIMITS = np.arange(1, 26)  # шкала "Допуст. лимит откл. ЧОК (%)" в боковой панели
+ALLOCATION_METHODS = {"equal": "поровну (в тыс. руб.)", "forecast_share": "по доле |прогноза| статьи",
+                      "materiality": "по существенности статьи (факт)"}
+JOINT_COLUMNS = {"equal": "поровну", "forecast_share": "по доле прогноза", "materiality": "по существенности"}
+TORNADO_MAX_ARTICLES = 20
+
+
+class SensitivitySurface:
+    # forecast_chok - ЧОК прогнозных периодов, если итоги уже посчитаны (например, по узлу RollupTree)
+    def __init__(self, df_articles, forecast_columns, limits=SENSITIVITY_LIMITS, forecast_chok=None):
+        matrix = ArticleMatrix(df_articles, forecast_columns)
+        self.forecast_columns = matrix.columns
+        self.limits = np.asarray(limits, dtype=np.float64)
+        self.articles = article_names(df_articles)
+        self.types = df_articles['Тип'].reset_index(drop=True)
+        self.forecast_values = np.ascontiguousarray(matrix.values.T)  # прогнозы x статьи
+        self.forecast_chok = matrix.totals()['ЧОК'] if forecast_chok is None else np.asarray(forecast_chok, dtype=np.float64)
+        # Допустимое отклонение ЧОК (тыс. руб.), лимиты x прогнозы - как в ArticleMatrix.allowed_error_range
+        self.max_abs_chok_deviation = np.abs(self.forecast_chok[None, :] * (self.limits[:, None] / 100.0))
+        abs_values = np.abs(self.forecast_values)
+        invalid = np.isnan(self.forecast_values) | (self.forecast_values == 0)
+        # Допуск одной статьи (+/- %), лимиты x прогнозы x статьи; статья с нулевым прогнозом - любая ошибка (inf)
+        self.surface = _safe_ratio_percent(self.max_abs_chok_deviation[:, :, None], abs_values[None, :, :],
+                                           invalid=np.broadcast_to(invalid, (len(self.limits),) + invalid.shape), fill=np.inf)
+        self.n_nonzero = np.sum(~invalid, axis=1)
+        self.total_abs = np.nansum(abs_values, axis=1)
+
+    def _position(self, forecast_col_name, limit_percentage):
+        limit_position = np.searchsorted(self.limits, limit_percentage)
+        if limit_position >= len(self.limits) or self.limits[limit_position] != limit_percentage:
+            raise KeyError(f"Лимит {limit_percentage}% вне шкалы поверхности чувствительности")
+        return limit_position, self.forecast_columns.index(forecast_col_name)
+
+    def allowed_errors(self, forecast_col_name, limit_percentage):
+        # (допуски статей, +/- %; допустимое отклонение ЧОК, тыс. руб.) - срез без вычислений
+        limit_position, forecast_position = self._position(forecast_col_name, limit_percentage)
+        return self.surface[limit_position, forecast_position], self.max_abs_chok_deviation[limit_position, forecast_position]
+
+    def allowed_errors_frame(self, forecast_col_name, limit_percentage):
+        # Та же таблица, что calculate_allowed_article_error_range
+        error_range, max_abs_chok_deviation = self.allowed_errors(forecast_col_name, limit_percentage)
+        return pd.DataFrame({'Статья': self.articles,
+                             f'Макс. ошибка статьи (+/- %) для откл. ЧОК до {limit_percentage}%': error_range}), max_abs_chok_deviation
+
+    def joint_errors(self, forecast_col_name, limit_percentage, method="equal", weights=None):
+        # Совместный допуск статей (+/- %), если ошибаются все статьи одновременно.
+        # weights - веса статей для "materiality" (materiality_weights)
+        limit_position, forecast_position = self._position(forecast_col_name, limit_percentage)
+        single = self.surface[limit_position, forecast_position]
+        max_abs_chok_deviation = self.max_abs_chok_deviation[limit_position, forecast_position]
+        if method == "equal":
+            return single / max(self.n_nonzero[forecast_position], 1)
+        if method == "forecast_share":
+            uniform = _safe_ratio_percent(max_abs_chok_deviation, self.total_abs[forecast_position],
+                                          invalid=self.total_abs[forecast_position] == 0, fill=np.inf)
+            return np.where(np.isinf(single), np.inf, uniform)
+        if method == "materiality":
+            if weights is None:
+                raise ValueError("Для распределения по существенности нужны веса статей (materiality_weights)")
+            # Бюджет статьи (тыс. руб.) = допустимое отклонение * вес / сумма весов статей с ненулевым прогнозом;
+            # статья без веса получает нулевой допуск
+            forecast_values = self.forecast_values[forecast_position]
+            invalid = np.isnan(forecast_values) | (forecast_values == 0)
+            weights = np.where(invalid, 0.0, np.nan_to_num(np.asarray(weights, dtype=np.float64), nan=0.0))
+            total_weight = weights.sum()
+            if total_weight == 0:
+                return np.where(invalid, np.inf, np.nan)
+            budget = max_abs_chok_deviation * weights / total_weight
+            return _safe_ratio_percent(budget, np.abs(forecast_values), invalid=invalid, fill=np.inf)
+        raise ValueError(f"Неизвестный метод распределения: {method}. Допустимые: {', '.join(ALLOCATION_METHODS)}")
+
+    def error_budget_frame(self, forecast_col_name, limit_percentage, weights=None):
+        # Допуски одной статьи и совместные допуски всеми методами для выбранного прогноза и лимита
+        # (по существенности - если переданы веса)
+        forecast_values = self.forecast_values[self.forecast_columns.index(forecast_col_name)]
+        single, _ = self.allowed_errors(forecast_col_name, limit_percentage)
+        data = {'Статья': self.articles, 'Тип': self.types, 'Прогноз': forecast_values, 'Одна статья (+/- %)': single}
+        for method, label in JOINT_COLUMNS.items():
+            if method == "materiality" and weights is None:
+                continue
+            joint = self.joint_errors(forecast_col_name, limit_percentage, method, weights)
+            with np.errstate(invalid='ignore'):
+                data[f'Совместно, {label} (+/- %)'] = joint
+                data[f'Совместно, {label} (тыс. руб.)'] = np.where(np.isinf(joint), 0.0, np.abs(forecast_values) * joint / 100.0)
+        return pd.DataFrame(data)
+
+    def limit_frame(self, limit_percentage):
+        # Допуски одной статьи по всем прогнозным периодам при одном лимите (статьи x прогнозы)
+        limit_position, _ = self._position(self.forecast_columns[0], limit_percentage)
+        df_limit = pd.DataFrame(self.surface[limit_position].T, columns=self.forecast_columns)
+        df_limit.insert(0, 'Тип', self.types)
+        df_limit.insert(0, 'Статья', self.articles)
+        return df_limit
+
+
+@profiled
+def build_sensitivity_surface(df_articles, forecast_columns, limits=SENSITIVITY_LIMITS, forecast_chok=None):
+    return SensitivitySurface(df_articles, forecast_columns, limits, forecast_chok)
+
+
+def materiality_weights(df_articles, period_totals_data, fact_columns, method="vs_CHOK"):
+    # Веса статей для распределения "materiality": средняя существенность (%) по фактическим периодам
+    # (как в Разделе 2); статья без значений в факте получает вес 0
+    matrix = ArticleMatrix(df_articles, fact_columns)
+    if not matrix.columns:
+        return np.zeros(len(df_articles))
+    materiality = matrix.materiality(method, totals_to_arrays(period_totals_data, matrix.columns))
+    counts = np.sum(~np.isnan(materiality), axis=1)
+    sums = np.nansum(materiality, axis=1)
+    return np.divide(sums, counts, out=np.zeros_like(sums), where=counts > 0)
+
+
+def tornado_frame(df_budget, method="equal", max_articles=TORNADO_MAX_ARTICLES):
+    # Данные "торнадо": самые чувствительные статьи (наименьший допуск одной статьи), интервалы -допуск..+допуск
+    # для одной статьи и для совместного бюджета; статьи с любым допустимым отклонением не показываются
+    joint_column = f'Совместно, {JOINT_COLUMNS[method]} (+/- %)'
+    df_finite = df_budget[np.isfinite(df_budget['Одна статья (+/- %)'].to_numpy())]
+    df_top = df_finite.nsmallest(max_articles, 'Одна статья (+/- %)')
+    rows = []
+    for label, column in (("Одна статья", 'Одна статья (+/- %)'), ("Совместно", joint_column)):
+        rows.append(pd.DataFrame({'Статья': df_top['Статья'].astype(str).to_numpy(), 'Допуск': label,
+                                  'От (%)': -df_top[column].to_numpy(), 'До (%)': df_top[column].to_numpy()}))
+    return pd.concat(rows, ignore_index=True)
+
+
+def tornado_chart_spec(df_tornado):
+    # Спецификация Vega-Lite для st.vega_lite_chart (данные передаются отдельно): без импорта altair
+    order = df_tornado.loc[df_tornado['Допуск'] == "Одна статья", 'Статья'].tolist()
+    return {
+        'mark': {'type': 'bar', 'opacity': 0.8},
+        'encoding': {
+            'y': {'field': 'Статья', 'type': 'nominal', 'sort': order, 'title': None},
+            'x': {'field': 'От (%)', 'type': 'quantitative', 'title': "Допустимая ошибка прогноза статьи (+/- %)"},
+            'x2': {'field': 'До (%)'},
+            'color': {'field': 'Допуск', 'type': 'nominal', 'legend': {'orient': 'bottom', 'title': None},
+                      'scale': {'domain': ["Одна статья", "Совместно"], 'range': ["#9ecae1", "#08519c"]}},
+            'tooltip': [{'field': 'Статья', 'type': 'nominal'}, {'field': 'Допуск', 'type': 'nominal'},
+                        {'field': 'До (%)', 'type': 'quantitative', 'format': '.2f', 'title': "+/- %"}],
+        },
+        'height': max(160, 24 * len(order)),
+    }
@@ -0,0 +1,195 @@
+# --- Общее хранилище наборов данных ---
+# Одна копия каждой таблицы статей на процесс, а не по копии на сессию Streamlit. Ключ - хэш содержимого
+# (хэш файла из load_articles_cached или dataframe_content_hash). Таблица записывается в файл Arrow IPC,
+# а разобранный DataFrame держится в памяти только для недавно использованных наборов. Вытесненный набор
+# читается из файла через memory map без разбора исходного Excel/CSV; to_pandas при этом копирует
+# значения, поэтому заново прочитанный DataFrame занимает память процесса, как и исходный.
+#
+# Сессия хранит не таблицу, а DatasetHandle (ключ + счетчик ссылок); свои правки (ошибки модулятора и т.п.)
+# сессия держит отдельно. При превышении бюджета памяти (NWC_STORE_BUDGET_MB) вытесняются давно
+# использованные таблицы: у наборов, на которые есть ссылки, освобождается только DataFrame
+# (при следующем обращении он читается из файла заново), наборы без ссылок удаляются целиком.
+# Таблицы общие для всех сессий, поэтому изменять их на месте нельзя (как и результаты nwc_cache).
+import atexit
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from pathlib import Path
+
+import pyarrow as pa
+
+DEFAULT_STORE_BUDGET_MB = float(os.environ.get("NWC_STORE_BUDGET_MB", "2048"))
+# Каталог для файлов Arrow; внутри создается отдельный подкаталог процесса, удаляемый при выходе
+DEFAULT_STORE_DIR = os.environ.get("NWC_STORE_DIR") or None
+
+
+class _Entry:
+    def __init__(self, path):
+        self.path = path
+        self.refcount = 0
+        self.frame = None
+        self.nbytes = 0
+
+
+class DatasetStore:
+    # parsed_cache - следующий уровень (Parquet-кэш nwc_io): хранилище можно передать в
+    # load_articles_cached вместо ParsedCache, тогда файл, уже загруженный другой сессией, не читается заново
+    def __init__(self, budget_mb=DEFAULT_STORE_BUDGET_MB, store_dir=DEFAULT_STORE_DIR, parsed_cache=None):
+        self.budget_bytes = int(budget_mb * 1024 * 1024)
+        self.store_dir = Path(tempfile.mkdtemp(prefix="nwc_store_", dir=store_dir))
+        self.parsed_cache = parsed_cache
+        self._entries = OrderedDict()  # ключ -> _Entry, от давно использованных к недавним
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        atexit.register(shutil.rmtree, self.store_dir, True)
+
+    def _path(self, key):
+        return self.store_dir / f"{key}.arrow"
+
+    def contains(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def add(self, key, df):
+        # Таблица с уже известным ключом не записывается повторно: остается прежняя копия
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return key
+        path = self._path(key)
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+        with pa.OSFile(str(tmp_path), "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+        os.replace(tmp_path, path)
+        with self._lock:
+            entry = self._entries.setdefault(key, _Entry(path))
+            if entry.frame is None:
+                entry.frame, entry.nbytes = df, _frame_nbytes(df)
+            self._entries.move_to_end(key)
+            self._evict(keep=key)
+        return key
+
+    def frame(self, key):
+        # DataFrame набора; после вытеснения читается из файла заново. KeyError - набора нет
+        with self._lock:
+            entry = self._entries[key]
+            self._entries.move_to_end(key)
+            if entry.frame is not None:
+                self.hits += 1
+                return entry.frame
+            self.misses += 1
+            with pa.memory_map(str(entry.path), "r") as source:
+                entry.frame = pa.ipc.open_file(source).read_all().to_pandas(split_blocks=True)
+            entry.nbytes = _frame_nbytes(entry.frame)
+            self._evict(keep=key)
+            return entry.frame
+
+    # Интерфейс ParsedCache (get/put) для load_articles_cached
+    def get(self, key):
+        # Проверка и чтение под одной блокировкой: набор не может быть вытеснен между ними
+        with self._lock:
+            if key in self._entries:
+                return self.frame(key)
+        df = self.parsed_cache.get(key) if self.parsed_cache is not None else None
+        if df is not None:
+            self.add(key, df)
+        return df
+
+    def put(self, key, df):
+        if self.parsed_cache is not None:
+            self.parsed_cache.put(key, df)
+        self.add(key, df)
+        return True
+
+    def open(self, key, build=None):
+        # Ссылка на набор; если его нет, таблица строится build() и добавляется. Все под блокировкой,
+        # чтобы набор не был вытеснен между добавлением и захватом ссылки
+        with self._lock:
+            if key not in self._entries:
+                if build is None:
+                    raise KeyError(key)
+                self.add(key, build())
+            return DatasetHandle(self, key)
+
+    def acquire(self, key):
+        with self._lock:
+            self._entries[key].refcount += 1
+
+    def release(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refcount = max(entry.refcount - 1, 0)
+            if entry.refcount == 0 and entry.frame is None:
+                # Набор уже вытеснен из памяти и больше никому не нужен - файл удаляется
+                del self._entries[key]
+                entry.path.unlink(missing_ok=True)
+            else:
+                self._evict()
+
+    def memory_bytes(self):
+        with self._lock:
+            return sum(entry.nbytes for entry in self._entries.values() if entry.frame is not None)
+
+    def _evict(self, keep=None):
+        # Вытеснение от давно использованных: сначала наборы без ссылок (целиком, с файлом),
+        # затем DataFrame наборов со ссылками. Набор keep (только что использованный) не трогается.
+        used = self.memory_bytes()
+        for only_unreferenced in (True, False):
+            for key in list(self._entries):
+                if used <= self.budget_bytes:
+                    return
+                entry = self._entries[key]
+                if key == keep or entry.frame is None or (only_unreferenced and entry.refcount > 0):
+                    continue
+                used -= entry.nbytes
+                entry.frame, entry.nbytes = None, 0
+                self.evictions += 1
+                if entry.refcount == 0:
+                    del self._entries[key]
+                    entry.path.unlink(missing_ok=True)
+
+    def stats(self):
+        with self._lock:
+            return {'datasets': len(self._entries), 'in_memory': sum(entry.frame is not None for entry in self._entries.values()),
+                    'memory_mb': self.memory_bytes() / 1024 / 1024, 'budget_mb': self.budget_bytes / 1024 / 1024,
+                    'references': sum(entry.refcount for entry in self._entries.values()),
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+def _frame_nbytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class DatasetHandle:
+    # Ссылка сессии на набор в хранилище. Счетчик ссылок уменьшается при release() или когда
+    # объект удаляется вместе с состоянием сессии
+    def __init__(self, store, key):
+        store.acquire(key)
+        self.store = store
+        self.key = key
+        self._finalizer = weakref.finalize(self, store.release, key)
+
+    def frame(self):
+        return self.store.frame(self.key)
+
+    def release(self):
+        self._finalizer()
+
+
+_default_store = None
+
+
+def get_dataset_store():
+    global _default_store
+    if _default_store is None:
+        from nwc_io import get_default_parsed_cache
+        _default_store = DatasetStore(parsed_cache=get_default_parsed_cache())
+    return _default_store
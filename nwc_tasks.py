@@ -0,0 +1,119 @@
+# --- Фоновые задачи ---
+# Долгие операции (разбор загруженного файла, формирование выгрузки, моделирование Монте-Карло) выполняются
+# в общем для процесса пуле потоков, а не в потоке скрипта Streamlit: страница и виджеты остаются отзывчивыми.
+# Одновременно выполняется не более NWC_TASK_WORKERS задач на сервер, остальные ждут в очереди.
+#
+# Задача получает объект Task первым аргументом и сообщает прогресс через task.report(доля, сообщение);
+# там же проверяется запрос на отмену: отмена кооперативная, задача прерывается на ближайшем report()
+# исключением TaskCancelled. Потоки задач не обращаются к st.session_state - результат из Task
+# забирает поток скрипта (app.py).
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from nwc_profiling import profiled_run
+
+DEFAULT_TASK_WORKERS = int(os.environ.get("NWC_TASK_WORKERS", "2"))
+TASK_STATUS_LABELS = {"queued": "в очереди", "running": "выполняется", "done": "готово", "error": "ошибка", "cancelled": "отменено"}
+
+
+class TaskCancelled(Exception):
+    pass
+
+
+class Task:
+    def __init__(self, name):
+        self.name = name
+        self.status = "queued"
+        self.progress = 0.0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.submitted_at = time.monotonic()
+        self.started_at = None
+        self.finished_at = None
+        self._cancel_event = threading.Event()
+        self._future = None
+
+    @property
+    def done(self):
+        return self.status in ("done", "error", "cancelled")
+
+    @property
+    def cancel_requested(self):
+        return self._cancel_event.is_set()
+
+    def report(self, fraction=None, message=None):
+        # Вызывается из задачи; fraction - доля выполненной работы (0..1)
+        if self._cancel_event.is_set():
+            raise TaskCancelled()
+        if fraction is not None:
+            self.progress = min(max(float(fraction), 0.0), 1.0)
+        if message is not None:
+            self.message = message
+
+    def cancel(self):
+        self._cancel_event.set()
+        # Задача из очереди снимается сразу; выполняющаяся остановится на ближайшем report()
+        if self._future is not None and self._future.cancel():
+            self.status = "cancelled"
+            self.finished_at = time.monotonic()
+
+    def elapsed(self):
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+
+class TaskManager:
+    def __init__(self, max_workers=DEFAULT_TASK_WORKERS):
+        self.max_workers = max_workers
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="nwc-task")
+        self._lock = threading.Lock()
+        self._active = set()
+
+    def submit(self, name, func, args=(), kwargs=None, session_id=None):
+        # func(task, *args, **kwargs); время выполнения попадает в журнал замеров как запуск "task:<name>"
+        task = Task(name)
+        with self._lock:
+            self._active.add(task)
+        task._future = self._pool.submit(self._run, task, func, args, kwargs or {}, session_id)
+        task._future.add_done_callback(lambda _: self._discard(task))
+        return task
+
+    def _run(self, task, func, args, kwargs, session_id):
+        if task.cancel_requested:
+            task.status = "cancelled"
+            return
+        task.status, task.started_at = "running", time.monotonic()
+        try:
+            with profiled_run(f"task:{task.name}", session_id):
+                result = func(task, *args, **kwargs)
+            task.report(1.0)  # отмена, запрошенная в самом конце, тоже учитывается
+            task.result, task.status = result, "done"
+        except TaskCancelled:
+            task.status = "cancelled"
+        except Exception as e:
+            task.error, task.status = f"{type(e).__name__}: {e}", "error"
+        finally:
+            task.finished_at = time.monotonic()
+
+    def _discard(self, task):
+        with self._lock:
+            self._active.discard(task)
+
+    def stats(self):
+        with self._lock:
+            statuses = [task.status for task in self._active]
+        return {'workers': self.max_workers, 'running': statuses.count("running"), 'queued': statuses.count("queued")}
+
+
+_default_manager = None
+
+
+def get_task_manager():
+    global _default_manager
+    if _default_manager is None:
+        _default_manager = TaskManager()
+    return _default_manager
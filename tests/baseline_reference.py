@@ -0,0 +1,112 @@
+# --- Эталон: исходные построчные расчеты (app.py до векторизации) ---
+# Перенесены без изменений логики; st.warning и проверки отсутствующих столбцов убраны.
+import numpy as np
+import pandas as pd
+
+
+def calculate_period_totals(df_articles, columns_to_calculate):
+    period_totals_data = {}
+    for col_name in columns_to_calculate:
+        if col_name not in df_articles.columns: continue
+        oa_total = df_articles.loc[df_articles['Тип'] == 'ОА', col_name].sum()
+        co_total = df_articles.loc[df_articles['Тип'] == 'КО', col_name].sum()
+        working_capital = oa_total - co_total
+        period_totals_data[col_name] = {
+            'Итого ОА': oa_total, 'Итого КО': co_total, 'ЧОК': working_capital
+        }
+    return period_totals_data
+
+
+def calculate_materiality(df_articles, period_totals_data, data_columns_list, method="vs_CHOK"):
+    materiality_data = {'Статья': df_articles['Статья'].tolist()}
+    for col_name in data_columns_list:
+        if col_name not in df_articles.columns: continue
+        col_materiality = []
+        base_chok = period_totals_data.get(col_name, {}).get('ЧОК', 0)
+        base_total_components = df_articles[col_name].abs().sum() if method == "vs_TotalComponents" else 0
+        base_total_oa = period_totals_data.get(col_name, {}).get('Итого ОА', 0) if method == "within_OA_CO" else 0
+        base_total_co = period_totals_data.get(col_name, {}).get('Итого КО', 0) if method == "within_OA_CO" else 0
+        for _, row in df_articles.iterrows():
+            article_value = row[col_name]
+            base_value_for_calc = 0
+            if method == "vs_CHOK": base_value_for_calc = base_chok
+            elif method == "vs_TotalComponents": base_value_for_calc = base_total_components
+            elif method == "within_OA_CO":
+                if row['Тип'] == 'ОА': base_value_for_calc = base_total_oa
+                elif row['Тип'] == 'КО': base_value_for_calc = base_total_co
+            if pd.isna(article_value) or base_value_for_calc == 0:
+                col_materiality.append(np.nan)
+            else:
+                col_materiality.append((np.abs(article_value) / np.abs(base_value_for_calc)) * 100)
+        materiality_data[f'Сущ-ть ({col_name.split(" ")[0]}) (%)'] = col_materiality
+
+    # Как в исходнике: значения ищутся по первому слову периода ("Q1"), подпись - с годом
+    materiality_data_with_year = {'Статья': df_articles['Статья'].tolist()}
+    for col_name in data_columns_list:
+        materiality_data_with_year[f"Сущ-ть ({col_name.replace(' Факт', '').replace(' Прогноз', '')}) (%)"] = materiality_data.get(f'Сущ-ть ({col_name.split(" ")[0]}) (%)', [])
+    return pd.DataFrame(materiality_data_with_year)
+
+
+def calculate_forecast_deviations(df_articles, period_totals_data, forecast_col_name, base_col_name):
+    deviations_data = {'Статья': df_articles['Статья'].tolist()}
+    abs_deviations_list, rel_deviations_list = [], []
+    for _, row in df_articles.iterrows():
+        forecast_value, base_value = row[forecast_col_name], row[base_col_name]
+        if pd.isna(forecast_value) or pd.isna(base_value):
+            abs_dev, rel_dev = np.nan, np.nan
+        else:
+            abs_dev = forecast_value - base_value
+            rel_dev = (abs_dev / base_value) * 100 if base_value != 0 else (np.nan if forecast_value != 0 else 0)
+        abs_deviations_list.append(abs_dev)
+        rel_deviations_list.append(rel_dev)
+    deviations_data[f'Абс. откл. (Прогноз - {base_col_name.split(" ")[0]})'] = abs_deviations_list
+    deviations_data[f'Отн. откл. (Прогноз - {base_col_name.split(" ")[0]}) (%)'] = rel_deviations_list
+    summary_dev_rows = []
+    for indicator in ['Итого ОА', 'Итого КО', 'ЧОК']:
+        prog_data = period_totals_data.get(forecast_col_name, {})
+        base_data = period_totals_data.get(base_col_name, {})
+        prog_val, base_val = prog_data.get(indicator, np.nan), base_data.get(indicator, np.nan)
+        if pd.isna(prog_val) or pd.isna(base_val):
+            abs_d, rel_d = np.nan, np.nan
+        else:
+            abs_d = prog_val - base_val
+            rel_d = (abs_d / base_val) * 100 if base_val != 0 else (np.nan if prog_val != 0 else 0)
+        summary_dev_rows.append({
+            'Показатель': indicator, 'Прогноз': prog_val, f'Факт ({base_col_name.split(" ")[0]})': base_val,
+            'Абс. откл.': abs_d, 'Отн. откл. (%)': rel_d
+        })
+    return pd.DataFrame(deviations_data), pd.DataFrame(summary_dev_rows)
+
+
+def calculate_allowed_article_error_range(df_articles, forecast_col_name, forecast_chok_value, wc_deviation_perc_limit=5):
+    max_abs_wc_deviation_allowed = np.abs(forecast_chok_value * (wc_deviation_perc_limit / 100.0))
+    allowed_error_ranges_data = {'Статья': df_articles['Статья'].tolist()}
+    error_range_percentages = []
+    for _, row in df_articles.iterrows():
+        forecast_article_value = row[forecast_col_name]
+        if pd.isna(forecast_article_value) or forecast_article_value == 0:
+            err_range_perc = np.inf
+        else:
+            err_range_perc = (max_abs_wc_deviation_allowed / np.abs(forecast_article_value)) * 100
+        error_range_percentages.append(err_range_perc)
+    allowed_error_ranges_data[f'Макс. ошибка статьи (+/- %) для откл. ЧОК до {wc_deviation_perc_limit}%'] = error_range_percentages
+    return pd.DataFrame(allowed_error_ranges_data), max_abs_wc_deviation_allowed
+
+
+def modulate_errors(df_editor, forecasted_chok_value):
+    # Цикл Раздела 4.1: значения с учетом ошибки и отклонение ЧОК по всей таблице редактора
+    chok_deviation = 0.0
+    modified_values = []
+    for _, row in df_editor.iterrows():
+        forecast_value, error_percentage = row['Прогноз'], row['Ошибка (%)']
+        if not pd.isna(forecast_value):
+            modified_value = forecast_value * (1 + error_percentage / 100)
+            modified_values.append(modified_value)
+            if row['Тип'] == 'ОА':
+                chok_deviation += (modified_value - forecast_value)
+            elif row['Тип'] == 'КО':
+                chok_deviation -= (modified_value - forecast_value)
+        else:
+            modified_values.append(np.nan)
+    chok_deviation_percentage = (chok_deviation / forecasted_chok_value) * 100 if forecasted_chok_value != 0 else 0
+    return np.array(modified_values, dtype=np.float64), chok_deviation, chok_deviation_percentage
@@ -0,0 +1,71 @@
+# Бэктест на небольшой таблице, посчитанной вручную
+import numpy as np
+import pandas as pd
+import pytest
+
+from nwc_backtest import backtest_pairs, run_backtest
+
+FACTS = ['Q1 2024 Факт', 'Q2 2024 Факт']
+FORECASTS = ['Q3 2024 Прогноз', 'Q2 2024 Прогноз', 'Q1 2024 Прогноз']  # Q3 - прогноз без факта
+
+
+@pytest.fixture
+def df_articles():
+    return pd.DataFrame({
+        'Статья': ['A', 'B', 'C', 'D'],
+        'Тип': ['ОА', 'ОА', 'КО', 'ОА'],
+        'Q1 2024 Факт': [100.0, 0.0, 40.0, np.nan],  # B - нулевой факт
+        'Q2 2024 Факт': [200.0, 50.0, 100.0, np.nan],
+        'Q1 2024 Прогноз': [110.0, 10.0, np.nan, 5.0],  # C - нет прогноза
+        'Q2 2024 Прогноз': [180.0, 50.0, 90.0, 5.0],
+        'Q3 2024 Прогноз': [300.0, 60.0, 120.0, 5.0],
+    })
+
+
+def test_pairs_skip_forecast_without_fact():
+    assert backtest_pairs(FACTS, FORECASTS) == [('Q1 2024 Прогноз', 'Q1 2024 Факт'), ('Q2 2024 Прогноз', 'Q2 2024 Факт')]
+
+
+def test_period_statistics(df_articles):
+    periods = run_backtest(df_articles, backtest_pairs(FACTS, FORECASTS), limit_percentage=10).periods
+    # ЧОК прогноз: Q1 = 110 + 10 + 5 - 0 (пропуск) = 125, Q2 = 180 + 50 + 5 - 90 = 145; факт: Q1 = 60, Q2 = 150
+    np.testing.assert_allclose(periods['ЧОК прогноз'], [125, 145])
+    np.testing.assert_allclose(periods['ЧОК факт'], [60, 150])
+    np.testing.assert_allclose(periods['Абс. откл. ЧОК'], [65, -5])
+    np.testing.assert_allclose(periods['Отн. откл. ЧОК (%)'], [65 / 60 * 100, -5 / 150 * 100])
+    # Лимит 10% прогнозного ЧОК: 12.5 и 14.5
+    assert periods['ЧОК в пределах лимита'].tolist() == [False, True]
+
+
+def test_article_statistics(df_articles):
+    articles = run_backtest(df_articles, backtest_pairs(FACTS, FORECASTS), limit_percentage=10).articles.set_index('Статья')
+    # A: ошибки +10 (+10%) и -20 (-10%); попадание только в Q1 (|10| <= 12.5, |-20| > 14.5)
+    assert articles.loc['A', 'Пар'] == 2
+    assert articles.loc['A', 'MAPE (%)'] == pytest.approx(10)
+    assert articles.loc['A', 'Смещение (%)'] == pytest.approx(0)
+    assert articles.loc['A', 'Смещение (тыс. руб.)'] == pytest.approx(-5)
+    assert articles.loc['A', 'RMSE (тыс. руб.)'] == pytest.approx(np.sqrt(250))
+    assert articles.loc['A', 'Доля попаданий в лимит (%)'] == pytest.approx(50)
+    # B: нулевой факт в Q1 - относительная ошибка не определена, абсолютная (10) учитывается
+    assert articles.loc['B', 'Пар'] == 2
+    assert articles.loc['B', 'MAPE (%)'] == pytest.approx(0)
+    assert articles.loc['B', 'Смещение (тыс. руб.)'] == pytest.approx(5)
+    assert articles.loc['B', 'RMSE (тыс. руб.)'] == pytest.approx(np.sqrt(50))
+    assert articles.loc['B', 'Доля попаданий в лимит (%)'] == pytest.approx(100)
+    # C: пропуск прогноза в Q1 - одна пара, ошибка -10 (-10%)
+    assert articles.loc['C', 'Пар'] == 1
+    assert articles.loc['C', 'MAPE (%)'] == pytest.approx(10)
+    assert articles.loc['C', 'Смещение (%)'] == pytest.approx(-10)
+    assert articles.loc['C', 'RMSE (тыс. руб.)'] == pytest.approx(10)
+    assert articles.loc['C', 'Доля попаданий в лимит (%)'] == pytest.approx(100)
+    # D: фактов нет - ни одной пары, статистика не определена
+    assert articles.loc['D', 'Пар'] == 0
+    assert articles.loc['D', ['MAPE (%)', 'Смещение (%)', 'RMSE (тыс. руб.)', 'Доля попаданий в лимит (%)']].isna().all()
+
+
+def test_no_pairs():
+    df = pd.DataFrame({'Статья': ['A'], 'Тип': ['ОА'], 'Q1 2024 Факт': [1.0], 'Q3 2024 Прогноз': [2.0]})
+    pairs = backtest_pairs(['Q1 2024 Факт'], ['Q3 2024 Прогноз'])
+    assert pairs == []
+    result = run_backtest(df, pairs)
+    assert result.periods.empty and result.articles['Пар'].tolist() == [0]
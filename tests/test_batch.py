@@ -0,0 +1,49 @@
+# Пакетная обработка: поиск файлов, обработка без пула и журнал ошибок по файлам
+import json
+
+import pandas as pd
+
+from nwc_batch import DEFAULT_PATTERNS, find_input_files, run_batch, timing_summary, write_error_log
+
+
+def _articles():
+    return pd.DataFrame({
+        'Статья': ['ДС', 'ДЗ', 'КЗ'],
+        'Тип': ['ОА', 'ОА', 'КО'],
+        'Q1 2024 Факт': [100.0, 200.0, 150.0],
+        'Q2 2024 Факт': [110.0, 210.0, 140.0],
+        'Q3 2024 Прогноз': [120.0, 190.0, 145.0],
+    })
+
+
+def test_find_input_files(tmp_path):
+    for name in ("b.xlsx", "a.csv", "c.parquet", "d.xls", "~$a.xlsx", "notes.txt"):
+        (tmp_path / name).write_bytes(b"")
+    (tmp_path / "subdir.csv").mkdir()
+    assert [path.name for path in find_input_files(tmp_path)] == ["a.csv", "b.xlsx", "c.parquet", "d.xls"]
+    assert [path.name for path in find_input_files(tmp_path, ("*.csv",))] == ["a.csv"]
+    assert set(DEFAULT_PATTERNS) >= {"*.xlsx", "*.xls", "*.csv", "*.parquet"}
+
+
+def test_broken_file_does_not_stop_batch(tmp_path):
+    _articles().to_csv(tmp_path / "good.csv", index=False)
+    _articles().to_parquet(tmp_path / "good.parquet", index=False)
+    (tmp_path / "broken.xlsx").write_bytes(b"not an excel workbook")
+    outcomes = run_batch(find_input_files(tmp_path), workers=1)
+
+    assert [(outcome['file'], outcome['status']) for outcome in outcomes] == \
+        [("broken.xlsx", "error"), ("good.csv", "ok"), ("good.parquet", "ok")]
+    broken = outcomes[0]
+    assert broken['result'] is None and broken['diagnostics'][0][0] == 'error'
+    assert all(outcome['result'] is not None and outcome['n_articles'] == 3 for outcome in outcomes[1:])
+
+    log_path = tmp_path / "report.errors.jsonl"
+    write_error_log(outcomes, log_path)
+    records = [json.loads(line) for line in log_path.read_text(encoding='utf-8').splitlines()]
+    assert len(records) == 1
+    assert records[0]['file'] == str(tmp_path / "broken.xlsx") and records[0]['status'] == 'error'
+    assert records[0]['messages'][0]['level'] == 'error'
+    assert records[0]['messages'][0]['message'].startswith("Ошибка при чтении файла")
+
+    summary = timing_summary(outcomes, wall_time=1.0)
+    assert (summary['files'], summary['ok'], summary['error']) == (3, 2, 1)
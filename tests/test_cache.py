@@ -0,0 +1,95 @@
+# Кэш вычислений: порядок вытеснения LRU, срок жизни записей и устойчивость ключей
+import numpy as np
+import pandas as pd
+import pytest
+
+from nwc_cache import ComputationCache, dataframe_content_hash, make_key
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _cached(cache, key, func_name="f"):
+    computed = []
+    value = cache.get_or_compute(func_name, key, lambda: computed.append(key) or f"value {key}")
+    return value, bool(computed)
+
+
+def test_lru_eviction_order():
+    cache = ComputationCache(max_entries_per_function=2)
+    _cached(cache, 'a')
+    _cached(cache, 'b')
+    assert _cached(cache, 'a') == ("value a", False)  # 'a' становится последней использованной
+    _cached(cache, 'c')  # вытесняется 'b'
+    assert _cached(cache, 'a') == ("value a", False)
+    assert _cached(cache, 'c') == ("value c", False)
+    assert _cached(cache, 'b') == ("value b", True)
+    assert cache.stats()['entries'] == {'f': 2}
+
+
+def test_limit_is_per_function():
+    cache = ComputationCache(max_entries_per_function=1)
+    _cached(cache, 'a', "f")
+    _cached(cache, 'a', "g")
+    assert _cached(cache, 'a', "f")[1] is False
+    assert cache.stats() == {'hits': 1, 'misses': 2, 'entries': {'f': 1, 'g': 1}}
+
+
+def test_ttl_expiry():
+    clock = FakeClock()
+    cache = ComputationCache(ttl_seconds=10, clock=clock)
+    _cached(cache, 'a')
+    clock.now = 10
+    assert _cached(cache, 'a')[1] is False  # ровно на границе запись еще действительна
+    clock.now = 10.5
+    assert _cached(cache, 'a')[1] is True  # пересчитана и записана заново
+    clock.now = 20
+    assert _cached(cache, 'a')[1] is False
+
+
+def test_evict_expired():
+    clock = FakeClock()
+    cache = ComputationCache(ttl_seconds=10, clock=clock)
+    _cached(cache, 'a')
+    clock.now = 5
+    _cached(cache, 'b')
+    clock.now = 12
+    cache.evict_expired()
+    assert cache.stats()['entries'] == {'f': 1}
+    assert _cached(cache, 'b')[1] is False
+
+
+def _frames():
+    return pd.DataFrame({
+        'Статья': pd.Categorical(['A', 'B', 'A'], categories=['A', 'B']),
+        'Q1 2024 Факт': np.array([1.5, np.nan, 3.25], dtype=np.float32),
+    })
+
+
+def test_content_hash_is_stable_for_equal_frames():
+    assert dataframe_content_hash(_frames()) == dataframe_content_hash(_frames())
+    assert dataframe_content_hash(_frames()) == dataframe_content_hash(_frames().copy(deep=True))
+
+
+@pytest.mark.parametrize("change", [
+    lambda df: df.assign(**{'Q1 2024 Факт': df['Q1 2024 Факт'].astype(np.float64)}),
+    lambda df: df.assign(Статья=df['Статья'].astype(object)),
+    lambda df: df.assign(**{'Q1 2024 Факт': np.array([1.5, np.nan, 3.0], dtype=np.float32)}),
+    lambda df: df.assign(Статья=pd.Categorical(['A', 'B', 'B'], categories=['A', 'B'])),
+    lambda df: df.rename(columns={'Q1 2024 Факт': 'Q2 2024 Факт'}),
+    lambda df: df.set_axis([1, 2, 3]),
+])
+def test_content_hash_changes_with_values_types_and_labels(change):
+    assert dataframe_content_hash(change(_frames())) != dataframe_content_hash(_frames())
+
+
+def test_make_key_is_hashable_and_order_independent():
+    key = make_key(dataframe_content_hash(_frames()), ['Q1', 'Q2'], {'limit': 5, 'types': {'ОА', 'КО'}})
+    same = make_key(dataframe_content_hash(_frames()), ('Q1', 'Q2'), {'types': {'КО', 'ОА'}, 'limit': 5})
+    assert key == same and hash(key) == hash(same)
+    assert make_key(['Q2', 'Q1']) != make_key(['Q1', 'Q2'])
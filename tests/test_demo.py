@@ -0,0 +1,11 @@
+# Демо-данные строятся один раз, но каждый вызов получает свою копию
+from nwc_demo import get_demo_data
+
+
+def test_demo_data_is_not_shared():
+    df = get_demo_data()
+    df.loc[0, 'Q1 2024 Факт'] = -1
+    df['Новый столбец'] = 0
+    fresh = get_demo_data()
+    assert fresh is not df
+    assert fresh.loc[0, 'Q1 2024 Факт'] == 500 and 'Новый столбец' not in fresh.columns
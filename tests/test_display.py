@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("streamlit")
+from streamlit.testing.v1 import AppTest
+
+
+def render_inf_table(max_cells):
+    import numpy as np
+    import pandas as pd
+
+    from nwc_display import show_table
+
+    df = pd.DataFrame({'Статья': ['ДС', 'ДЗ', 'КЗ', 'Налоги'], 'Допуск (+/- %)': [12.5, np.inf, -np.inf, np.nan],
+                       'Прогноз': [100.0, 0.0, 50.0, np.nan]})
+    show_table(df, {'Допуск (+/- %)': "{:.2f}%", 'Прогноз': "{:.0f}"}, key="inf_table", inf_label="Любая", max_cells=max_cells)
+
+
+@pytest.mark.parametrize("max_cells", [None, 0], ids=["styler", "paged"])
+def test_table_with_infinite_values_renders(max_cells):
+    at = AppTest.from_function(render_inf_table, args=(max_cells,), default_timeout=30).run()
+    assert not at.exception
+    df_shown = at.dataframe[0].value
+    assert len(df_shown) == 4
+    if max_cells is None:
+        # Малая таблица: +inf заменяется подписью, остальные значения форматируются как обычно
+        assert df_shown['Допуск (+/- %)'].tolist()[:3] == ['12.50%', 'Любая', '-inf%']
+    else:
+        assert np.isposinf(df_shown['Допуск (+/- %)'].iloc[1]) and np.isneginf(df_shown['Допуск (+/- %)'].iloc[2])
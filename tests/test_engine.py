@@ -0,0 +1,94 @@
+# Векторизованный движок против исходных построчных расчетов: демо-данные и крайние случаи
+import numpy as np
+import pandas as pd
+import pytest
+
+import baseline_reference as reference
+import nwc_analysis
+from nwc_demo import get_demo_data
+
+# Эталон делит inf на inf так же, как движок, но с предупреждением numpy
+pytestmark = pytest.mark.filterwarnings("ignore:invalid value encountered:RuntimeWarning")
+
+MATERIALITY_METHODS = ["vs_CHOK", "vs_TotalComponents", "within_OA_CO"]
+
+
+def edge_case_data():
+    # Пропуски, нули, бесконечности; нулевой ЧОК в "Q2 2024 Факт"; нулевая база при ненулевом и нулевом прогнозе
+    return pd.DataFrame({
+        'Статья': ['ДС', 'ДЗ', 'Запасы', 'Прочие ОА', 'КЗ', 'Кредиты', 'Налоги'],
+        'Тип': ['ОА', 'ОА', 'ОА', 'ОА', 'КО', 'КО', 'КО'],
+        'Q1 2024 Факт': [100.0, np.nan, 0.0, -50.0, 80.0, 0.0, np.inf],
+        'Q2 2024 Факт': [100.0, 200.0, 0.0, 0.0, 150.0, 150.0, 0.0],
+        'Q3 2024 Факт': [0.0, 300.0, 0.0, 20.0, np.nan, 40.0, 0.0],
+        'Q4 2024 Прогноз': [10.0, 310.0, 0.0, np.nan, 70.0, -np.inf, 5.0],
+    })
+
+
+def datasets():
+    return [pytest.param(get_demo_data(), id="demo"), pytest.param(edge_case_data(), id="edge_cases")]
+
+
+def period_columns(df):
+    return [col for col in df.columns if col not in ('Статья', 'Тип')]
+
+
+def assert_totals_equal(actual, expected):
+    assert list(actual) == list(expected)
+    for col_name in expected:
+        for name, value in expected[col_name].items():
+            np.testing.assert_allclose(actual[col_name][name], value, rtol=1e-12, equal_nan=True)
+
+
+def assert_frames_equal(actual, expected):
+    pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True),
+                                  check_dtype=False, check_categorical=False, rtol=1e-12)
+
+
+@pytest.mark.parametrize("df", datasets())
+def test_period_totals(df):
+    columns = period_columns(df)
+    assert_totals_equal(nwc_analysis.calculate_period_totals(df, columns), reference.calculate_period_totals(df, columns))
+
+
+@pytest.mark.parametrize("method", MATERIALITY_METHODS)
+@pytest.mark.parametrize("df", datasets())
+def test_materiality(df, method):
+    columns = period_columns(df)
+    totals = reference.calculate_period_totals(df, columns)
+    actual = nwc_analysis.calculate_materiality(df, totals, columns, method)
+    actual['Статья'] = actual['Статья'].astype(str)
+    assert_frames_equal(actual, reference.calculate_materiality(df, totals, columns, method))
+
+
+@pytest.mark.parametrize("df", datasets())
+def test_forecast_deviations(df):
+    columns = period_columns(df)
+    totals = reference.calculate_period_totals(df, columns)
+    forecast_col, *base_cols = columns[::-1]
+    for base_col in base_cols:
+        actual_articles, actual_summary = nwc_analysis.calculate_forecast_deviations(df, totals, forecast_col, base_col)
+        expected_articles, expected_summary = reference.calculate_forecast_deviations(df, totals, forecast_col, base_col)
+        actual_articles['Статья'] = actual_articles['Статья'].astype(str)
+        assert_frames_equal(actual_articles, expected_articles)
+        assert_frames_equal(actual_summary, expected_summary)
+
+
+@pytest.mark.parametrize("limit", [1, 5, 25])
+@pytest.mark.parametrize("df", datasets())
+def test_allowed_error_range(df, limit):
+    forecast_col = period_columns(df)[-1]
+    for chok in (1000.0, -250.0, 0.0):
+        actual, actual_allowed = nwc_analysis.calculate_allowed_article_error_range(df, forecast_col, chok, limit)
+        expected, expected_allowed = reference.calculate_allowed_article_error_range(df, forecast_col, chok, limit)
+        actual['Статья'] = actual['Статья'].astype(str)
+        assert_frames_equal(actual, expected)
+        assert actual_allowed == pytest.approx(expected_allowed)
+
+
+def test_missing_forecast_chok_is_reported():
+    diagnostics = []
+    df_result, allowed = nwc_analysis.calculate_allowed_article_error_range(get_demo_data(), 'Q1 2025 Прогноз', np.nan,
+                                                                             diagnostics=diagnostics)
+    assert np.isnan(allowed) and list(df_result.columns) == ['Статья']
+    assert diagnostics and diagnostics[0][0] == "warning"
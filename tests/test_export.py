@@ -0,0 +1,86 @@
+# Выгрузка: чтение файлов обратно и сравнение с исходными таблицами, удаление и очистка по TTL
+import io
+import os
+import time
+import zipfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from nwc_export import (EXPORT_FILE_PREFIX, EXPORT_FORMATS, export_to_tempfile, read_export_file, remove_export_file,
+                        sweep_export_files)
+
+
+@pytest.fixture
+def dfs_dict():
+    summary = pd.DataFrame({'ЧОК': [60.0, 150.5], 'Отклонение (%)': [1.25, np.nan]},
+                           index=pd.Index(['Q1 2024', 'Q2 2024'], name='Период'))
+    articles = pd.DataFrame({'Статья': ['A', 'B', 'C'], 'Тип': ['ОА', 'ОА', 'КО'],
+                             'Q1 2024 Факт': [100.0, np.nan, 40.5], 'Пар': [2, 0, 1]})
+    # Пустые таблицы и None не выгружаются
+    return {'Сводка': summary, 'Данные_статьи': articles, 'Пусто': pd.DataFrame(), 'Нет': None}
+
+
+def _read_back(path, export_format):
+    if export_format == "xlsx":
+        sheets = pd.read_excel(path, sheet_name=None)
+        return {name: df.set_index(df.columns[0]) if name == 'Сводка' else df for name, df in sheets.items()}
+    with zipfile.ZipFile(path) as archive:
+        reader = pd.read_parquet if export_format == "parquet_zip" else pd.read_csv
+        sheets = {os.path.splitext(name)[0]: reader(io.BytesIO(archive.read(name))) for name in archive.namelist()}
+    if export_format == "csv_zip":
+        sheets['Сводка'] = sheets['Сводка'].set_index('Период')
+    return sheets
+
+
+@pytest.mark.parametrize("export_format", list(EXPORT_FORMATS))
+def test_round_trip(dfs_dict, export_format, tmp_path):
+    path = export_to_tempfile(dfs_dict, export_format, directory=str(tmp_path))
+    assert os.path.basename(path).startswith(EXPORT_FILE_PREFIX)
+    assert path.endswith(EXPORT_FORMATS[export_format]["extension"])
+    sheets = _read_back(path, export_format)
+    assert list(sheets) == ['Сводка', 'Данные_статьи']
+    pd.testing.assert_frame_equal(sheets['Сводка'], dfs_dict['Сводка'])
+    pd.testing.assert_frame_equal(sheets['Данные_статьи'], dfs_dict['Данные_статьи'])
+
+
+def test_progress_exception_removes_file(dfs_dict, tmp_path):
+    def progress(fraction, message):
+        raise RuntimeError("отмена")
+
+    with pytest.raises(RuntimeError):
+        export_to_tempfile(dfs_dict, "csv_zip", directory=str(tmp_path), progress=progress)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_read_and_remove(dfs_dict, tmp_path):
+    path = export_to_tempfile(dfs_dict, "csv_zip", directory=str(tmp_path))
+    with open(path, 'rb') as export_file:
+        assert read_export_file(path) == export_file.read()
+    remove_export_file(path)
+    assert not os.path.exists(path)
+    remove_export_file(path)  # повторное удаление и пустой путь - не ошибка
+    remove_export_file(None)
+
+
+def test_sweep_removes_only_expired_export_files(tmp_path):
+    old_export, new_export, other = (tmp_path / f"{EXPORT_FILE_PREFIX}old.zip", tmp_path / f"{EXPORT_FILE_PREFIX}new.zip",
+                                     tmp_path / "other.zip")
+    for path in (old_export, new_export, other):
+        path.write_bytes(b"data")
+    two_hours_ago = time.time() - 7200
+    for path in (old_export, other):
+        os.utime(path, (two_hours_ago, two_hours_ago))
+    assert sweep_export_files(str(tmp_path), ttl_seconds=3600) == 1
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted([new_export.name, other.name])
+    assert sweep_export_files(str(tmp_path), ttl_seconds=0) == 1
+    assert [path.name for path in tmp_path.iterdir()] == [other.name]
+
+
+def test_export_sweeps_expired_files(dfs_dict, tmp_path):
+    stale = tmp_path / f"{EXPORT_FILE_PREFIX}stale.xlsx"
+    stale.write_bytes(b"data")
+    os.utime(stale, (0, 0))
+    path = export_to_tempfile(dfs_dict, "parquet_zip", directory=str(tmp_path))
+    assert not stale.exists() and os.path.exists(path)
@@ -0,0 +1,71 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from nwc_analysis import calculate_period_totals
+from nwc_dtypes import compact_articles, total_error_bound
+from nwc_hierarchy import CONSOLIDATED_ATTR, GROUP_LABEL, RollupTree
+
+COLUMNS = ['Q1 2024 Факт', 'Q2 2024 Прогноз']
+
+
+@pytest.fixture
+def group_data():
+    return pd.DataFrame({
+        'Сегмент': ['А', 'А', 'А', 'А', 'Б', 'Б'],
+        'Юрлицо': ['ЮЛ 1', 'ЮЛ 1', 'ЮЛ 2', 'ЮЛ 2', 'ЮЛ 3', 'ЮЛ 3'],
+        'Статья': ['ДС', 'КЗ', 'ДС', 'КЗ', 'ДС', 'КЗ'],
+        'Тип': ['ОА', 'КО', 'ОА', 'КО', 'ОА', 'КО'],
+        'Q1 2024 Факт': [100.0, 40.0, 50.0, np.nan, 30.0, 10.0],
+        'Q2 2024 Прогноз': [110.0, 45.0, np.nan, np.nan, 35.0, 12.0],
+    })
+
+
+def test_nodes_and_children(group_data):
+    tree = RollupTree(group_data, COLUMNS)
+    assert tree.nodes() == [(), ('А',), ('А', 'ЮЛ 1'), ('А', 'ЮЛ 2'), ('Б',), ('Б', 'ЮЛ 3')]
+    assert tree.children(('А',)) == [('А', 'ЮЛ 1'), ('А', 'ЮЛ 2')]
+
+
+@pytest.mark.parametrize("node", [(), ('А',), ('А', 'ЮЛ 2'), ('Б', 'ЮЛ 3')])
+def test_node_totals_match_direct_calculation(group_data, node):
+    tree = RollupTree(group_data, COLUMNS)
+    rows = np.ones(len(group_data), dtype=bool)
+    for level, value in zip(['Сегмент', 'Юрлицо'], node):
+        rows &= (group_data[level] == value).to_numpy()
+    expected = calculate_period_totals(group_data.loc[rows], COLUMNS)
+    actual = tree.period_totals(node)
+    for col_name in COLUMNS:
+        for name, value in expected[col_name].items():
+            assert actual[col_name][name] == pytest.approx(value)
+
+
+def test_consolidated_articles(group_data):
+    tree = RollupTree(group_data, COLUMNS)
+    df_group = tree.articles()
+    assert list(df_group.columns) == ['Статья', 'Тип'] + COLUMNS
+    df_group = df_group.set_index('Статья')
+    assert df_group.loc['ДС', 'Q1 2024 Факт'] == 180
+    # Пропуск остается пропуском, только если значения нет ни у одного юрлица
+    assert df_group.loc['КЗ', 'Q2 2024 Прогноз'] == 57
+    assert np.isnan(tree.articles(('А', 'ЮЛ 2')).set_index('Статья').loc['КЗ', 'Q2 2024 Прогноз'])
+    assert len(tree.articles(('А', 'ЮЛ 1'))) == 2
+
+
+def test_totals_frame(group_data):
+    df_totals = RollupTree(group_data, COLUMNS).totals_frame('Q1 2024 Факт')
+    assert df_totals['Узел'].tolist()[:2] == [GROUP_LABEL, 'А']
+    group_row = df_totals.iloc[0]
+    assert (group_row['Итого ОА'], group_row['Итого КО'], group_row['ЧОК']) == (180, 50, 130)
+    with pytest.raises(ValueError):
+        RollupTree(group_data, ['Q1 2024 Факт']).totals_frame('Q2 2024 Прогноз')
+
+
+@pytest.mark.parametrize("precision", ["float32", "int_thousands"])
+def test_consolidated_articles_double_error_bound(group_data, precision):
+    tree = RollupTree(compact_articles(group_data, precision), COLUMNS)
+    df_group, df_leaf = tree.articles(), tree.articles(('Б', 'ЮЛ 3'))
+    assert df_group.attrs[CONSOLIDATED_ATTR] and CONSOLIDATED_ATTR not in df_leaf.attrs
+    unmarked = df_group.copy()
+    unmarked.attrs = {key: value for key, value in df_group.attrs.items() if key != CONSOLIDATED_ATTR}
+    np.testing.assert_allclose(total_error_bound(df_group, COLUMNS), 2 * total_error_bound(unmarked, COLUMNS))
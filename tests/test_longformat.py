@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from nwc_longformat import PERIOD_KINDS_ATTR, is_long_format, peek_columns, read_long_table
+
+LONG_CSV = """Юрлицо;Статья;Тип;Период;Сценарий;Значение
+ЮЛ 1;ДС;ОА;2024-01;Факт;100
+ЮЛ 1;ДС;ОА;2024-01;Факт;50
+ЮЛ 1;КЗ;КО;2024-01;Факт;80
+ЮЛ 1;ДС;ОА;2024-02;Прогноз;120
+ЮЛ 2;ДС;ОА;2024-01;fact;10
+ЮЛ 2;КЗ;КО;2024-02;plan;
+ЮЛ 2;КЗ;КО;2024-02;Бюджет;999
+""".encode("utf-8")
+
+
+def test_columns_and_detection():
+    columns = peek_columns(LONG_CSV, "выгрузка.csv")
+    assert columns == ['Юрлицо', 'Статья', 'Тип', 'Период', 'Сценарий', 'Значение']
+    assert is_long_format(columns)
+    assert not is_long_format(['Статья', 'Тип', 'Q1 2024 Факт'])
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 3, 1000])
+def test_pivot_to_wide(chunk_rows):
+    df = read_long_table(LONG_CSV, "выгрузка.csv", chunk_rows=chunk_rows)
+    assert list(df.columns) == ['Юрлицо', 'Статья', 'Тип', '2024-01 Факт', '2024-02 Прогноз']
+    df = df.set_index(['Юрлицо', 'Статья'])
+    # Повторяющиеся ключи суммируются, пустое значение и отсутствующая ячейка - пропуск
+    assert df.loc[('ЮЛ 1', 'ДС'), '2024-01 Факт'] == 150
+    assert df.loc[('ЮЛ 1', 'ДС'), '2024-02 Прогноз'] == 120
+    assert df.loc[('ЮЛ 2', 'ДС'), '2024-01 Факт'] == 10
+    assert np.isnan(df.loc[('ЮЛ 2', 'КЗ'), '2024-02 Прогноз'])
+    assert np.isnan(df.loc[('ЮЛ 1', 'КЗ'), '2024-02 Прогноз'])
+    assert df.attrs[PERIOD_KINDS_ATTR] == {'2024-01 Факт': 'fact', '2024-02 Прогноз': 'forecast'}
+    assert df.attrs['unknown_scenarios'] == ['Бюджет']
+
+
+def test_parquet_matches_csv(tmp_path):
+    pytest.importorskip("pyarrow")
+    df_long = pd.read_csv(pd.io.common.BytesIO(LONG_CSV), sep=";", dtype={'Период': str})
+    parquet_path = tmp_path / "выгрузка.parquet"
+    df_long.to_parquet(parquet_path, index=False)
+    from_parquet = read_long_table(str(parquet_path), parquet_path.name, chunk_rows=2)
+    from_csv = read_long_table(LONG_CSV, "выгрузка.csv")
+    pd.testing.assert_frame_equal(from_parquet, from_csv)
@@ -0,0 +1,79 @@
+# Инкрементальный модулятор против полного пересчета по всей таблице
+import numpy as np
+import pandas as pd
+import pytest
+
+import baseline_reference as reference
+from nwc_analysis import calculate_allowed_article_error_range, calculate_period_totals
+from nwc_demo import get_demo_data
+from nwc_modulator import ERROR_COLUMN, ErrorModulator
+
+FORECAST = 'Q1 2025 Прогноз'
+
+
+def random_articles(rng, n_articles=40):
+    forecast = rng.normal(500, 300, n_articles).round(1)
+    forecast[rng.random(n_articles) < 0.1] = np.nan
+    forecast[rng.random(n_articles) < 0.1] = 0.0
+    return pd.DataFrame({'Статья': [f"Статья {i}" for i in range(n_articles)],
+                         'Тип': rng.choice(['ОА', 'КО', 'Прочее'], n_articles, p=[0.5, 0.45, 0.05]), FORECAST: forecast})
+
+
+def assert_matches_full_recompute(modulator, df_articles, forecast_chok):
+    df_editor = pd.DataFrame({'Тип': df_articles['Тип'], 'Прогноз': df_articles[FORECAST], ERROR_COLUMN: modulator.errors})
+    modified, deviation, deviation_percentage = reference.modulate_errors(df_editor, forecast_chok)
+    np.testing.assert_allclose(modulator.modified, modified, rtol=1e-12, equal_nan=True)
+    np.testing.assert_allclose(modulator.chok_deviation, deviation, rtol=1e-9, atol=1e-6, equal_nan=True)
+    np.testing.assert_allclose(modulator.deviation_percentage(forecast_chok), deviation_percentage, rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_random_edits_match_full_recompute(seed):
+    rng = np.random.default_rng(seed)
+    df_articles = random_articles(rng)
+    forecast_chok = calculate_period_totals(df_articles, [FORECAST])[FORECAST]['ЧОК']
+    modulator = ErrorModulator(df_articles['Статья'], df_articles['Тип'], df_articles[FORECAST])
+    n_articles = len(df_articles)
+    edited_rows = {}
+    for _ in range(200):
+        action = rng.integers(5)
+        if action == 0:
+            # Правка ячеек редактора (накопленные правки, None - очищенная ячейка)
+            row = int(rng.integers(n_articles))
+            edited_rows[row] = {ERROR_COLUMN: None if rng.random() < 0.1 else float(rng.uniform(-100, 100))}
+            modulator.apply_editor_edits(edited_rows)
+        elif action == 1 and edited_rows:
+            # Отмена правки: строка возвращается к исходному значению редактора
+            edited_rows.pop(int(rng.choice(list(edited_rows))))
+            modulator.apply_editor_edits(edited_rows)
+        elif action == 2:
+            mask = modulator.article_mask(type_filter=rng.choice(['', 'ОА', 'КО']) or None)
+            modulator.bulk_set(float(rng.uniform(-20, 20)), mask)
+            modulator.commit_baseline()
+            edited_rows = {}
+        elif action == 3:
+            rows = rng.integers(n_articles, size=5)
+            modulator.set_errors(rows, rng.uniform(-50, 50, size=5))
+            modulator.commit_baseline()
+            edited_rows = {}
+        else:
+            modulator.set_errors([int(rng.integers(n_articles))], float(rng.uniform(-5, 5)))
+            modulator.commit_baseline()
+            edited_rows = {}
+        assert_matches_full_recompute(modulator, df_articles, forecast_chok)
+
+
+@pytest.mark.parametrize("limit", [1, 5])
+def test_error_at_allowed_range_reaches_limit(limit):
+    # Ошибка одной статьи, равная ее допуску из Раздела 4, дает отклонение ЧОК ровно на лимит
+    df_articles = get_demo_data()
+    forecast_chok = calculate_period_totals(df_articles, [FORECAST])[FORECAST]['ЧОК']
+    df_allowed, max_abs_chok_deviation = calculate_allowed_article_error_range(df_articles, FORECAST, forecast_chok, limit)
+    allowed = df_allowed.iloc[:, 1].to_numpy()
+    modulator = ErrorModulator(df_articles['Статья'], df_articles['Тип'], df_articles[FORECAST])
+    for row in range(len(df_articles)):
+        modulator.set_errors([row], allowed[row])
+        assert abs(modulator.chok_deviation) == pytest.approx(max_abs_chok_deviation)
+        assert abs(modulator.deviation_percentage(forecast_chok)) == pytest.approx(limit)
+        modulator.set_errors([row], 0.0)
+        assert modulator.chok_deviation == pytest.approx(0.0, abs=1e-9)
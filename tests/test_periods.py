@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+
+from nwc_periods import PeriodIndex, parse_period
+
+
+def month(year, number):
+    return year * 12 + number - 1
+
+
+def test_parse_period_formats():
+    assert parse_period('Q1 2025 Прогноз')[1:5] == ('forecast', 'Q', 2025, 1)
+    assert parse_period('1 кв. 2025 Факт')[1:5] == ('fact', 'Q', 2025, 1)
+    assert parse_period('Дек 2024 Факт')[1:5] == ('fact', 'M', 2024, 12)
+    assert parse_period('2024-11 Факт')[1:5] == ('fact', 'M', 2024, 11)
+    assert parse_period('03.2024 Факт')[1:5] == ('fact', 'M', 2024, 3)
+    assert parse_period('2024 Факт')[1:4] == ('fact', 'Y', 2024)
+    assert parse_period('Итог').freq is None
+
+
+def test_chronological_order():
+    # Лексически "Q1 2025" идет раньше "Q2 2024"; при равном последнем месяце месяц идет раньше квартала и года
+    index = PeriodIndex(['Q1 2025 Прогноз', 'Q4 2024 Факт', 'Дек 2024 Факт', 'Итог', '2024 Факт', 'Q2 2024 Факт'])
+    assert index.facts == ['Q2 2024 Факт', 'Дек 2024 Факт', 'Q4 2024 Факт', '2024 Факт']
+    assert index.forecasts == ['Q1 2025 Прогноз']
+    assert index.unparsed == ['Итог']
+    assert index.ordered(['Итог', 'Q1 2025 Прогноз', 'Q2 2024 Факт', 'Нет такого']) == ['Q2 2024 Факт', 'Q1 2025 Прогноз', 'Итог', 'Нет такого']
+
+
+def test_fact_ranges():
+    index = PeriodIndex(['Янв 2024 Факт', 'Фев 2024 Факт', 'Мар 2024 Факт', 'Апр 2024 Факт', 'Май 2024 Прогноз'])
+    assert index.facts_between(month(2024, 2), month(2024, 3)) == ['Фев 2024 Факт', 'Мар 2024 Факт']
+    assert index.facts_between(end_month=month(2024, 1)) == ['Янв 2024 Факт']
+    assert index.last_facts(2) == ['Мар 2024 Факт', 'Апр 2024 Факт']
+
+
+def test_matching_facts_same_period_and_frequency():
+    index = PeriodIndex(['Q1 2024 Факт', 'Мар 2024 Факт', 'Q1 2024 Прогноз', 'Мар 2024 Прогноз', 'Q2 2024 Прогноз'])
+    assert index.matching_facts() == {'Мар 2024 Прогноз': 'Мар 2024 Факт', 'Q1 2024 Прогноз': 'Q1 2024 Факт', 'Q2 2024 Прогноз': None}
+    codes = index.period_codes(['Q1 2024 Факт', 'Q1 2024 Прогноз', 'Мар 2024 Факт'])
+    assert codes[0] == codes[1] != codes[2]
+
+
+def test_period_kinds_override_column_names():
+    index = PeriodIndex(['2024-01', '2024-02'], period_kinds={'2024-01': 'fact', '2024-02': 'forecast'})
+    assert index.facts == ['2024-01'] and index.forecasts == ['2024-02']
+    assert isinstance(index.period_codes(index.facts), np.ndarray)
+
+
+def test_from_frame_skips_key_and_hierarchy_columns():
+    df = pd.DataFrame({'Сегмент': ['А'], 'Юрлицо': ['ЮЛ 1'], 'Статья': ['ДС'], 'Тип': ['ОА'],
+                       'Q1 2024 Факт': [1.0], 'Q2 2024 Прогноз': [2.0]})
+    index = PeriodIndex.from_frame(df)
+    assert [period.column for period in index.periods] == ['Q1 2024 Факт', 'Q2 2024 Прогноз']
+    assert index.unparsed == []
@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from nwc_analysis import calculate_allowed_article_error_range, calculate_period_totals
+from nwc_demo import get_demo_data
+from nwc_sensitivity import ALLOCATION_METHODS, SENSITIVITY_LIMITS, build_sensitivity_surface, materiality_weights, tornado_frame
+
+FORECAST = 'Q1 2025 Прогноз'
+FACTS = ['Q3 2024 Факт', 'Q4 2024 Факт']
+
+
+def demo_weights(df_articles, method="vs_CHOK"):
+    return materiality_weights(df_articles, calculate_period_totals(df_articles, FACTS), FACTS, method)
+
+
+@pytest.fixture
+def df_articles():
+    df = get_demo_data().copy()
+    df.loc[2, FORECAST] = 0.0  # статья с нулевым прогнозом: допуск не ограничен
+    return df
+
+
+@pytest.mark.parametrize("limit", [1, 5, 25])
+def test_surface_matches_single_article_range(df_articles, limit):
+    surface = build_sensitivity_surface(df_articles, [FORECAST])
+    chok = calculate_period_totals(df_articles, [FORECAST])[FORECAST]['ЧОК']
+    expected, expected_allowed = calculate_allowed_article_error_range(df_articles, FORECAST, chok, limit)
+    actual, actual_allowed = surface.allowed_errors_frame(FORECAST, limit)
+    pd.testing.assert_frame_equal(actual, expected)
+    assert actual_allowed == pytest.approx(expected_allowed)
+
+
+def test_limit_outside_scale(df_articles):
+    surface = build_sensitivity_surface(df_articles, [FORECAST])
+    with pytest.raises(KeyError):
+        surface.allowed_errors(FORECAST, SENSITIVITY_LIMITS[-1] + 1)
+
+
+@pytest.mark.parametrize("method", list(ALLOCATION_METHODS))
+def test_joint_budget_adds_up_to_allowed_deviation(df_articles, method):
+    surface = build_sensitivity_surface(df_articles, [FORECAST])
+    _, allowed = surface.allowed_errors(FORECAST, 5)
+    joint = surface.joint_errors(FORECAST, 5, method, weights=demo_weights(df_articles))
+    forecast_values = df_articles[FORECAST].to_numpy()
+    finite = np.isfinite(joint)
+    assert np.array_equal(finite, forecast_values != 0)
+    assert np.sum(np.abs(forecast_values[finite]) * joint[finite] / 100) == pytest.approx(allowed)
+
+
+@pytest.mark.parametrize("method", ["vs_CHOK", "within_OA_CO"])
+def test_materiality_allocation_follows_fact_weights(df_articles, method):
+    surface = build_sensitivity_surface(df_articles, [FORECAST])
+    _, allowed = surface.allowed_errors(FORECAST, 5)
+    weights = demo_weights(df_articles, method)
+    df_budget = surface.error_budget_frame(FORECAST, 5, weights)
+    budget = df_budget['Совместно, по существенности (тыс. руб.)'].to_numpy()
+    nonzero = df_articles[FORECAST].to_numpy() != 0
+    assert budget[~nonzero].sum() == 0
+    np.testing.assert_allclose(budget[nonzero], allowed * weights[nonzero] / weights[nonzero].sum())
+    with pytest.raises(ValueError):
+        surface.joint_errors(FORECAST, 5, "materiality")
+
+
+def test_budget_without_weights_has_no_materiality_columns(df_articles):
+    df_budget = build_sensitivity_surface(df_articles, [FORECAST]).error_budget_frame(FORECAST, 5)
+    assert not any('существенности' in col for col in df_budget.columns)
+    assert 'Совместно, по доле прогноза (+/- %)' in df_budget.columns
+
+
+def test_unknown_method(df_articles):
+    with pytest.raises(ValueError):
+        build_sensitivity_surface(df_articles, [FORECAST]).joint_errors(FORECAST, 5, "другой")
+
+
+def test_tornado_shows_most_sensitive_articles(df_articles):
+    df_budget = build_sensitivity_surface(df_articles, [FORECAST]).error_budget_frame(FORECAST, 5)
+    df_tornado = tornado_frame(df_budget, max_articles=3)
+    single = df_tornado[df_tornado['Допуск'] == "Одна статья"]
+    assert single['Статья'].tolist() == df_budget.nsmallest(3, 'Одна статья (+/- %)')['Статья'].astype(str).tolist()
+    assert (single['От (%)'] == -single['До (%)']).all()
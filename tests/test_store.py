@@ -0,0 +1,69 @@
+import gc
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from nwc_demo import get_demo_data
+from nwc_store import DatasetStore
+
+
+class DictCache:
+    def __init__(self):
+        self.frames = {}
+
+    def get(self, key):
+        return self.frames.get(key)
+
+    def put(self, key, df):
+        self.frames[key] = df
+        return True
+
+
+@pytest.fixture
+def store(tmp_path):
+    return DatasetStore(budget_mb=64, store_dir=tmp_path)
+
+
+def test_add_and_frame(store):
+    df = get_demo_data()
+    store.add("demo", df)
+    assert store.frame("demo") is df
+    assert store.add("demo", df.head(1)) == "demo"  # прежняя копия остается
+    assert len(store.frame("demo")) == len(df)
+    with pytest.raises(KeyError):
+        store.frame("нет")
+
+
+def test_evicted_frame_is_reloaded_from_file(tmp_path):
+    store = DatasetStore(budget_mb=0, store_dir=tmp_path)
+    df = get_demo_data()
+    handle = store.open("demo", build=lambda: df)
+    store.add("other", df.head(3))  # бюджет 0: DataFrame набора со ссылкой вытесняется, файл остается
+    assert store.stats()['evictions'] >= 1
+    pd.testing.assert_frame_equal(handle.frame(), df)
+    assert store.misses >= 1
+    handle.release()
+
+
+def test_unreferenced_dataset_is_removed(tmp_path):
+    store = DatasetStore(budget_mb=0, store_dir=tmp_path)
+    handle = store.open("demo", build=get_demo_data)
+    path = store._path("demo")
+    store.add("other", get_demo_data().head(3))
+    assert path.exists()
+    del handle
+    gc.collect()
+    assert not store.contains("demo") and not path.exists()
+
+
+def test_parsed_cache_interface(store):
+    parsed_cache = DictCache()
+    store.parsed_cache = parsed_cache
+    df = get_demo_data()
+    assert store.get("demo") is None
+    store.put("demo", df)
+    assert parsed_cache.get("demo") is df and store.contains("demo")
+    other = DatasetStore(budget_mb=64, store_dir=store.store_dir.parent, parsed_cache=parsed_cache)
+    assert other.get("demo") is df and other.contains("demo")
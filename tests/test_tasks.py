@@ -0,0 +1,72 @@
+# Фоновые задачи: завершение, ошибка и отмена (во время выполнения и в очереди)
+import threading
+import time
+
+import pytest
+
+from nwc_tasks import TaskManager
+
+
+def wait_done(task, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not task.done:
+        assert time.monotonic() < deadline, f"задача {task.name} не завершилась: {task.status}"
+        time.sleep(0.005)
+    return task
+
+
+@pytest.fixture
+def manager():
+    manager = TaskManager(1)
+    yield manager
+    manager._pool.shutdown(wait=True, cancel_futures=True)
+
+
+def test_done(manager):
+    def work(task, a, b=0):
+        task.report(0.5, "половина")
+        return a + b
+
+    task = wait_done(manager.submit("sum", work, (1,), {'b': 2}))
+    assert (task.status, task.result, task.error) == ("done", 3, None)
+    assert task.progress == 1.0 and task.message == "половина"
+    assert task.elapsed() >= 0 and task.finished_at >= task.started_at
+
+
+def test_error(manager):
+    def work(task):
+        raise ValueError("неверные данные")
+
+    task = wait_done(manager.submit("fail", work))
+    assert (task.status, task.result, task.error) == ("error", None, "ValueError: неверные данные")
+
+
+def test_cancel_while_running(manager):
+    started = threading.Event()
+
+    def work(task):
+        started.set()
+        while True:
+            task.report(message="работаю")
+            time.sleep(0.001)
+
+    task = manager.submit("loop", work)
+    assert started.wait(5)
+    assert task.status == "running"
+    task.cancel()
+    wait_done(task)
+    assert task.status == "cancelled" and task.cancel_requested and task.result is None
+
+
+def test_cancel_before_start(manager):
+    release, ran = threading.Event(), []
+    blocker = manager.submit("blocker", lambda task: release.wait(5))
+    queued = manager.submit("queued", lambda task: ran.append(True))
+    assert queued.status == "queued"
+    assert manager.stats()['queued'] >= 1
+    queued.cancel()
+    assert queued.status == "cancelled" and queued.done and queued.started_at is None
+    release.set()
+    wait_done(blocker)
+    assert blocker.status == "done"
+    assert ran == [] and manager.stats() == {'workers': 1, 'running': 0, 'queued': 0}